@@ -1,4 +1,4 @@
-from hypernets.conf import configure, Configurable, Bool, Float, Int, Enum, List
+from hypernets.conf import configure, Configurable, Bool, Float, Int, Enum, List, String
 from hypernets.tabular.sklearn_ex import DatetimeEncoder
 
 
@@ -24,6 +24,12 @@ class HyperGBMCfg(Configurable):
              help='Feature encoding mode, simple (SafeOrdinalEncoder) or '
                   'complex (search in SafeOrdinalEncoder and SafeOneHot+Optional(SVD)).'
              )
+    category_pipeline_encoder = \
+        Enum(['ordinal', 'hash'], default_value='ordinal',
+             config=True,
+             help='Label encoder of the simple category pipeline, ordinal (SafeOrdinalEncoder) or '
+                  'hash (HashOrdinalEncoder, vectorized with hash tables, faster for high-cardinality features).'
+             )
     category_pipeline_auto_detect = \
         Bool(False,
              config=True,
@@ -59,3 +65,148 @@ class HyperGBMCfg(Configurable):
         Int(3,
             config=True,
             help='')
+
+    # cross validation
+    cv_fold_n_jobs = \
+        Int(1,
+            config=True,
+            help='number of folds to fit concurrently in cross validation, 1 to fit folds one by one, '
+                 '-1 to use all cpu cores.'
+            )
+    cv_fold_backend = \
+        Enum(['threads', 'processes'], default_value='threads',
+             config=True,
+             help='joblib backend preference to fit folds concurrently, used only if cv_fold_n_jobs is not 1.'
+             )
+    cv_predict_n_jobs = \
+        Int(1,
+            config=True,
+            help='number of fold models to run prediction concurrently (with threads) if the estimator is '
+                 'fitted with cross validation, -1 to use all cpu cores.'
+            )
+
+    # native dataset cache
+    dataset_cache_enabled = \
+        Bool(False,
+             config=True,
+             help='cache and reuse the native datasets (catboost Pool, xgboost DMatrix, lightgbm Dataset) '
+                  'of estimators across folds and trials or not.'
+             )
+    dataset_cache_memory_limit = \
+        Int(2048, min=0,
+            config=True,
+            help='memory limit (MB) of the native dataset cache, '
+                 'estimated by the memory usage of the source data.'
+            )
+
+    # data pipeline prefix cache
+    pipeline_cache_enabled = \
+        Bool(False,
+             config=True,
+             help='cache the fitted data pipeline steps with their outputs in memory, so trials resume fitting '
+                  'the data pipeline from the longest cached prefix of steps or not.'
+             )
+    pipeline_cache_memory_limit = \
+        Int(2048, min=0,
+            config=True,
+            help='memory limit (MB) of the data pipeline cache, estimated by the memory usage of the step outputs.'
+            )
+
+    # memory-mapped store of transformed data
+    data_mmap_cache_enabled = \
+        Bool(False,
+             config=True,
+             help='store the transformed training data of fit_transform_data as memory-mapped column blocks '
+                  '(npy files) on local disk and reload them with mmap, instead of the default data cache, or not.'
+             )
+    data_mmap_cache_dir = \
+        String(None, allow_none=True,
+               config=True,
+               help='local directory of the memory-mapped store of transformed data, '
+                    'use the sub directory "hypergbm_mmap" of the tabular cache_dir if None.'
+               )
+
+    # data ingestion
+    arrow_ingestion_enabled = \
+        Bool(False,
+             config=True,
+             help='load parquet train/eval/test data of make_experiment through Arrow, with string columns as '
+                  'pandas Categorical from the dictionary encoding instead of python objects, or not.'
+             )
+
+    # dtype downcasting
+    dtype_downcast_enabled = \
+        Bool(False,
+             config=True,
+             help='append a stage to the data pipeline which downcasts float columns to float32 and integer '
+                  'columns to the smallest integer type, to save the memory of the data to fit estimators, or not.'
+             )
+    dtype_downcast_tolerance = \
+        Float(1e-6,
+              config=True,
+              help='max relative error of float32 on the training data to downcast a float column, '
+                   'columns with more precision loss are kept as they are.'
+              )
+
+    # HistGradientBoosting
+    histgb_stage_iterations = \
+        Int(10, min=1,
+            config=True,
+            help='number of iterations of each stage to fit HistGradientBoosting estimators with warm start when '
+                 'fit callbacks are used (e.g. trial discrimination), the callbacks are called after each stage.'
+            )
+
+    # trial skipping
+    skip_file_check_iterations = \
+        Int(0, min=0,
+            config=True,
+            help='check the `skip_if_file` of the fitting trial once every such iterations of the estimator, '
+                 '0 to check it by `skip_file_check_interval` only.'
+            )
+    skip_file_check_interval = \
+        Float(1.0, min=0.0,
+              config=True,
+              help='seconds, check the `skip_if_file` of the fitting trial at least so long after the last check, '
+                   'the file is checked in every iteration if both of this and `skip_file_check_iterations` are 0.'
+              )
+
+    # trial discrimination
+    discriminator_check_every = \
+        Int(1, min=1,
+            config=True,
+            help='call the discriminator once every such iterations of the estimator to check whether the '
+                 'fitting trial is promising, a larger value saves the checks of long trials but prunes later.'
+            )
+    cv_fold_discrimination_enabled = \
+        Bool(False,
+             config=True,
+             help='abandon the trial fitted with cross validation once the mean score of the folds fitted so far is '
+                  'not better than the percentile (of the discriminator) of previous trials, or not. '
+                  'Used only if the discriminator is set and the folds are fitted one by one.'
+             )
+
+    # successive halving
+    successive_halving_enabled = \
+        Bool(False,
+             config=True,
+             help='search with `SuccessiveHalvingDispatcher` by default, which fits many space samples with a fraction '
+                  'of rows and boosting rounds first and promotes the top ones to more rows and rounds, or not.'
+             )
+    successive_halving_eta = \
+        Int(3, min=2,
+            config=True,
+            help='reduction factor of successive halving, the top 1/eta of samples are promoted to the next rung '
+                 'with eta times rows and boosting rounds.'
+            )
+    successive_halving_rungs = \
+        Int(3, min=1,
+            config=True,
+            help='number of rungs of successive halving including the last one with the whole data, '
+                 'the first rung fits with 1/eta**(rungs-1) of rows and boosting rounds.'
+            )
+    successive_halving_eval_size = \
+        Float(0.2,
+              config=True,
+              help='fraction of the train set to hold out to score the partial rungs of successive halving, '
+                   'if no eval set is given or the search runs with cross validation.'
+              )
@@ -0,0 +1,216 @@
+# -*- coding:utf-8 -*-
+"""
+Cache of constructed native datasets (catboost Pool, xgboost DMatrix, lightgbm Dataset) to reuse them across folds
+and trials.
+"""
+import contextlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from hypernets.tabular import get_tool_box
+from hypernets.utils import logging
+from .cfg import HyperGBMCfg as cfg
+
+logger = logging.get_logger(__name__)
+
+
+class DatasetCache:
+    """
+    LRU cache of native datasets with a memory limit.
+
+    The memory of a cached dataset is estimated by the memory usage of its source data, which is the upper bound of
+    the quantized (binned) dataset in most cases.
+    """
+
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.hits = 0
+        self.misses = 0
+
+        self._items = OrderedDict()  # key -> (dataset, nbytes)
+        self._keys = {}  # id(dataset) -> key
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(kind, data=None, params=None):
+        """
+        Make the cache key of the dataset built from `data` with `params`.
+
+        :param kind: str, kind of the dataset, eg: 'catboost_pool'.
+        :param data: list or tuple of the source data, eg: X, y, sample_weight.
+        :param params: dict, parameters to construct (bin) the dataset.
+        """
+        hasher = get_tool_box(pd.DataFrame).data_hasher()
+        return hasher([kind, list(data) if data else [], params if params else {}])
+
+    def key_of(self, dataset):
+        """
+        Get the cache key of a cached dataset, or None if it was not cached.
+        """
+        with self._lock:
+            return self._keys.get(id(dataset))
+
+    def get(self, key, creator, nbytes):
+        """
+        Get the cached dataset by key, or create and cache it with `creator` if not found.
+        """
+        with self._lock:
+            if key in self._items.keys():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+
+        dataset = creator()
+
+        with self._lock:
+            self.misses += 1
+            if nbytes > self.memory_limit or key in self._items.keys():
+                return dataset
+
+            self._items[key] = (dataset, nbytes)
+            self._keys[id(dataset)] = key
+            self._size += nbytes
+            while self._size > self.memory_limit:
+                _, (evicted, evicted_nbytes) = self._items.popitem(last=False)
+                self._keys.pop(id(evicted), None)
+                self._size -= evicted_nbytes
+
+        return dataset
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._keys.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._items)
+
+
+_cache = None
+
+
+def get_dataset_cache():
+    """
+    Get the global native dataset cache, or None if `HyperGBMCfg.dataset_cache_enabled` is False.
+    """
+    global _cache
+
+    if not cfg.dataset_cache_enabled:
+        return None
+
+    memory_limit = cfg.dataset_cache_memory_limit * 1024 * 1024
+    if _cache is None:
+        _cache = DatasetCache(memory_limit)
+    elif _cache.memory_limit != memory_limit:
+        logger.info(f'reset dataset cache with memory limit {cfg.dataset_cache_memory_limit}MB')
+        _cache = DatasetCache(memory_limit)
+
+    return _cache
+
+
+def cached_dataset(kind, creator, data, params=None):
+    """
+    Create the native dataset with `creator`, reuse the cached one if cache is enabled and the dataset was created
+    from the same data and params.
+    """
+    cache = get_dataset_cache()
+    if cache is None:
+        return creator()
+
+    key = cache.make_key(kind, data, params)
+    nbytes = get_tool_box(pd.DataFrame).memory_usage(*data)
+
+    return cache.get(key, creator, nbytes)
+
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = {}  # (module name, name) -> [original class, number of the active scopes]
+
+
+class _DatasetClassMeta(type):
+    """
+    Metaclass of the stand-in of a native dataset class in the module of a library. The stand-in creates datasets
+    with the creator set by `creating_datasets` in the current thread, or with the original class otherwise, and
+    checks instances against the original class.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        creator = _local.__dict__.get('creators', {}).get(cls.original)
+        if creator is None:
+            return cls.original(*args, **kwargs)
+        return creator(cls.original, *args, **kwargs)
+
+    def __instancecheck__(cls, instance):
+        return isinstance(instance, cls.original)
+
+    def __subclasscheck__(cls, subclass):
+        return issubclass(subclass, cls.original)
+
+
+def _install_stand_in(module, name):
+    with _install_lock:
+        key = (module.__name__, name)
+        if key in _installed:
+            _installed[key][1] += 1
+            return _installed[key][0]
+
+        dataset_class = getattr(module, name)
+        stand_in = _DatasetClassMeta(name, (), dict(original=dataset_class, __doc__=dataset_class.__doc__,
+                                                    __module__=dataset_class.__module__))
+        setattr(module, name, stand_in)
+        _installed[key] = [dataset_class, 1]
+        return dataset_class
+
+
+def _uninstall_stand_in(module, name):
+    with _install_lock:
+        key = (module.__name__, name)
+        _installed[key][1] -= 1
+        if _installed[key][1] == 0:
+            dataset_class, _ = _installed.pop(key)
+            setattr(module, name, dataset_class)
+
+
+@contextlib.contextmanager
+def creating_datasets(module, name, creator):
+    """
+    Create the datasets of the class `name` referenced by `module` with `creator` in the current thread within the
+    context, eg: `lightgbm.sklearn.Dataset` which is constructed inline by the `fit` of the sklearn estimators.
+
+    The class in the module is replaced by a stand-in only while any of the contexts is active, the stand-in creates
+    datasets with the original class in the threads out of the contexts.
+
+    :param module: module which references the native dataset class.
+    :param name: str, name of the dataset class in the module.
+    :param creator: callable, called as `creator(dataset_class, *args, **kwargs)` with the arguments to construct
+        the dataset.
+    """
+    dataset_class = _install_stand_in(module, name)
+    creators = _local.__dict__.setdefault('creators', {})
+    previous = creators.get(dataset_class)
+    creators[dataset_class] = creator
+    try:
+        yield
+    finally:
+        if previous is None:
+            creators.pop(dataset_class, None)
+        else:
+            creators[dataset_class] = previous
+        _uninstall_stand_in(module, name)
+
+
+@contextlib.contextmanager
+def no_scope():
+    """
+    Context which does nothing, `contextlib.nullcontext` is not available before python 3.7.
+    """
+    yield
@@ -3,10 +3,12 @@
 
 """
 from distutils.version import LooseVersion
+from functools import partial
 
 import catboost
 import lightgbm
 import numpy as np
+import pandas as pd
 import xgboost
 
 try:
@@ -20,18 +22,176 @@ from hypernets.discriminators import UnPromisingTrial
 from hypernets.tabular.column_selector import column_object_category_bool, column_zero_or_positive_int32
 from hypernets.tabular.dask_ex import DaskToolBox
 from hypernets.utils import const, logging, is_os_windows
-from .gbm_callbacks import LightGBMDiscriminationCallback, XGBoostDiscriminationCallback, CatboostDiscriminationCallback
+from .cfg import HyperGBMCfg as cfg
+from .dataset_cache import cached_dataset, get_dataset_cache, creating_datasets, no_scope
+from .gbm_callbacks import LightGBMDiscriminationCallback, XGBoostDiscriminationCallback, CatboostDiscriminationCallback, \
+    HistGBDiscriminationCallback, HistGBCallbackEnv
+from .utils.fingerprint import memoize, fingerprint
 
 logger = logging.get_logger(__name__)
 _is_windows = is_os_windows
 
 
-def get_categorical_features(X):
+_int_dtypes = ('int16', 'int32', 'int64')  # dtypes of `column_int`
+
+
+def _int_blocks(X):
+    """
+    Get the int columns as 2d arrays of (positions, values in the (columns, rows) layout), one per pandas block,
+    so they can be reduced in one vectorized pass without copying.
+    """
+    try:
+        blocks = [(b.mgr_locs.as_array, b.values) for b in X._mgr.blocks
+                  if isinstance(b.values, np.ndarray) and b.values.dtype.name in _int_dtypes]
+    except AttributeError:  # pandas internals changed
+        blocks = [(np.array([i]), X.iloc[:, i].to_numpy().reshape(1, -1))
+                  for i, dtype in enumerate(X.dtypes) if dtype.name in _int_dtypes]
+    return [(positions, values.reshape(len(positions), -1)) for positions, values in blocks]
+
+
+def _categorical_features(X, int_blocks):
     cat_cols = column_object_category_bool(X)
-    cat_cols += column_zero_or_positive_int32(X)
+
+    int32_max = np.iinfo(np.int32).max
+    positions = []
+    for block_positions, values in int_blocks:
+        if values.shape[1] > 0:
+            selected = (values.min(axis=1) >= 0) & (values.max(axis=1) <= int32_max)
+            positions.extend(block_positions[selected])
+    cat_cols += [X.columns[i] for i in sorted(positions)]
+
     return cat_cols
 
 
+def get_categorical_features(X):
+    """
+    Get the categorical features: object, category and bool columns, and the int columns of values in [0, int32 max].
+
+    The result of pandas DataFrame is memoized with the DataFrame object by its schema and column buffers,
+    so it is computed once for the same data.
+    """
+    if not isinstance(X, pd.DataFrame):
+        cat_cols = column_object_category_bool(X)
+        cat_cols += column_zero_or_positive_int32(X)
+        return cat_cols
+
+    int_blocks = _int_blocks(X)
+    key = ('categorical_features', tuple(X.columns), tuple(map(str, X.dtypes)), len(X),
+           tuple(values.__array_interface__['data'][0] for _, values in int_blocks))
+    return list(memoize(X, key, lambda: _categorical_features(X, int_blocks)))
+
+
+def categorical_features_kwargs(estimator, cat_cols):
+    """
+    Get the fit kwargs to pass the categorical features to the estimator, empty if it does not accept them.
+    """
+    if isinstance(estimator, LGBMEstimatorMixin):
+        return {'categorical_feature': cat_cols if len(cat_cols) > 0 else None}
+    elif isinstance(estimator, CatBoostEstimatorMixin):
+        return {'cat_features': cat_cols}
+    else:
+        return {}
+
+
+def select_features(estimator, X, feature_names):
+    """
+    Select the feature columns from X in the order of `feature_names` to predict with the estimator.
+
+    X is returned as it is if its columns are the features in order, otherwise the columns are taken by position.
+    """
+    if feature_names is None:
+        return X
+    if not isinstance(X, pd.DataFrame):
+        return X[feature_names] if hasattr(X, 'columns') else X
+
+    columns = X.columns
+    if len(columns) == len(feature_names) and columns.equals(pd.Index(feature_names)):
+        return X
+
+    positions = columns.get_indexer(feature_names)
+    if (positions < 0).any():
+        raise KeyError(f'{[c for c, i in zip(feature_names, positions) if i < 0]} not in columns')
+    return X.take(positions, axis=1)
+
+
+def get_n_jobs_param(estimator):
+    """
+    Get the name of parameter which controls the number of threads used by the estimator, or None if not supported.
+    """
+    if isinstance(estimator, catboost.CatBoost):
+        return 'thread_count'
+    elif 'n_jobs' in estimator.get_params(deep=False).keys():
+        return 'n_jobs'
+    else:
+        return None
+
+
+def predict_with_n_jobs(estimator, method, n_jobs):
+    """
+    Get the prediction method of the fitted estimator which runs with up to `n_jobs` threads if supported.
+
+    :param method: str, 'predict' or 'predict_proba'.
+    :return: callable with the data to predict.
+    """
+    fn = getattr(estimator, method)
+    if isinstance(estimator, catboost.CatBoost):
+        return partial(fn, thread_count=n_jobs)
+    elif isinstance(estimator, lightgbm.LGBMModel):
+        return partial(fn, num_threads=n_jobs)
+    elif isinstance(estimator, xgboost.XGBModel):
+        # xgboost predicts with the threads of the booster, reset them to the ones of the estimator after calling
+        def call(X):
+            booster = estimator.get_booster()
+            booster.set_param('nthread', n_jobs)
+            try:
+                return fn(X)
+            finally:
+                booster.set_param('nthread', estimator.n_jobs if estimator.n_jobs is not None else 0)
+
+        return call
+    else:
+        return fn
+
+
+def get_n_estimators_param(estimator):
+    """
+    Get the name of parameter which controls the number of boosting rounds of the estimator, or None if not set.
+    """
+    params = estimator.get_params(deep=False)
+    for key in ('n_estimators', 'iterations', 'num_boost_round', 'max_iter'):
+        if isinstance(params.get(key), int):
+            return key
+    return None
+
+
+def get_boosted_rounds(estimator):
+    """
+    Get the number of boosting rounds of the fitted estimator, or None if it can not be resumed.
+    """
+    if isinstance(estimator, lightgbm.LGBMModel):
+        return estimator.booster_.current_iteration()
+    elif isinstance(estimator, xgboost.XGBModel):
+        return estimator.get_booster().num_boosted_rounds()
+    elif isinstance(estimator, catboost.CatBoost):
+        return estimator.tree_count_
+    else:
+        return None
+
+
+def resume_fit_kwargs(estimator, init_estimator):
+    """
+    Get the fit kwargs of the estimator to continue boosting from the fitted `init_estimator` of the same type.
+    """
+    if isinstance(estimator, lightgbm.LGBMModel):
+        return dict(init_model=init_estimator.booster_)
+    elif isinstance(estimator, xgboost.XGBModel):
+        return dict(xgb_model=init_estimator.get_booster())
+    elif isinstance(estimator, catboost.CatBoost):
+        return dict(init_model=init_estimator)
+    else:
+        return {}
+
+
 def _default_early_stopping_rounds(estimator):
     n_estimators = getattr(estimator, 'n_estimators', None)
     if isinstance(n_estimators, int):
@@ -83,14 +243,89 @@ class HyperEstimatorMixin:
         return None
 
 
-class HistGradientBoostingClassifierWrapper(HistGradientBoostingClassifier, HyperEstimatorMixin):
+class HistGBEstimatorMixin(HyperEstimatorMixin):
+    @property
+    def iteration_scores(self):
+        return self.__dict__.get('_iteration_scores', [])
+
+    def build_discriminator_callback(self, discriminator):
+        if discriminator is None:
+            return None
+        callback = HistGBDiscriminationCallback(discriminator=discriminator, group_id=self.group_id)
+        return callback
+
+    def fit_in_stages(self, fit, X, y, sample_weight, eval_set, callbacks):
+        """
+        Fit with warm start in stages of `HyperGBMCfg.histgb_stage_iterations` iterations, and call the callbacks
+        with `HistGBCallbackEnv` after each stage, so the discrimination callback can raise UnPromisingTrial early.
+        """
+        if isinstance(eval_set, list):
+            eval_set = eval_set[0] if len(eval_set) > 0 else None
+        X_eval, y_eval = eval_set if eval_set is not None else (None, None)
+        stage_iterations = max(1, cfg.histgb_stage_iterations)
+        max_iter, warm_start = self.max_iter, self.warm_start
+
+        discrimination_callbacks = [c for c in callbacks if isinstance(c, HistGBDiscriminationCallback)]
+
+        self._stage_binned_data = {}
+        try:
+            n_iter = 0
+            while n_iter < max_iter:
+                self.max_iter = min(n_iter + stage_iterations, max_iter)
+                fit(X, y, sample_weight)
+                self.warm_start = True
+                n_iter = self.max_iter
+
+                env = HistGBCallbackEnv(self, X_eval, y_eval, self.n_iter_, max_iter)
+                for callback in callbacks:
+                    callback(env)
+                if self.n_iter_ < n_iter:  # stopped early
+                    break
+        finally:
+            self.max_iter, self.warm_start = max_iter, warm_start
+            del self._stage_binned_data
+            if discrimination_callbacks:
+                self._iteration_scores = discrimination_callbacks[0].iteration_trajectory.tolist()
+
+        return self
+
+    def bin_data_once(self, bin_data, X, is_training_data):
+        """
+        Bin the data only once in all stages of `fit_in_stages`, the fitted bin mapper is reused in the later stages.
+        """
+        binned_data = self.__dict__.get('_stage_binned_data')
+        if binned_data is None:
+            return bin_data(X, is_training_data)
+
+        key = (fingerprint(X), is_training_data)
+        if key not in binned_data:
+            binned_data[key] = (bin_data(X, is_training_data), self._bin_mapper)
+        X_binned, self._bin_mapper = binned_data[key]
+        return X_binned
+
+
+class HistGradientBoostingClassifierWrapper(HistGradientBoostingClassifier, HistGBEstimatorMixin):
     def fit(self, X, y, sample_weight=None, **kwargs):
-        return super(HistGradientBoostingClassifierWrapper, self).fit(X, y, sample_weight)
+        fit = super(HistGradientBoostingClassifierWrapper, self).fit
+        callbacks = kwargs.get('callbacks')
+        if callbacks:
+            return self.fit_in_stages(fit, X, y, sample_weight, kwargs.get('eval_set'), callbacks)
+        return fit(X, y, sample_weight)
 
+    def _bin_data(self, X, is_training_data):
+        return self.bin_data_once(super(HistGradientBoostingClassifierWrapper, self)._bin_data, X, is_training_data)
 
-class HistGradientBoostingRegressorWrapper(HistGradientBoostingRegressor, HyperEstimatorMixin):
+
+class HistGradientBoostingRegressorWrapper(HistGradientBoostingRegressor, HistGBEstimatorMixin):
     def fit(self, X, y, sample_weight=None, **kwargs):
-        return super(HistGradientBoostingRegressorWrapper, self).fit(X, y, sample_weight)
+        fit = super(HistGradientBoostingRegressorWrapper, self).fit
+        callbacks = kwargs.get('callbacks')
+        if callbacks:
+            return self.fit_in_stages(fit, X, y, sample_weight, kwargs.get('eval_set'), callbacks)
+        return fit(X, y, sample_weight)
+
+    def _bin_data(self, X, is_training_data):
+        return self.bin_data_once(super(HistGradientBoostingRegressorWrapper, self)._bin_data, X, is_training_data)
 
 
 class HistGBEstimator(HyperEstimator):
@@ -123,6 +358,14 @@ class HistGBEstimator(HyperEstimator):
         return hgboost
 
 
+# parameters (and aliases) to construct (bin) the lightgbm Dataset
+_lightgbm_dataset_params = ('max_bin', 'max_bins', 'max_bin_by_feature', 'min_data_in_bin',
+                            'bin_construct_sample_cnt', 'subsample_for_bin', 'data_random_seed', 'random_state',
+                            'seed', 'random_seed', 'feature_pre_filter', 'min_data_in_leaf', 'min_child_samples',
+                            'use_missing', 'zero_as_missing', 'linear_tree', 'max_cat_to_onehot',
+                            'categorical_feature', 'categorical_column', 'cat_feature', 'forcedbins_filename')
+
+
 class LGBMEstimatorMixin:
     @property
     def best_n_estimators(self):
@@ -154,10 +397,40 @@ class LGBMEstimatorMixin:
             kwargs['early_stopping_rounds'] = _default_early_stopping_rounds(self)
         return kwargs
 
+    def dataset_cache_scope(self):
+        """
+        Context to fit with the cached Dataset if the native dataset cache is enabled.
+
+        The sklearn estimators of lightgbm construct the Dataset inline, so it is created by
+        `create_cached_dataset` through the stand-in of `lightgbm.sklearn.Dataset` within the context.
+        """
+        if get_dataset_cache() is None:
+            return no_scope()
+        return creating_datasets(lightgbm.sklearn, 'Dataset', self.create_cached_dataset)
+
+    @staticmethod
+    def create_cached_dataset(dataset_class, data, label=None, weight=None, group=None, init_score=None,
+                              params=None, categorical_feature='auto', **kwargs):
+        """
+        Create Dataset with the raw data kept, reuse the cached one if it was created from the same data and binning
+        parameters. Lightgbm reconstructs a cached Dataset if it is used with different binning parameters.
+        """
+        if kwargs:
+            return dataset_class(data, label=label, weight=weight, group=group, init_score=init_score,
+                                 params=params, categorical_feature=categorical_feature, **kwargs)
+
+        key_params = {k: v for k, v in (params or {}).items() if k in _lightgbm_dataset_params}
+        key_params['categorical_feature'] = categorical_feature
+        create = partial(dataset_class, data, label=label, weight=weight, group=group, init_score=init_score,
+                         params=params, categorical_feature=categorical_feature, free_raw_data=False)
+        return cached_dataset('lightgbm_dataset', create, [data, label, weight, group, init_score], key_params)
+
     def prepare_predict_X(self, X):
         try:
-            if hasattr(self, 'feature_name_'):
-                X = X[self.feature_name_]
+            # feature_name_ is read from the native booster on every call, memoize it with the booster
+            booster = getattr(self, '_Booster', None)
+            if booster is not None:
+                X = select_features(self, X, memoize(booster, 'feature_name', booster.feature_name))
         except:
             pass
         return X
@@ -166,7 +439,8 @@ class LGBMEstimatorMixin:
 class LGBMClassifierWrapper(lightgbm.LGBMClassifier, LGBMEstimatorMixin):
     def fit(self, X, y, sample_weight=None, **kwargs):
         kwargs = self.prepare_fit_kwargs(X, y, kwargs)
-        super(LGBMClassifierWrapper, self).fit(X, y, sample_weight=sample_weight, **kwargs)
+        with self.dataset_cache_scope():
+            super(LGBMClassifierWrapper, self).fit(X, y, sample_weight=sample_weight, **kwargs)
 
     def predict(self, X, raw_score=False, start_iteration=0, num_iteration=None,
                 pred_leaf=False, pred_contrib=False, **kwargs):
@@ -186,7 +460,8 @@ class LGBMClassifierWrapper(lightgbm.LGBMClassifier, LGBMEstimatorMixin):
 class LGBMRegressorWrapper(lightgbm.LGBMRegressor, LGBMEstimatorMixin):
     def fit(self, X, y, sample_weight=None, **kwargs):
         kwargs = self.prepare_fit_kwargs(X, y, kwargs)
-        super().fit(X, y, sample_weight=sample_weight, **kwargs)
+        with self.dataset_cache_scope():
+            super().fit(X, y, sample_weight=sample_weight, **kwargs)
 
     def predict(self, X, raw_score=False, start_iteration=0, num_iteration=None,
                 pred_leaf=False, pred_contrib=False, **kwargs):
@@ -318,6 +593,13 @@ class LightGBMDaskEstimator(LightGBMEstimator):
         return lgbm
 
 
+_xgb_dmatrix_data_keys = ('data', 'label', 'weight', 'base_margin', 'group', 'qid', 'feature_weights')
+# the sklearn estimators of recent xgboost create DMatrix with `_create_dmatrix`, older ones construct it inline
+_xgb_create_dmatrix_hooked = hasattr(xgboost.XGBModel, '_create_dmatrix')
+_catboost_quantization_params = ('border_count', 'feature_border_type', 'per_float_feature_quantization',
+                                 'nan_mode', 'input_borders')
+
+
 class XGBEstimatorMixin:
     @property
     def best_n_estimators(self):
@@ -354,14 +636,53 @@ class XGBEstimatorMixin:
         return kwargs
 
     def prepare_predict_X(self, X):
-        X = X[self.get_booster().feature_names]
+        X = select_features(self, X, self.get_booster().feature_names)
         return X
 
+    def dataset_cache_scope(self):
+        """
+        Context to fit with the cached DMatrix if the native dataset cache is enabled.
+
+        The xgboost versions without the `_create_dmatrix` hook construct DMatrix inline, so it is created by
+        `create_cached_dmatrix` through the stand-in of `xgboost.sklearn.DMatrix` within the context.
+        """
+        if _xgb_create_dmatrix_hooked or get_dataset_cache() is None:
+            return no_scope()
+
+        def create(dmatrix_class, *args, **kwargs):
+            if args:
+                return dmatrix_class(*args, **kwargs)
+            return self.create_cached_dmatrix(lambda ref=None, **kw: dmatrix_class(**kw), **kwargs)
+
+        return creating_datasets(xgboost.sklearn, 'DMatrix', create)
+
+    def create_cached_dmatrix(self, create, ref=None, **kwargs):
+        """
+        Create DMatrix with `create`, reuse the cached one if the native dataset cache is enabled.
+        """
+        cache = get_dataset_cache()
+        if cache is None:
+            return create(ref=ref, **kwargs)
+
+        ref_key = cache.key_of(ref) if ref is not None else None
+        if ref is not None and ref_key is None:
+            return create(ref=ref, **kwargs)
+
+        data = [kwargs.get(k) for k in _xgb_dmatrix_data_keys]
+        params = {k: v for k, v in kwargs.items() if k not in _xgb_dmatrix_data_keys and k != 'nthread'}
+        params.update(ref=ref_key, booster=self.booster, tree_method=self.tree_method,
+                      max_bin=getattr(self, 'max_bin', None))
+        return cached_dataset('xgboost_dmatrix', partial(create, ref=ref, **kwargs), data, params)
+
 
 class XGBClassifierWrapper(xgboost.XGBClassifier, XGBEstimatorMixin):
     def fit(self, X, y, **kwargs):
         kwargs = self.prepare_fit_kwargs(X, y, kwargs)
-        super().fit(X, y, **kwargs)
+        with self.dataset_cache_scope():
+            super().fit(X, y, **kwargs)
+
+    def _create_dmatrix(self, ref=None, **kwargs):
+        return self.create_cached_dmatrix(super()._create_dmatrix, ref=ref, **kwargs)
 
     def predict(self, X, **kwargs):
         X = self.prepare_predict_X(X)
@@ -375,7 +696,11 @@ class XGBClassifierWrapper(xgboost.XGBClassifier, XGBEstimatorMixin):
 class XGBRegressorWrapper(xgboost.XGBRegressor, XGBEstimatorMixin):
     def fit(self, X, y, **kwargs):
         kwargs = self.prepare_fit_kwargs(X, y, kwargs)
-        super().fit(X, y, **kwargs)
+        with self.dataset_cache_scope():
+            super().fit(X, y, **kwargs)
+
+    def _create_dmatrix(self, ref=None, **kwargs):
+        return self.create_cached_dmatrix(super()._create_dmatrix, ref=ref, **kwargs)
 
     def predict(self, X, **kwargs):
         X = self.prepare_predict_X(X)
@@ -606,18 +931,52 @@ class CatBoostEstimatorMixin:
             kwargs['early_stopping_rounds'] = _default_early_stopping_rounds(self)
         return kwargs
 
+    def prepare_fit_data(self, X, y, kwargs):
+        """
+        Convert the train and eval data into (cached) catboost Pools if the native dataset cache is enabled,
+        the train Pool is quantized with the quantization parameters of the estimator.
+        """
+        if get_dataset_cache() is None or isinstance(X, catboost.Pool):
+            return X, y, kwargs
+
+        params = self.get_params()
+        cat_features = kwargs.pop('cat_features', None)
+        sample_weight = kwargs.pop('sample_weight', None)
+        quantization_params = {k: params[k] for k in _catboost_quantization_params if params.get(k) is not None}
+
+        def create_pool():
+            pool = catboost.Pool(X, y, cat_features=cat_features, weight=sample_weight)
+            if params.get('task_type') in (None, 'CPU'):
+                pool.quantize(**quantization_params)
+            return pool
+
+        X = cached_dataset('catboost_quantized_pool', create_pool, [X, y, sample_weight],
+                           dict(cat_features=cat_features, task_type=params.get('task_type'), **quantization_params))
+
+        eval_set = kwargs.get('eval_set')
+        if eval_set is not None:
+            if isinstance(eval_set, tuple):
+                eval_set = [eval_set]
+            kwargs['eval_set'] = [
+                cached_dataset('catboost_pool', partial(catboost.Pool, X_eval, y_eval, cat_features=cat_features),
+                               [X_eval, y_eval], dict(cat_features=cat_features))
+                for X_eval, y_eval in eval_set]
+
+        return X, None, kwargs
+
     def prepare_predict_X(self, X):
-        X = X[self.feature_names_]
+        X = select_features(self, X, self.feature_names_)
         return X
 
 
 class CatBoostClassifierWrapper(catboost.CatBoostClassifier, CatBoostEstimatorMixin):
     def fit(self, X, y=None, **kwargs):
         kwargs = self.prepare_fit_kwargs(X, y, kwargs)
+        X, y, kwargs = self.prepare_fit_data(X, y, kwargs)
         super().fit(X, y, **kwargs)
         discriminator_callback = self.__dict__.get('discriminator_callback')
         if discriminator_callback is not None and not discriminator_callback.is_promising_:
-            raise UnPromisingTrial(f'unpromising trial:{discriminator_callback.iteration_trajectory}')
+            raise UnPromisingTrial(f'unpromising trial:{discriminator_callback.iteration_trajectory.tolist()}')
 
     def predict(self, X, **kwargs):
         X = self.prepare_predict_X(X)
@@ -631,10 +990,11 @@ class CatBoostClassifierWrapper(catboost.CatBoostClassifier, CatBoostEstimatorMi
 class CatBoostRegressionWrapper(catboost.CatBoostRegressor, CatBoostEstimatorMixin):
     def fit(self, X, y=None, **kwargs):
         kwargs = self.prepare_fit_kwargs(X, y, kwargs)
+        X, y, kwargs = self.prepare_fit_data(X, y, kwargs)
         super().fit(X, y, **kwargs)
         discriminator_callback = self.__dict__.get('discriminator_callback')
         if discriminator_callback is not None and not discriminator_callback.is_promising_:
-            raise UnPromisingTrial(f'unpromising trial:{discriminator_callback.iteration_trajectory}')
+            raise UnPromisingTrial(f'unpromising trial:{discriminator_callback.iteration_trajectory.tolist()}')
 
     def predict(self, X, **kwargs):
         X = self.prepare_predict_X(X)
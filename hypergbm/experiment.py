@@ -6,10 +6,25 @@ __author__ = 'yangjian'
 """
 import copy
 
+from hypergbm.cfg import HyperGBMCfg as cfg
 from hypergbm.hyper_gbm import HyperGBM
 from hypernets.experiment import make_experiment as _make_experiment
 from hypernets.tabular.dask_ex import DaskToolBox
-from hypernets.utils import DocLens
+from hypernets.utils import DocLens, logging
+
+logger = logging.get_logger(__name__)
+
+
+def _load_with_arrow(data):
+    from hypergbm.utils import arrow_io
+
+    if not arrow_io.is_parquet(data):
+        return data
+
+    stats = arrow_io.LoadStats()
+    df = arrow_io.load_data(data, stats=stats)
+    logger.info(f'loaded {data} with arrow ingestion: {stats}')
+    return df
 
 
 def make_experiment(train_data,
@@ -99,6 +114,10 @@ def make_experiment(train_data,
             result.options.update(args)
         return result
 
+    if cfg.arrow_ingestion_enabled \
+            and not (DaskToolBox.exist_dask_object(train_data, test_data, eval_data) or DaskToolBox.dask_enabled()):
+        train_data, eval_data, test_data = [_load_with_arrow(d) for d in (train_data, eval_data, test_data)]
+
     if (searcher is None or isinstance(searcher, str)) and search_space is None:
         search_space = default_search_space()
 
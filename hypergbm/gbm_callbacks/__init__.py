@@ -7,4 +7,5 @@ __author__ = 'yangjian'
 from ._lightgbm_callbacks import LightGBMDiscriminationCallback
 from ._xgboost_callbacks import XGBoostDiscriminationCallback
 from ._catboost_callbacks import CatboostDiscriminationCallback
+from ._histgb_callbacks import HistGBDiscriminationCallback, HistGBCallbackEnv
 from ._base import FileMonitorCallback
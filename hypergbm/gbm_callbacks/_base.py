@@ -4,23 +4,91 @@ __author__ = 'yangjian'
 
 """
 import os.path
+import time
 
-from hypernets.discriminators import UnPromisingTrial
+import numpy as np
+
+from hypernets.discriminators import UnPromisingTrial, BaseDiscriminator
 
 class BaseDiscriminationCallback(object):
-    def __init__(self, discriminator, group_id):
+    """
+    Record the evaluation score of each iteration into the trajectory, and raise UnPromisingTrial once the
+    discriminator finds the trial unpromising.
+
+    The trajectory is kept in a preallocated numpy array, and the discriminator is called with a view of it only
+    every `check_every` iterations (default is `HyperGBMCfg.discriminator_check_every`). The iterations before
+    `min_steps` or out of the `stride` of a `BaseDiscriminator` are not discriminated as they are always promising.
+
+    Use `update` (or `extend` for a batch of scores) to feed scores incrementally without raising.
+    """
+
+    def __init__(self, discriminator, group_id, check_every=None):
+        from hypergbm.cfg import HyperGBMCfg as cfg
+
         self.discriminator = discriminator
         self.group_id = group_id
-        self.iteration_trajectory = []
+        self.check_every = max(1, check_every if check_every is not None else cfg.discriminator_check_every)
         self.is_promising_ = True
-        self.show_iteration_trajectory_len=6
+        self.show_iteration_trajectory_len = 6
+
+        self._trajectory = np.empty(0, dtype='float64')
+        self._n_steps = 0
+        self._checked_steps = 0
+
+        if isinstance(discriminator, BaseDiscriminator):
+            self._min_steps = discriminator.min_steps
+            self._stride = max(discriminator.stride, 1)
+        else:
+            self._min_steps, self._stride = 0, 1
+
+    @property
+    def iteration_trajectory(self):
+        return self._trajectory[:self._n_steps]
+
+    def _append(self, score, end_iteration):
+        if self._n_steps >= len(self._trajectory):
+            size = max(2 * len(self._trajectory), 64, end_iteration if end_iteration is not None else 0)
+            trajectory = np.empty(size, dtype='float64')
+            trajectory[:self._n_steps] = self._trajectory[:self._n_steps]
+            self._trajectory = trajectory
+        self._trajectory[self._n_steps] = score
+        self._n_steps += 1
+
+    def _should_check(self, end_iteration):
+        n_steps = self._n_steps
+        if n_steps < self._min_steps or (n_steps - self._min_steps) % self._stride > 0:
+            return False
+        return n_steps - self._checked_steps >= self.check_every \
+            or (end_iteration is not None and n_steps >= end_iteration > 0)
+
+    def update(self, score, end_iteration=None):
+        """
+        Append the score of the next iteration, and discriminate the trajectory if it is time to check.
+
+        :return: bool, whether the trial is still promising.
+        """
+        self._append(score, end_iteration)
+        if self.is_promising_ and self._should_check(end_iteration):
+            self._checked_steps = self._n_steps
+            self.is_promising_ = bool(
+                self.discriminator.is_promising(self.iteration_trajectory, self.group_id, end_iteration))
+        return self.is_promising_
+
+    def extend(self, scores, end_iteration=None):
+        """
+        Append the scores of the next iterations, stop at the first iteration found unpromising.
+
+        :return: bool, whether the trial is still promising.
+        """
+        for score in scores:
+            if not self.update(score, end_iteration):
+                break
+        return self.is_promising_
 
     def iteration(self, score, end_iteration):
-        self.iteration_trajectory.append(score)
-        promising = self.discriminator.is_promising(self.iteration_trajectory, self.group_id, end_iteration)
-        self.is_promising_ = promising
-        if not promising:
-            raise UnPromisingTrial(f'unpromising trial:{self.iteration_trajectory[-self.show_iteration_trajectory_len:]}')
+        if not self.update(score, end_iteration):
+            trajectory = self.iteration_trajectory[-self.show_iteration_trajectory_len:].tolist()
+            raise UnPromisingTrial(f'unpromising trial:{trajectory}')
 
     def _get_score(self, env):
         raise NotImplementedError
@@ -31,15 +99,61 @@ class BaseDiscriminationCallback(object):
 
 
 class FileMonitorCallback(object):
-    def __init__(self, file_path):
-        assert isinstance(file_path, str) and len(file_path) > 0
+    """
+    Raise UnPromisingTrial to skip the fitting trial once the file is found (and removed) or the event is set.
+
+    The file is checked once every `check_iterations` iterations or `check_interval` seconds (whichever comes
+    first) rather than in every iteration, to save the stat syscalls on slow file systems.
+
+    :param file_path: str, the file to monitor, or an event-like object (e.g. `threading.Event` or
+        `multiprocessing.Event`) which is checked with `is_set()` in every iteration.
+    :param check_iterations: int, 0 to check by time only, default is `HyperGBMCfg.skip_file_check_iterations`.
+    :param check_interval: float, seconds, 0 to check by iterations only,
+        default is `HyperGBMCfg.skip_file_check_interval`.
+    """
 
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    def __init__(self, file_path, check_iterations=None, check_interval=None):
+        from hypergbm.cfg import HyperGBMCfg as cfg
 
-        self.file_path = file_path
+        if hasattr(file_path, 'is_set'):
+            self.event = file_path
+            self.file_path = None
+        else:
+            assert isinstance(file_path, str) and len(file_path) > 0
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            self.event = None
+            self.file_path = file_path
+
+        self.check_iterations = check_iterations if check_iterations is not None else cfg.skip_file_check_iterations
+        self.check_interval = check_interval if check_interval is not None else cfg.skip_file_check_interval
+        self.iterations_ = 0
+        self.checked_at_ = time.monotonic()
+
+    def _should_check(self):
+        if self.check_iterations <= 0 and self.check_interval <= 0:
+            return True
+
+        self.iterations_ += 1
+        if 0 < self.check_iterations <= self.iterations_:
+            return True
+        if self.check_interval > 0:
+            now = time.monotonic()
+            if now - self.checked_at_ >= self.check_interval:
+                return True
+        return False
 
     def __call__(self, env):
+        if self.event is not None:
+            if self.event.is_set():
+                raise UnPromisingTrial('stop event is set, skip trial')
+            return
+
+        if not self._should_check():
+            return
+        self.iterations_ = 0
+        self.checked_at_ = time.monotonic()
+
         if os.path.exists(self.file_path):
             try:
                 os.remove(self.file_path)
@@ -0,0 +1,30 @@
+# -*- coding:utf-8 -*-
+"""
+
+"""
+from collections import namedtuple
+
+import numpy as np
+from sklearn.metrics import log_loss, mean_squared_error
+
+from ._base import BaseDiscriminationCallback
+
+HistGBCallbackEnv = namedtuple('HistGBCallbackEnv', ['model', 'X_eval', 'y_eval', 'iteration', 'end_iteration'])
+
+
+class HistGBDiscriminationCallback(BaseDiscriminationCallback):
+    """
+    Discrimination callback of HistGradientBoosting estimators fitted in stages, scores the eval set with the loss
+    of the default metric of LightGBM (logloss for classification, l2 for regression) after each stage.
+    """
+
+    def _get_score(self, env):
+        if env.X_eval is None or env.y_eval is None:
+            raise ValueError('Evaluation result not found.')
+
+        if hasattr(env.model, 'predict_proba'):
+            proba = env.model.predict_proba(env.X_eval)
+            score = log_loss(env.y_eval, proba, labels=env.model.classes_)
+        else:
+            score = mean_squared_error(env.y_eval, env.model.predict(env.X_eval))
+        return float(np.asarray(score))
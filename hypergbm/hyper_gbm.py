@@ -4,11 +4,14 @@
 """
 import copy
 import hashlib
+import os
 import pickle
-import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
 from imblearn.over_sampling import RandomOverSampler, SMOTE, ADASYN
 from imblearn.under_sampling import RandomUnderSampler, NearMiss, TomekLinks, EditedNearestNeighbours
 from sklearn import pipeline as sk_pipeline
@@ -16,13 +19,22 @@ from tqdm.auto import tqdm
 
 from hypergbm.gbm_callbacks import FileMonitorCallback
 from hypernets.core import Callback, ProgressiveCallback
+from hypernets.discriminators import UnPromisingTrial, BaseDiscriminator, get_previous_trials_scores, \
+    get_percentile_score
 from hypernets.model.estimator import Estimator
 from hypernets.model.hyper_model import HyperModel
 from hypernets.pipeline.base import ComposeTransformer
 from hypernets.tabular import get_tool_box
 from hypernets.tabular.cache import cache
 from hypernets.utils import logging, fs, const
-from .estimators import HyperEstimator
+from .cfg import HyperGBMCfg as cfg
+from .estimators import HyperEstimator, get_n_jobs_param, get_categorical_features, categorical_features_kwargs, \
+    get_n_estimators_param, get_boosted_rounds, resume_fit_kwargs, predict_with_n_jobs
+from .merged_model import merge_models
+from .pipeline_cache import get_pipeline_cache, fit_transform_cached
+from .sklearn.inference_plan import InferencePlan
+from .utils.fingerprint import fingerprint
+from .utils.mmap_store import MmapStore
 
 try:
     import shap
@@ -34,6 +46,58 @@ except:
 
 logger = logging.get_logger(__name__)
 
+# group id of the mean scores of folds in cross validation, in the iteration scores of trials
+_cv_folds_group_id = 'cv_folds'
+
+
+def _get_n_jobs(estimator):
+    key = get_n_jobs_param(estimator)
+    if key is None:
+        return None
+
+    n_jobs = estimator.get_params(deep=False).get(key)
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count()
+    return n_jobs
+
+
+def _split_n_jobs(estimator, fold_n_jobs):
+    n_jobs = _get_n_jobs(estimator)
+    if n_jobs is None:
+        return
+
+    estimator.set_params(**{get_n_jobs_param(estimator): max(1, n_jobs // fold_n_jobs)})
+
+
+def _select_rows(X, indices):
+    return get_tool_box(X).select_1d(X, indices)
+
+
+def _fit_fold(n_fold, fold_est, X, y, train_idx, valid_idx, fit_kwargs, class_balancing=None, task=None, verbose=0):
+    x_train_fold, y_train_fold = _select_rows(X, train_idx), _select_rows(y, train_idx)
+    x_val_fold, y_val_fold = _select_rows(X, valid_idx), _select_rows(y, valid_idx)
+
+    sample_weight = None
+    if task != const.TASK_REGRESSION and class_balancing is not None:
+        sampler = get_sampler(class_balancing)
+        if sampler is None:
+            sample_weight = get_tool_box(y_train_fold).compute_sample_weight(y_train_fold)
+        else:
+            x_train_fold, y_train_fold = sampler.fit_resample(x_train_fold, y_train_fold)
+    fit_kwargs = {**fit_kwargs, 'eval_set': [(x_val_fold, y_val_fold)], 'sample_weight': sample_weight}
+
+    fold_start_at = time.time()
+    fold_est.fit(x_train_fold, y_train_fold, **fit_kwargs)
+    if verbose:
+        logger.info(f'fit fold {n_fold} with {time.time() - fold_start_at} seconds')
+
+    if task == const.TASK_REGRESSION:
+        proba = fold_est.predict(x_val_fold)
+    else:
+        proba = fold_est.predict_proba(x_val_fold)
+
+    return fold_est, proba
+
 
 def get_sampler(sampler):
     samplers = {'RandomOverSampler': RandomOverSampler,
@@ -100,6 +164,31 @@ class HyperGBMExplainer:
         return X
 
 
+def _get_mmap_store():
+    """
+    Get the memory-mapped store of transformed data, or None if `HyperGBMCfg.data_mmap_cache_enabled` is False.
+    """
+    if not cfg.data_mmap_cache_enabled:
+        return None
+
+    cache_dir = cfg.data_mmap_cache_dir
+    if not cache_dir:
+        from hypernets.tabular.cfg import TabularCfg
+        cache_dir = os.path.join(TabularCfg.cache_dir, 'hypergbm_mmap')
+    return MmapStore(cache_dir)
+
+
+def _signature_value(value):
+    if value is None or isinstance(value, (str, bool, int, float, np.number)):
+        return repr(value)
+    elif isinstance(value, (list, tuple)):
+        return f"[{','.join(map(_signature_value, value))}]"
+    elif isinstance(value, dict):
+        return f"{{{','.join(f'{k}={_signature_value(v)}' for k, v in sorted(value.items()))}}}"
+    else:
+        return type(value).__name__
+
+
 class HyperGBMEstimator(Estimator):
     def __init__(self, task, space_sample, data_cleaner_params=None):
         super(HyperGBMEstimator, self).__init__(space_sample=space_sample, task=task)
@@ -107,12 +196,14 @@ class HyperGBMEstimator(Estimator):
         self.data_cleaner_params = data_cleaner_params
         self.gbm_model = None
         self.cv_gbm_models_ = None
+        self.cv_fold_trajectory_ = None
         self.data_cleaner = None
         self.pipeline_signature = None
         self.fit_kwargs = None
         self.class_balancing = None
         self.classes_ = None
         self.pos_label = None
+        self.inference_plan_ = None
         self.transients_ = {}
 
         self._build_model(space_sample)
@@ -136,7 +227,7 @@ class HyperGBMEstimator(Estimator):
         # next, (name, p) = pipeline_module[0].compose()
         self.data_pipeline = self.build_pipeline(space, pipeline_module[0])
         # logger.debug(f'data_pipeline:{self.data_pipeline}')
-        # self.pipeline_signature = self.get_pipeline_signature(self.data_pipeline)
+        self.pipeline_signature = self.get_pipeline_signature(space, pipeline_module[0])
 
         # if self.data_cleaner_params is not None:
         #     self.data_cleaner = DataCleaner(**self.data_cleaner_params)
@@ -144,10 +235,25 @@ class HyperGBMEstimator(Estimator):
         #     self.data_cleaner = None
         self.data_cleaner = None
 
-    def get_pipeline_signature(self, pipeline):
-        repr = pipeline.__repr__(1000000)
-        repr = re.sub(r'object at 0x(.*)>', "", repr)
-        md5 = hashlib.md5(repr.encode('utf-8')).hexdigest()
+    def get_pipeline_signature(self, space, last_transformer):
+        """
+        Get the structural signature of the data pipeline from the compiled space: the type, id and parameter values
+        of every module upstream of the estimator. So samples with the same preprocessing share the signature
+        whatever estimator they choose.
+        """
+        items = []
+        visited = set()
+        modules = [last_transformer]
+        while modules:
+            module = modules.pop()
+            if module.id in visited:
+                continue
+            visited.add(module.id)
+            params = ','.join(f'{k}={_signature_value(v)}' for k, v in sorted(module.param_values.items()))
+            items.append(f'{type(module).__name__}:{module.id}({params})')
+            modules.extend(reversed(space.get_inputs(module)))
+
+        md5 = hashlib.md5(';'.join(items).encode('utf-8')).hexdigest()
         return md5
 
     def build_pipeline(self, space, last_transformer):
@@ -174,10 +280,47 @@ class HyperGBMEstimator(Estimator):
         # s = f"{self.data_pipeline.__repr__(1000000)}\r\n{self.gbm_model.__repr__()}"
         return s
 
-    @cache(arg_keys='X,y', attr_keys='data_cleaner_params,pipeline_signature',
-           attrs_to_restore='data_cleaner,data_pipeline',
-           transformer='transform_data')
     def fit_transform_data(self, X, y=None, verbose=0):
+        # pandas data is keyed by its memoized fingerprint, others are hashed by the data hasher of tool box
+        if isinstance(X, pd.DataFrame) and isinstance(y, (pd.Series, np.ndarray, type(None))):
+            data_key = fingerprint(X, y)
+        else:
+            data_key = [X, y]
+
+        store = _get_mmap_store()
+        if store is not None and isinstance(data_key, str):
+            return self._fit_transform_data_mmap(store, X, y, verbose=verbose, data_key=data_key)
+        return self._fit_transform_data(X, y, verbose=verbose, data_key=data_key)
+
+    def _fit_transform_data_mmap(self, store, X, y=None, verbose=0, data_key=None):
+        key = get_tool_box(pd.DataFrame).data_hasher()(
+            [data_key, self.data_cleaner_params, self.pipeline_signature])
+        if store.exists(key):
+            try:
+                Xt, attributes = store.load(key)
+                self.data_cleaner = attributes['data_cleaner']
+                self.data_pipeline = attributes['data_pipeline']
+                if verbose > 0:
+                    logger.info(f'load transformed data from {store.path_of(key)}')
+                return Xt
+            except Exception as e:
+                logger.warning(f'Failed to load transformed data from {store.path_of(key)}: {e}')
+
+        Xt = self._do_fit_transform_data(X, y, verbose=verbose)
+        if isinstance(Xt, pd.DataFrame):
+            store.store(key, Xt, attributes=dict(data_cleaner=self.data_cleaner, data_pipeline=self.data_pipeline))
+        return Xt
+
+    def _transform_cached_data(self, X, y=None, verbose=0, data_key=None):
+        return self.transform_data(X, y, verbose=verbose)
+
+    @cache(arg_keys='data_key', attr_keys='data_cleaner_params,pipeline_signature',
+           attrs_to_restore='data_cleaner,data_pipeline',
+           transformer='_transform_cached_data')
+    def _fit_transform_data(self, X, y=None, verbose=0, data_key=None):
+        return self._do_fit_transform_data(X, y, verbose=verbose)
+
+    def _do_fit_transform_data(self, X, y=None, verbose=0):
         starttime = time.time()
 
         if self.data_cleaner_params is not None:
@@ -190,7 +333,8 @@ class HyperGBMEstimator(Estimator):
 
         if verbose > 0:
             logger.info('fit and transform')
-        X = self.data_pipeline.fit_transform(X, y)
+        Xt = fit_transform_cached(self.data_pipeline, X, y) if get_pipeline_cache() is not None else None
+        X = Xt if Xt is not None else self.data_pipeline.fit_transform(X, y)
 
         if verbose > 0:
             logger.info(f'taken {time.time() - starttime}s')
@@ -200,6 +344,10 @@ class HyperGBMEstimator(Estimator):
     def transform_data(self, X, y=None, verbose=0):
         starttime = time.time()
 
+        inference_plan = getattr(self, 'inference_plan_', None)
+        if inference_plan is not None and self.data_cleaner is None and isinstance(X, pd.DataFrame):
+            return inference_plan.transform(X)
+
         if self.data_cleaner is not None:
             if verbose > 0:
                 logger.info('clean data')
@@ -214,8 +362,33 @@ class HyperGBMEstimator(Estimator):
 
         return X
 
+    def compile_inference_plan(self, X):
+        """
+        Compile the fitted data pipeline into an inference plan, which is used by `transform_data` to transform
+        pandas DataFrame with the fitted parameters in numpy directly instead of running every transformer.
+
+        :param X: pandas DataFrame, sample of the data to predict, used to check the plan outputs the same
+            result with the data pipeline.
+        :return: InferencePlan. Raise ValueError if the data pipeline can not be compiled.
+        """
+        assert self.data_cleaner is None, 'Inference plan does not support data cleaner.'
+
+        self.inference_plan_ = InferencePlan.compile(self.data_pipeline, X)
+        return self.inference_plan_
+
     def fit_cross_validation(self, X, y, verbose=0, stratified=True, num_folds=3, pos_label=None,
-                             shuffle=False, random_state=9527, metrics=None, skip_if_file=None, **kwargs):
+                             shuffle=False, random_state=9527, metrics=None, skip_if_file=None,
+                             fold_n_jobs=None, fold_backend=None, **kwargs):
+        """
+        Fit the estimator with cross validation.
+
+        :param fold_n_jobs: int or None, number of folds to fit concurrently, -1 to use all cpu cores.
+            The threads of each fold estimator (`n_jobs` or `thread_count`) are divided among the concurrent folds.
+            Use `HyperGBMCfg.cv_fold_n_jobs` if None.
+        :param fold_backend: 'threads', 'processes' or None, joblib backend preference to fit folds concurrently.
+            Use `HyperGBMCfg.cv_fold_backend` if None.
+        :return: scores, oof, oof_scores
+        """
         starttime = time.time()
         if verbose is None:
             verbose = 0
@@ -228,6 +401,7 @@ class HyperGBMEstimator(Estimator):
             pbar.set_description('fit_transform_data')
 
         tb = get_tool_box(X, y)
+        self.inference_plan_ = None
         X = self.fit_transform_data(X, y, verbose=verbose)
         # y = np.array(y)
 
@@ -247,46 +421,54 @@ class HyperGBMEstimator(Estimator):
         if metrics is None:
             metrics = ['accuracy']
 
+        if fold_n_jobs is None:
+            fold_n_jobs = cfg.cv_fold_n_jobs
+        if fold_backend is None:
+            fold_backend = cfg.cv_fold_backend
+        if fold_n_jobs is None or fold_n_jobs <= 0:
+            fold_n_jobs = os.cpu_count()
+
         oof_ = []
         oof_scores = []
         self.pos_label = pos_label
         self.cv_gbm_models_ = []
+        self.cv_fold_trajectory_ = []
         if pbar is not None:
             pbar.set_description('cross_validation')
-        sel = tb.select_1d
-        for n_fold, (train_idx, valid_idx) in enumerate(iterators.split(X, y)):
-            x_train_fold, y_train_fold = sel(X, train_idx), sel(y, train_idx)
-            x_val_fold, y_val_fold = sel(X, valid_idx), sel(y, valid_idx)
-
-            kwargs['eval_set'] = [(x_val_fold, y_val_fold)]
-            sample_weight = None
-            if self.task != const.TASK_REGRESSION and self.class_balancing is not None:
-                sampler = get_sampler(self.class_balancing)
-                if sampler is None:
-                    sample_weight = tb.compute_sample_weight(y_train_fold)
-                else:
-                    x_train_fold, y_train_fold = sampler.fit_resample(x_train_fold, y_train_fold)
-            kwargs['sample_weight'] = sample_weight
-
-            fold_est = copy.deepcopy(self.gbm_model)
-            fold_est.group_id = f'{fold_est.__class__.__name__}_cv_{n_fold}'
-            fit_kwargs = {**kwargs, 'verbose': 0}
-            self._prepare_callbacks(fit_kwargs, fold_est, self.discriminator, skip_if_file)
-
-            fold_start_at = time.time()
-            fold_est.fit(x_train_fold, y_train_fold, **fit_kwargs)
-            if verbose:
-                logger.info(f'fit fold {n_fold} with {time.time() - fold_start_at} seconds')
-            # print(fold_est.__class__)
-            # print(fold_est.evals_result_)
-            # print(f'fold {n_fold}, est:{fold_est.__class__},  best_n_estimators:{fold_est.best_n_estimators}')
+
+        # detect the categorical features once on the whole train set instead of scanning every fold,
+        # unless the folds are resampled
+        if isinstance(X, pd.DataFrame) and get_sampler(self.class_balancing) is None:
+            kwargs = {**categorical_features_kwargs(self.gbm_model, get_categorical_features(X)), **kwargs}
+
+        folds = list(iterators.split(X, y))
+        fold_n_jobs = max(1, min(fold_n_jobs, len(folds)))
+
+        def prepare_folds():
+            for n_fold, (train_idx, valid_idx) in enumerate(folds):
+                fold_est = copy.deepcopy(self.gbm_model)
+                fold_est.group_id = f'{fold_est.__class__.__name__}_cv_{n_fold}'
+                if fold_n_jobs > 1:
+                    _split_n_jobs(fold_est, fold_n_jobs)
+                fit_kwargs = {**kwargs, 'verbose': 0}
+                self._prepare_callbacks(fit_kwargs, fold_est, self.discriminator, skip_if_file)
+
+                yield n_fold, fold_est, X, y, train_idx, valid_idx, fit_kwargs
+
+        fit_options = dict(class_balancing=self.class_balancing, task=self.task, verbose=verbose)
+        if fold_n_jobs > 1:
+            if verbose > 0:
+                logger.info(f'fit {len(folds)} folds with fold_n_jobs={fold_n_jobs}, fold_backend={fold_backend}')
+            fold_results = Parallel(n_jobs=fold_n_jobs, prefer=fold_backend)(
+                delayed(_fit_fold)(*args, **fit_options) for args in prepare_folds())
+        else:
+            fold_results = (_fit_fold(*args, **fit_options) for args in prepare_folds())
+
+        for (fold_est, proba), (train_idx, valid_idx) in zip(fold_results, folds):
             if self.classes_ is None and hasattr(fold_est, 'classes_'):
                 self.classes_ = np.array(fold_est.classes_)
-            if self.task == const.TASK_REGRESSION:
-                proba = fold_est.predict(x_val_fold)
-            else:
-                proba = fold_est.predict_proba(x_val_fold)
 
+            y_val_fold = tb.select_1d(y, valid_idx)
             fold_scores = self.get_scores(y_val_fold, proba, metrics)
             oof_scores.append(fold_scores)
             oof_.append((valid_idx, proba))
@@ -295,6 +477,14 @@ class HyperGBMEstimator(Estimator):
             if pbar is not None:
                 pbar.update(1)
 
+            # abandon the trial if the mean score of the folds so far is unpromising,
+            # the folds fitted concurrently are finished all together, nothing to save
+            main_scores = [list(s.values())[0] for s in oof_scores]
+            self.cv_fold_trajectory_.append(float(np.mean(main_scores)))
+            if fold_n_jobs == 1 and len(oof_scores) < len(folds) \
+                    and not self._is_fold_promising(self.cv_fold_trajectory_, metrics[0]):
+                raise UnPromisingTrial(f'unpromising trial, mean scores of folds:{self.cv_fold_trajectory_}')
+
         logger.info(f'oof_scores:{oof_scores}')
         oof_ = tb.merge_oof(oof_)
         scores = self.get_scores(y, oof_, metrics)
@@ -302,6 +492,42 @@ class HyperGBMEstimator(Estimator):
             logger.info(f'taken {time.time() - starttime}s')
         return scores, oof_, oof_scores
 
+    def _is_fold_promising(self, fold_trajectory, metric):
+        """
+        Compare the mean score of the fitted folds with the ones of the previous succeeded trials at the same fold,
+        with the percentile of the discriminator. The direction is detected from the metric if possible.
+        """
+        discriminator = self.discriminator
+        if not cfg.cv_fold_discrimination_enabled \
+                or not isinstance(discriminator, BaseDiscriminator) or discriminator.history is None:
+            return True
+
+        if hasattr(discriminator, 'percentile'):
+            percentile = discriminator.percentile
+        elif getattr(discriminator, 'percentile_list', None):
+            percentile = discriminator.percentile_list[0]
+        else:
+            return True
+
+        n_step = len(fold_trajectory) - 1
+        trial_scores = get_previous_trials_scores(discriminator.history, n_step, n_step, _cv_folds_group_id)
+        if len(trial_scores) < max(discriminator.min_trials, 1):
+            return True
+
+        sign = 1 if discriminator.optimize_direction == 'max' else -1
+        if isinstance(metric, str):
+            try:
+                sign = get_tool_box(pd.DataFrame).metrics.metric_to_scoring(metric, task=self.task)._sign
+            except ValueError:
+                pass
+
+        percentile_score = get_percentile_score(discriminator.history, n_step, _cv_folds_group_id, percentile, sign)
+        promising = fold_trajectory[-1] * sign > percentile_score * sign
+        if not promising:
+            logger.info(f'fold {n_step}, mean score {fold_trajectory[-1]} is not better than '
+                        f'the {percentile} percentile {percentile_score} of previous trials')
+        return promising
+
     def get_scores(self, y, oof_, metrics):
         tb = get_tool_box(y)
         y, proba = tb.select_valid_oof(y, oof_)
@@ -318,6 +544,9 @@ class HyperGBMEstimator(Estimator):
 
     def get_iteration_scores(self):
         iteration_scores = {}
+        if self.__dict__.get('resumed_rounds_'):
+            # offset by the rounds of the init model, keep them out of the history of the discriminator
+            return iteration_scores
 
         def get_scores(gbm_model, iteration_scores, fold=None, ):
             if hasattr(gbm_model, 'iteration_scores'):
@@ -335,15 +564,32 @@ class HyperGBMEstimator(Estimator):
                 get_scores(gbm_model, iteration_scores, i)
         else:
             get_scores(self.gbm_model, iteration_scores)
+
+        if self.__dict__.get('cv_fold_trajectory_'):
+            iteration_scores[_cv_folds_group_id] = list(self.cv_fold_trajectory_)
         return iteration_scores
 
-    def fit(self, X, y, pos_label=None, skip_if_file=None, verbose=0, **kwargs):
+    def fit(self, X, y, pos_label=None, skip_if_file=None, verbose=0, sample_size=None, init_estimator=None,
+            **kwargs):
+        """
+        Fit the estimator.
+
+        :param sample_size: float (fraction) or int (number of rows), optional.
+            Fit the gbm model with a random sample of rows of the transformed train set, the data pipeline is
+            always fitted with the whole train set.
+        :param init_estimator: HyperGBMEstimator of the same space sample fitted before with the same train set,
+            optional. Continue boosting from its gbm model (`init_model` of LightGBM and CatBoost, `xgb_model` of
+            XGBoost) up to the rounds of this one rather than starting over, if the gbm model supports it.
+        """
         starttime = time.time()
         if verbose is None:
             verbose = 0
         if verbose > 0:
             logger.info('estimator is transforming the train set')
+        self.inference_plan_ = None
         X = self.fit_transform_data(X, y, verbose=verbose)
+        if sample_size is not None:
+            X, y = self._sample_rows(X, y, sample_size)
 
         eval_set = kwargs.pop('eval_set', None)
         kwargs = self.fit_kwargs
@@ -387,9 +633,35 @@ class HyperGBMEstimator(Estimator):
 
         fit_kwargs = {**kwargs, 'verbose': 0}
         self.gbm_model.group_id = f'{self.gbm_model.__class__.__name__}'
-        self._prepare_callbacks(fit_kwargs, self.gbm_model, self.discriminator, skip_if_file)
 
-        self.gbm_model.fit(X, y, **fit_kwargs)
+        n_estimators_key, n_estimators = None, None
+        self.resumed_rounds_ = 0
+        if init_estimator is not None:
+            resume_kwargs = self._resume_kwargs(init_estimator, X)
+            if resume_kwargs:
+                # the rounds of the init model are kept, boost the remaining ones only
+                n_estimators_key = get_n_estimators_param(self.gbm_model)
+                n_estimators = self.gbm_model.get_params(deep=False)[n_estimators_key]
+                boosted = get_boosted_rounds(init_estimator.gbm_model)
+                self.gbm_model.set_params(**{n_estimators_key: max(1, n_estimators - boosted)})
+                fit_kwargs.update(resume_kwargs)
+                self.resumed_rounds_ = boosted
+                if verbose > 0:
+                    logger.info(f'continue boosting from {boosted} rounds to {n_estimators}')
+
+        # the iteration scores of a resumed fit start from the rounds of the init model, which are not comparable
+        # with the ones of other trials, so it is not discriminated
+        discriminator = self.discriminator if not self.resumed_rounds_ else None
+        self._prepare_callbacks(fit_kwargs, self.gbm_model, discriminator, skip_if_file)
+
+        try:
+            self.gbm_model.fit(X, y, **fit_kwargs)
+        finally:
+            if n_estimators_key is not None:
+                try:
+                    self.gbm_model.set_params(**{n_estimators_key: n_estimators})
+                except Exception as e:  # CatBoost does not allow to change params of the fitted model
+                    logger.debug(f'failed to restore {n_estimators_key}: {e}')
 
         if self.classes_ is None and hasattr(self.gbm_model, 'classes_'):
             self.classes_ = self.gbm_model.classes_
@@ -398,6 +670,38 @@ class HyperGBMEstimator(Estimator):
         if verbose > 0:
             logger.info(f'taken {time.time() - starttime}s')
 
+    def _sample_rows(self, X, y, sample_size):
+        tb = get_tool_box(X, y)
+        n_rows = len(X)
+        if isinstance(sample_size, float):
+            sample_size = int(n_rows * sample_size)
+        if sample_size >= n_rows:
+            return X, y
+
+        stratify = y if self.task in (const.TASK_BINARY, const.TASK_MULTICLASS) else None
+        try:
+            X, _, y, _ = tb.train_test_split(X, y, train_size=sample_size, stratify=stratify, random_state=9527)
+        except ValueError:  # the least populated class has too few rows to stratify
+            X, _, y, _ = tb.train_test_split(X, y, train_size=sample_size, random_state=9527)
+        return X, y
+
+    def _resume_kwargs(self, init_estimator, X):
+        """
+        Get the fit kwargs to continue boosting from the gbm model of `init_estimator`, or an empty dict if it can
+        not be resumed.
+        """
+        init_model = init_estimator.gbm_model
+        if type(init_model) is not type(self.gbm_model) \
+                or get_n_estimators_param(self.gbm_model) is None or get_boosted_rounds(init_model) is None:
+            return {}
+        if init_estimator.pipeline_signature != self.pipeline_signature:
+            logger.info('the data pipeline of the init estimator is different, fit from scratch')
+            return {}
+        if getattr(init_model, 'n_features_in_', None) != X.shape[1]:
+            logger.info('the features of the init estimator are different, fit from scratch')
+            return {}
+        return resume_fit_kwargs(self.gbm_model, init_model)
+
     @staticmethod
     def _prepare_callbacks(fit_kwargs, est, discriminator, skip_if_file):
         if hasattr(est, 'build_discriminator_callback'):
@@ -412,37 +716,96 @@ class HyperGBMEstimator(Estimator):
             callbacks.append(FileMonitorCallback(skip_if_file))
             fit_kwargs['callbacks'] = callbacks
 
-    def predict(self, X, verbose=0, **kwargs):
+    def _predict_with_cv_models(self, X, method, fold_n_jobs=None):
+        models = self.cv_gbm_models_
+        if fold_n_jobs is None:
+            fold_n_jobs = cfg.cv_predict_n_jobs
+        if fold_n_jobs is None or fold_n_jobs <= 0:
+            fold_n_jobs = os.cpu_count()
+        fold_n_jobs = max(1, min(fold_n_jobs, len(models)))
+
+        if isinstance(X, pd.DataFrame) and hasattr(models[0], 'prepare_predict_X'):
+            # the fold models are fitted with the same features, reorder the columns once for all of them
+            X = models[0].prepare_predict_X(X)
+
+        if fold_n_jobs > 1 and isinstance(X, (pd.DataFrame, np.ndarray)):
+            # boosters release the GIL in prediction, reduce results in fold order to keep them deterministic.
+            # the threads of each booster are limited like fitting folds concurrently, or they oversubscribe the cpu
+            n_jobs = _get_n_jobs(self.gbm_model)
+            if n_jobs is not None:
+                n_jobs = max(1, n_jobs // fold_n_jobs)
+                calls = [predict_with_n_jobs(est, method, n_jobs) for est in models]
+            else:
+                calls = [getattr(est, method) for est in models]
+            with ThreadPoolExecutor(max_workers=fold_n_jobs) as executor:
+                futures = [executor.submit(call, X) for call in calls]
+                result = None
+                for future in futures:
+                    pred = future.result()
+                    if result is None:
+                        result = np.array(pred, dtype=np.result_type(pred.dtype, np.float32), copy=True)
+                    else:
+                        np.add(result, pred, out=result)
+            result /= len(models)
+        else:
+            pred_sum = None
+            for est in models:
+                pred = getattr(est, method)(X)
+                if pred_sum is None:
+                    pred_sum = pred
+                else:
+                    pred_sum += pred
+            result = pred_sum / len(models)
+
+        return result
+
+    def _predict_transformed(self, X, fold_n_jobs=None, **kwargs):
+        if self.cv_gbm_models_ is not None:
+            return self._predict_with_cv_models(X, 'predict', fold_n_jobs=fold_n_jobs)
+        else:
+            return self.gbm_model.predict(X, **kwargs)
+
+    def _predict_proba_transformed(self, X, fold_n_jobs=None):
+        if hasattr(self.gbm_model, 'predict_proba'):
+            method = 'predict_proba'
+        else:
+            method = 'predict'
+
+        if self.cv_gbm_models_ is not None:
+            return self._predict_with_cv_models(X, method, fold_n_jobs=fold_n_jobs)
+        else:
+            return getattr(self.gbm_model, method)(X)
+
+    def _proba_to_predict(self, proba):
+        preds = self.proba2predict(proba)
+        preds = get_tool_box(preds).take_array(np.array(self.classes_), preds, axis=0)
+        return preds
+
+    def predict(self, X, verbose=0, fold_n_jobs=None, **kwargs):
         starttime = time.time()
         if verbose is None:
             verbose = 0
 
-        if self.cv_gbm_models_ is not None:
-            if self.task == const.TASK_REGRESSION:
-                pred_sum = None
-                X = self.transform_data(X, verbose=verbose)
-                for est in self.cv_gbm_models_:
-                    pred = est.predict(X)
-                    if pred_sum is None:
-                        pred_sum = pred
-                    else:
-                        pred_sum += pred
-                preds = pred_sum / len(self.cv_gbm_models_)
-            else:
-                proba = self.predict_proba(X)
-                preds = self.proba2predict(proba)
-                preds = get_tool_box(preds).take_array(np.array(self.classes_), preds, axis=0)
+        if self.cv_gbm_models_ is not None and self.task != const.TASK_REGRESSION:
+            proba = self.predict_proba(X, verbose=verbose, fold_n_jobs=fold_n_jobs)
+            preds = self._proba_to_predict(proba)
         else:
             X = self.transform_data(X, verbose=verbose)
             if verbose > 0:
                 logger.info('estimator is predicting the data')
-            preds = self.gbm_model.predict(X, **kwargs)
+            preds = self._predict_transformed(X, fold_n_jobs=fold_n_jobs, **kwargs)
 
         if verbose > 0:
             logger.info(f'taken {time.time() - starttime}s')
         return preds
 
-    def predict_proba(self, X, verbose=0, **kwargs):
+    def predict_proba(self, X, verbose=0, fold_n_jobs=None, **kwargs):
+        """
+        Predict class probabilities of X.
+
+        :param fold_n_jobs: int or None, number of fold models to run prediction concurrently with threads if
+            the estimator was fitted with cross validation. Use `HyperGBMCfg.cv_predict_n_jobs` if None.
+        """
         starttime = time.time()
 
         if verbose is None:
@@ -450,39 +813,67 @@ class HyperGBMEstimator(Estimator):
         X = self.transform_data(X, verbose=verbose)
         if verbose > 0:
             logger.info('estimator is predicting the data')
-        if hasattr(self.gbm_model, 'predict_proba'):
-            method = 'predict_proba'
-        else:
-            method = 'predict'
+        proba = self._predict_proba_transformed(X, fold_n_jobs=fold_n_jobs)
 
-        if self.cv_gbm_models_ is not None:
-            proba_sum = None
-            for est in self.cv_gbm_models_:
-                proba = getattr(est, method)(X)
-                if proba_sum is None:
-                    proba_sum = proba
-                else:
-                    proba_sum += proba
-            proba = proba_sum / len(self.cv_gbm_models_)
+        if verbose > 0:
+            logger.info(f'taken {time.time() - starttime}s')
+        return proba
+
+    def predict_with_proba(self, X, verbose=0, fold_n_jobs=None, **kwargs):
+        """
+        Predict labels and class probabilities of X, the data is transformed once and the labels are derived from
+        the probabilities for classification.
+
+        :return: tuple of (preds, proba), proba is None for regression.
+        """
+        starttime = time.time()
+
+        if verbose is None:
+            verbose = 0
+        X = self.transform_data(X, verbose=verbose)
+        if verbose > 0:
+            logger.info('estimator is predicting the data')
+
+        if self.task == const.TASK_REGRESSION:
+            preds = self._predict_transformed(X, fold_n_jobs=fold_n_jobs, **kwargs)
+            proba = None
         else:
-            proba = getattr(self.gbm_model, method)(X)
+            proba = self._predict_proba_transformed(X, fold_n_jobs=fold_n_jobs)
+            if self.classes_ is not None:
+                preds = self._proba_to_predict(proba)
+            else:
+                preds = self._predict_transformed(X, fold_n_jobs=fold_n_jobs, **kwargs)
 
         if verbose > 0:
             logger.info(f'taken {time.time() - starttime}s')
-        return proba
+        return preds, proba
 
     def evaluate(self, X, y, metrics=None, verbose=0, **kwargs):
         if metrics is None:
             metrics = ['accuracy']
-        if self.task != const.TASK_REGRESSION:
-            proba = self.predict_proba(X, verbose=verbose)
-        else:
-            proba = None
-        preds = self.predict(X, verbose=verbose)
+        preds, proba = self.predict_with_proba(X, verbose=verbose)
         scores = get_tool_box(X).metrics.calc_score(y, preds, proba, metrics=metrics, task=self.task,
                                                     pos_label=self.pos_label, classes=self.classes_)
         return scores
 
+    def merge_cv_models(self):
+        """
+        Merge the fold models of cross validation into one native tree ensemble with the average raw score of them,
+        so prediction walks one forest in one native call instead of one call per fold model.
+
+        For regression the merged model predicts the same as the fold models; for classification the probabilities
+        are computed from the averaged raw scores rather than averaged from the fold models' probabilities.
+
+        :return: a copy of this estimator with the merged model as `gbm_model` and `cv_gbm_models_` set to None.
+        """
+        assert self.cv_gbm_models_ is not None, 'The estimator was not fitted with cross validation.'
+
+        merged = copy.copy(self)
+        merged.gbm_model = merge_models(self.cv_gbm_models_, self.task)
+        merged.cv_gbm_models_ = None
+        merged.transients_ = {}
+        return merged
+
     def save(self, model_file):
         with fs.open(f'{model_file}', 'wb') as output:
             pickle.dump(self, output, protocol=pickle.HIGHEST_PROTOCOL)
@@ -535,7 +926,8 @@ class HyperGBM(HyperModel):
         :param dispatcher: hypernets.core.Dispatcher
             Dispatcher is used to provide different execution modes for search trials,
             such as in process mode (`InProcessDispatcher`), distributed parallel mode (`DaskDispatcher`), etc.
-             `InProcessDispatcher` is used by default.
+             `InProcessDispatcher` is used by default, or `SuccessiveHalvingDispatcher` (multi-fidelity search)
+             if `HyperGBMCfg.successive_halving_enabled` is True.
         :param callbacks: list of callback functions or None, optional (default=None)
             List of callback functions that are applied at each trial. See `hypernets.callbacks` for more information.
         :param reward_metric: str or None, optinal(default=accuracy)
@@ -557,6 +949,10 @@ class HyperGBM(HyperModel):
         if callbacks is not None and any([isinstance(cb, ProgressiveCallback) for cb in callbacks]):
             callbacks = list(callbacks) + [FitCrossValidationCallback()]
 
+        if dispatcher is None and cfg.successive_halving_enabled:
+            from .successive_halving import SuccessiveHalvingDispatcher
+            dispatcher = SuccessiveHalvingDispatcher()
+
         HyperModel.__init__(self, searcher, dispatcher=dispatcher, callbacks=callbacks, reward_metric=reward_metric,
                             task=task, discriminator=discriminator)
 
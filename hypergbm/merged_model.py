@@ -0,0 +1,293 @@
+# -*- coding:utf-8 -*-
+"""
+Merge the fold models of cross validation into one native tree ensemble.
+
+The merged ensemble contains the trees of all fold models with leaf values scaled by 1/k, so its raw score (margin) is
+the average of the fold models' raw scores and prediction walks one forest in one native call. For regression this is
+exactly the average prediction of the fold models; for classification the probabilities are computed from the averaged
+raw scores, which differs slightly from averaging the fold models' probabilities.
+"""
+import json
+import math
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from hypernets.utils import logging, const
+
+logger = logging.get_logger(__name__)
+
+try:
+    import lightgbm
+except ImportError:
+    lightgbm = None
+
+try:
+    import xgboost
+except ImportError:
+    xgboost = None
+
+try:
+    import catboost
+except ImportError:
+    catboost = None
+
+_xgb_margin_links = {
+    'reg:squarederror': lambda v: v,
+    'reg:pseudohubererror': lambda v: v,
+    'reg:absoluteerror': lambda v: v,
+    'reg:logistic': lambda v: math.log(v / (1.0 - v)),
+    'binary:logistic': lambda v: math.log(v / (1.0 - v)),
+    'binary:logitraw': lambda v: math.log(v / (1.0 - v)),
+    'count:poisson': math.log,
+    'reg:gamma': math.log,
+    'reg:tweedie': math.log,
+}
+
+
+class MergedGBMModel:
+    """
+    Base class of the tree ensemble merged from fold models, subclasses hold the native booster.
+    """
+
+    def __init__(self, booster, task, classes=None, feature_names=None):
+        self.booster = booster
+        self.task = task
+        self.classes_ = classes
+        self.feature_names = feature_names
+
+    def prepare_predict_X(self, X):
+        from hypergbm.estimators import select_features
+
+        if self.feature_names is not None and hasattr(X, 'columns'):
+            X = select_features(self, X, self.feature_names)
+        return X
+
+    def _predict_native(self, X):
+        raise NotImplementedError()
+
+    @property
+    def predict_proba(self):
+        # not available for regression, so `hasattr(model, 'predict_proba')` tells it like the fold models
+        if self.task == const.TASK_REGRESSION:
+            raise AttributeError('predict_proba is not available for regression.')
+        return self._predict_proba
+
+    def _predict_proba(self, X, **kwargs):
+        X = self.prepare_predict_X(X)
+        proba = np.asarray(self._predict_native(X))
+        if proba.ndim == 1:
+            proba = np.stack([1 - proba, proba], axis=1)
+        return proba
+
+    def predict(self, X, **kwargs):
+        if self.task == const.TASK_REGRESSION:
+            X = self.prepare_predict_X(X)
+            return np.asarray(self._predict_native(X))
+
+        proba = self.predict_proba(X)
+        return np.array(self.classes_).take(np.argmax(proba, axis=1), axis=0)
+
+    @property
+    def n_trees(self):
+        raise NotImplementedError()
+
+
+class LightGBMMergedModel(MergedGBMModel):
+    def _predict_native(self, X):
+        return self.booster.predict(X)
+
+    @property
+    def n_trees(self):
+        return self.booster.num_trees()
+
+
+class XGBoostMergedModel(MergedGBMModel):
+    def _predict_native(self, X):
+        return self.booster.predict(xgboost.DMatrix(X))
+
+    @property
+    def n_trees(self):
+        return len(self.booster.get_dump())
+
+
+class CatBoostMergedModel(MergedGBMModel):
+    def _predict_native(self, X):
+        if self.task == const.TASK_REGRESSION:
+            return self.booster.predict(X)
+        proba = self.booster.predict(X, prediction_type='Probability')
+        if self.task == const.TASK_BINARY and proba.ndim == 2:
+            proba = proba[:, 1]
+        return proba
+
+    @property
+    def n_trees(self):
+        return self.booster.tree_count_
+
+
+def _merge_lightgbm(models):
+    k = len(models)
+    model_strs = [m.booster_.model_to_string() for m in models]  # saved at the best iteration if any
+
+    def split(s):
+        header, rest = s.split('\nTree=', 1)
+        trees, footer = ('Tree=' + rest).split('end of trees', 1)
+        blocks = [b.strip() for b in re.split(r'\n(?=Tree=\d+\n)', trees.strip()) if b.strip()]
+        return header, blocks, footer
+
+    parsed = [split(s) for s in model_strs]
+    header, _, footer = parsed[0]
+    header_lines = [line for line in header.strip().splitlines() if not line.startswith('tree_sizes=')]
+    keys = {line.split('=', 1)[0]: line for line in header_lines}
+    for h, _, _ in parsed[1:]:
+        for name in ('num_class', 'num_tree_per_iteration', 'objective', 'feature_names'):
+            if name in keys and keys[name] not in h:
+                raise ValueError(f'Failed to merge LightGBM models with different {name}.')
+
+    num_tree_per_iteration = int(keys['num_tree_per_iteration'].split('=', 1)[1])
+    average_output = 'average_output' in keys
+    n_iterations = [len(blocks) // num_tree_per_iteration for _, blocks, _ in parsed]
+
+    def scale_values(line, scale):
+        name, values = line.split('=', 1)
+        return f'{name}=' + ' '.join(repr(float(v) * scale) for v in values.split())
+
+    merged = []
+    for (_, blocks, _), n_iteration in zip(parsed, n_iterations):
+        # random forest averages the trees of the model by itself
+        scale = sum(n_iterations) / (k * n_iteration) if average_output else 1.0 / k
+        for block in blocks:
+            if re.search(r'^is_linear=1$', block, flags=re.M):
+                raise ValueError('Failed to merge LightGBM models with linear trees.')
+            lines = block.splitlines()
+            lines[0] = f'Tree={len(merged)}'
+            lines = [scale_values(line, scale) if line.startswith(('leaf_value=', 'internal_value=')) else line
+                     for line in lines]
+            merged.append('\n'.join(lines))
+
+    model_str = '\n'.join(header_lines) + '\n\n' + '\n\n'.join(merged) + '\n\nend of trees' + footer
+    booster = lightgbm.Booster(model_str=model_str)
+
+    return LightGBMMergedModel(booster, task=None, feature_names=list(models[0].booster_.feature_name()))
+
+
+def _xgb_booster_json(booster):
+    try:
+        return json.loads(bytes(booster.save_raw(raw_format='json')))
+    except TypeError:
+        # xgboost<1.6 can only save json model into file
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.json')
+            booster.save_model(path)
+            with open(path, 'r') as f:
+                return json.load(f)
+
+
+def _xgb_json_booster(model):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.json')
+        with open(path, 'w') as f:
+            json.dump(model, f)
+        booster = xgboost.Booster()
+        booster.load_model(path)
+    return booster
+
+
+def _merge_xgboost(models):
+    k = len(models)
+    boosters = []
+    for m in models:
+        booster = m.get_booster()
+        best_iteration = getattr(booster, 'best_iteration', None)
+        if best_iteration is not None:
+            booster = booster[:best_iteration + 1]
+        boosters.append(booster)
+
+    docs = [_xgb_booster_json(b) for b in boosters]
+    merged = docs[0]
+    learner = merged['learner']
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f'Failed to merge XGBoost models with booster "{learner["gradient_booster"]["name"]}".')
+    for doc in docs[1:]:
+        if doc['learner']['objective']['name'] != learner['objective']['name'] \
+                or doc['learner'].get('feature_names') != learner.get('feature_names'):
+            raise ValueError('Failed to merge XGBoost models with different objective or features.')
+
+    trees, tree_info, iteration_indptr = [], [], [0]
+    for doc in docs:
+        gbtree = doc['learner']['gradient_booster']['model']
+        for tree in gbtree['trees']:
+            tree['id'] = len(trees)
+            tree['base_weights'] = [w / k for w in tree['base_weights']]
+            tree['split_conditions'] = [v / k if left < 0 else v
+                                        for v, left in zip(tree['split_conditions'], tree['left_children'])]
+            trees.append(tree)
+        tree_info.extend(gbtree['tree_info'])
+        if 'iteration_indptr' in gbtree:
+            offset = iteration_indptr[-1]
+            iteration_indptr.extend(offset + p for p in gbtree['iteration_indptr'][1:])
+
+    # the average of base margins is not the base margin of the average if base scores differ among folds,
+    # append a single leaf tree with the difference.
+    base_scores = [float(str(doc['learner']['learner_model_param']['base_score']).strip('[]')) for doc in docs]
+    if len(set(base_scores)) > 1:
+        link = _xgb_margin_links.get(learner['objective']['name'])
+        if link is None or int(learner['learner_model_param'].get('num_class', '0')) > 1:
+            raise ValueError('Failed to merge XGBoost models with different base_score.')
+        bias = sum(map(link, base_scores)) / k - link(base_scores[0])
+        stump = dict(trees[0], id=len(trees), base_weights=[bias], categories=[], categories_nodes=[],
+                     categories_segments=[], categories_sizes=[], default_left=[False], left_children=[-1],
+                     loss_changes=[0.0], parents=[2147483647], right_children=[-1], split_conditions=[bias],
+                     split_indices=[0], split_type=[0], sum_hessian=[0.0],
+                     tree_param=dict(trees[0]['tree_param'], num_deleted='0', num_nodes='1'))
+        trees.append(stump)
+        tree_info.append(0)
+        iteration_indptr.append(iteration_indptr[-1] + 1)
+
+    gbtree = learner['gradient_booster']['model']
+    gbtree['trees'] = trees
+    gbtree['tree_info'] = tree_info
+    gbtree['gbtree_model_param']['num_trees'] = str(len(trees))
+    if 'iteration_indptr' in gbtree:
+        gbtree['iteration_indptr'] = iteration_indptr
+    learner['attributes'] = {}
+    booster = _xgb_json_booster(merged)
+
+    return XGBoostMergedModel(booster, task=None, feature_names=boosters[0].feature_names)
+
+
+def _merge_catboost(models):
+    k = len(models)
+    # the ctr tables of the folds differ, keep all of them rather than averaging the intersecting counters
+    merged = catboost.sum_models(models, weights=[1.0 / k] * k, ctr_merge_policy='KeepAllTables')
+    return CatBoostMergedModel(merged, task=None, feature_names=list(models[0].feature_names_))
+
+
+def merge_models(models, task):
+    """
+    Merge the fitted fold models into one tree ensemble with the average raw score.
+
+    :param models: list of fitted LightGBM, XGBoost or CatBoost estimators of the same kind.
+    :param task: task type, eg: 'binary', 'multiclass', 'regression'.
+    :return: MergedGBMModel
+    """
+    assert len(models) > 0, 'No model to merge.'
+
+    model = models[0]
+    if lightgbm is not None and isinstance(model, lightgbm.LGBMModel):
+        merged = _merge_lightgbm(models)
+    elif xgboost is not None and isinstance(model, xgboost.XGBModel):
+        merged = _merge_xgboost(models)
+    elif catboost is not None and isinstance(model, catboost.CatBoost):
+        merged = _merge_catboost(models)
+    else:
+        raise ValueError(f'Not supported model to merge: {type(model).__name__}')
+
+    merged.task = task
+    if task != const.TASK_REGRESSION:
+        merged.classes_ = getattr(model, 'classes_', None)
+    logger.info(f'merged {len(models)} {type(model).__name__} into {merged.n_trees} trees')
+
+    return merged
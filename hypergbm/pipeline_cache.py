@@ -0,0 +1,230 @@
+# -*- coding:utf-8 -*-
+"""
+Prefix cache of the fitted data pipeline steps, to reuse them across trials.
+
+Every step of each column group in the `DataFrameMapper` is cached with its output under the key of
+(fingerprint of the selected columns and y, params of the step and all its upstream steps), so a trial which shares
+the leading steps with a previous one resumes from the longest cached prefix instead of fitting all the steps.
+"""
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from sklearn import pipeline as sk_pipeline
+
+from hypernets.tabular import get_tool_box
+from hypernets.tabular.dataframe_mapper import DataFrameMapper, _call_fit
+from hypernets.utils import logging, context
+from .cfg import HyperGBMCfg as cfg
+from .utils.fingerprint import fingerprint, column_fingerprints
+
+logger = logging.get_logger(__name__)
+
+
+class PipelineCache:
+    """
+    LRU cache of fitted pipeline prefixes (the fitted steps from the first one) and their outputs with a memory limit.
+
+    The memory of a cached prefix is estimated by the memory usage of its output.
+    """
+
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.hits = 0
+        self.misses = 0
+
+        self._items = OrderedDict()  # key -> (fitted steps, output, nbytes)
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(prefix_key, step):
+        """
+        Make the cache key of `step` fitted with the output of the prefix of `prefix_key`.
+        """
+        hasher = get_tool_box(pd.DataFrame).data_hasher()
+        return hasher([prefix_key, f'{type(step).__module__}.{type(step).__qualname__}', step.get_params(deep=False)])
+
+    def get(self, key):
+        """
+        Get the cached (fitted steps, output) by key, or None if not found.
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[:2]
+
+    def put(self, key, steps, output):
+        nbytes = get_tool_box(pd.DataFrame).memory_usage(output)
+
+        with self._lock:
+            if nbytes > self.memory_limit or key in self._items.keys():
+                return
+
+            self._items[key] = (list(steps), output, nbytes)
+            self._size += nbytes
+            while self._size > self.memory_limit:
+                _, (_, _, evicted_nbytes) = self._items.popitem(last=False)
+                self._size -= evicted_nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._items)
+
+
+_cache = None
+
+
+def get_pipeline_cache():
+    """
+    Get the global pipeline cache, or None if `HyperGBMCfg.pipeline_cache_enabled` is False.
+    """
+    global _cache
+
+    if not cfg.pipeline_cache_enabled:
+        return None
+
+    memory_limit = cfg.pipeline_cache_memory_limit * 1024 * 1024
+    if _cache is None:
+        _cache = PipelineCache(memory_limit)
+    elif _cache.memory_limit != memory_limit:
+        logger.info(f'reset pipeline cache with memory limit {cfg.pipeline_cache_memory_limit}MB')
+        _cache = PipelineCache(memory_limit)
+
+    return _cache
+
+
+def _fit_transform_steps(cache, steps, Xt, y, key):
+    """
+    Fit and transform the steps (list of transformers) from the longest cached prefix.
+
+    :return: list of the fitted steps and the output.
+    """
+    keys = []
+    for step in steps:
+        key = cache.make_key(key, step)
+        keys.append(key)
+
+    fitted = list(steps)
+    start = 0
+    for i in range(len(steps), 0, -1):
+        item = cache.get(keys[i - 1])
+        if item is not None:
+            prefix, Xt = item
+            fitted[:i] = prefix
+            start = i
+            break
+
+    for i in range(start, len(steps)):
+        step = fitted[i]
+        if hasattr(step, 'fit_transform'):
+            Xt = _call_fit(step.fit_transform, Xt, y)
+        else:
+            Xt = _call_fit(step.fit, Xt, y).transform(Xt)
+        cache.put(keys[i], fitted[:i + 1], Xt)
+
+    return fitted, Xt
+
+
+def _fit_transform_mapper(cache, mapper, X, y):
+    columns_in = X.columns.to_list()
+    fitted_features = []
+    selected_columns = []
+    transformed_columns = []
+    extracted = []
+    y_key = fingerprint(y)
+    column_keys = column_fingerprints(X)
+
+    built_features, built_default = mapper._build(mapper.features, mapper.default)
+    for columns_def, transformers, options in built_features:
+        if callable(columns_def):
+            columns = columns_def(X)
+        elif isinstance(columns_def, str):
+            columns = [columns_def]
+        else:
+            columns = columns_def
+        if isinstance(columns, (list, tuple)) and len(set(selected_columns).intersection(set(columns))) > 0:
+            columns = [c for c in columns if c not in selected_columns]
+
+        if columns is None or len(columns) < 1:
+            continue
+
+        fitted_features.append((columns, transformers, options))
+        selected_columns += columns
+
+        input_df = options.get('input_df', mapper.input_df)
+        alias = options.get('alias')
+
+        Xt = mapper._get_col_subset(X, columns, input_df)
+        if transformers is not None:
+            with context(columns):
+                group_key = [y_key, [column_keys[c] for c in columns], input_df]
+                if isinstance(transformers, sk_pipeline.Pipeline):
+                    steps, Xt = _fit_transform_steps(cache, [s for _, s in transformers.steps], Xt, y, group_key)
+                    transformers.steps = [(name, s) for (name, _), s in zip(transformers.steps, steps)]
+                else:
+                    steps, Xt = _fit_transform_steps(cache, [transformers], Xt, y, group_key)
+                    transformers = steps[0]
+                    fitted_features[-1] = (columns, transformers, options)
+
+        extracted.append(mapper._fix_feature(Xt))
+        transformed_columns += mapper._get_names(columns, transformers, Xt, alias)
+
+    # handle features not explicitly selected
+    if built_default is not False and len(X.columns) > len(selected_columns):
+        unselected_columns = [c for c in X.columns.to_list() if c not in selected_columns]
+        Xt = mapper._get_col_subset(X, unselected_columns, mapper.input_df)
+        if built_default is not None:
+            with context(unselected_columns):
+                default_key = [y_key, [column_keys[c] for c in unselected_columns], mapper.input_df]
+                steps, Xt = _fit_transform_steps(cache, [built_default], Xt, y, default_key)
+                built_default = steps[0]
+            transformed_columns += mapper._get_names(unselected_columns, built_default, Xt)
+        else:
+            transformed_columns += unselected_columns
+        extracted.append(mapper._fix_feature(Xt))
+
+        fitted_features.append((unselected_columns, built_default, {}))
+
+    mapper.feature_names_in_ = columns_in
+    mapper.n_features_in_ = len(columns_in)
+    mapper.fitted_features_ = fitted_features
+
+    return mapper._to_transform_result(X, extracted, transformed_columns)
+
+
+def fit_transform_cached(pipeline, X, y):
+    """
+    Fit and transform the data pipeline, reuse the fitted steps in the pipeline cache.
+
+    :param pipeline: `DataFrameMapper`, or sklearn Pipeline of them.
+    :param X: pandas DataFrame.
+    :return: the transformed data, or None if the pipeline cache is disabled or the pipeline is not supported.
+    """
+    cache = get_pipeline_cache()
+    if cache is None or not isinstance(X, pd.DataFrame):
+        return None
+
+    if isinstance(pipeline, sk_pipeline.Pipeline):
+        mappers = [step for _, step in pipeline.steps]
+    else:
+        mappers = [pipeline]
+    if not all(type(m) is DataFrameMapper for m in mappers):
+        return None
+
+    for mapper in mappers:
+        X = _fit_transform_mapper(cache, mapper, X, y)
+
+    return X
@@ -8,7 +8,7 @@ from hypergbm.cfg import HyperGBMCfg as cfg
 from hypergbm.estimators import LightGBMEstimator, XGBoostEstimator, CatBoostEstimator, HistGBEstimator
 from hypergbm.sklearn.sklearn_ops import numeric_pipeline_simple, numeric_pipeline_complex, \
     categorical_pipeline_simple, categorical_pipeline_complex, \
-    datetime_pipeline_simple, text_pipeline_simple
+    datetime_pipeline_simple, text_pipeline_simple, dtype_downcast_pipeline
 from hypernets.core import randint
 from hypernets.core.ops import ModuleChoice, HyperInput
 from hypernets.core.search_space import HyperSpace, Choice, Int
@@ -105,6 +105,10 @@ class BaseSearchSpaceGenerator(SearchSpaceGenerator):
         preprocessor = DataFrameMapper(default=dataframe_mapper_default, input_df=True, df_out=True,
                                        df_out_dtype_transforms=[(column_object, 'int')])(pipelines)
 
+        # dtype downcasting
+        if cfg.dtype_downcast_enabled:
+            preprocessor = DataFrameMapper(input_df=True, df_out=True)([dtype_downcast_pipeline()(preprocessor)])
+
         return preprocessor
 
     def create_estimators(self, hyper_input, options):
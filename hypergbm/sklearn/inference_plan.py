@@ -0,0 +1,288 @@
+# -*- coding:utf-8 -*-
+"""
+Compile the fitted `DataFrameMapper` data pipeline into an inference plan, which applies the fitted parameters
+(imputer fill values, scaler means/scales, ordinal lookup tables) to the numpy block of each column group directly,
+without building the intermediate DataFrames of every transformer.
+"""
+import numpy as np
+import pandas as pd
+from sklearn import pipeline as sk_pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler, MinMaxScaler, MaxAbsScaler, RobustScaler
+
+from hypernets.tabular.dataframe_mapper import DataFrameMapper
+from hypernets.tabular.sklearn_ex import SafeOrdinalEncoder, FloatOutputImputer, LogStandardScaler, \
+    AsTypeTransformer
+from hypernets.utils import logging
+from .sklearn_ex import HashOrdinalEncoder, DtypeDowncaster
+
+logger = logging.get_logger(__name__)
+
+_DICT_LOOKUP_MAX_ROWS = 64
+
+
+def _is_nan(value):
+    return isinstance(value, float) and np.isnan(value)
+
+
+def _as_float(block):
+    return block if block.dtype.kind == 'f' else block.astype(np.float64)
+
+
+def _compile_imputer(step):
+    if getattr(step, 'add_indicator', False) or not _is_nan(step.missing_values):
+        raise ValueError('Only SimpleImputer of missing_values=np.nan without indicator is supported.')
+
+    statistics = step.statistics_
+    if statistics.dtype.kind == 'f' and np.isnan(statistics).any():
+        raise ValueError('SimpleImputer with empty features is not supported.')
+    float_output = isinstance(step, FloatOutputImputer)
+
+    def impute(block):
+        if block.dtype == object:
+            mask = block != block
+        else:
+            block = _as_float(block)
+            mask = np.isnan(block)
+        if mask.any():
+            block = np.where(mask, statistics, block)
+        if float_output:
+            block = block.astype(np.float64)
+        return block
+
+    return impute
+
+
+def _compile_ordinal_encoder(step):
+    dtype = step.dtype
+    tables = []
+    for categories in step.categories_:
+        index = pd.Index(categories)
+        table = dict(zip(categories, range(len(categories))))
+        tables.append((table, index if index.is_unique else None, len(categories)))
+
+    def encode(block):
+        result = np.empty(block.shape, dtype=dtype)
+        for i, (table, index, unseen) in enumerate(tables):
+            values = block[:, i]
+            if index is None or len(values) <= _DICT_LOOKUP_MAX_ROWS:
+                result[:, i] = [table.get(v, unseen) for v in values]
+            else:
+                codes = index.get_indexer(values)
+                codes[codes < 0] = unseen
+                result[:, i] = codes
+        return result
+
+    return encode
+
+
+def _compile_standard_scaler(step):
+    mean, scale = step.mean_, step.scale_
+
+    def scale_standard(block):
+        block = _as_float(block).copy()
+        if mean is not None and step.with_mean:
+            block -= mean
+        if scale is not None and step.with_std:
+            block /= scale
+        return block
+
+    return scale_standard
+
+
+def _compile_minmax_scaler(step):
+    scale, min_ = step.scale_, step.min_
+    clip = getattr(step, 'clip', False)
+    low, high = step.feature_range
+
+    def scale_minmax(block):
+        block = _as_float(block).copy()
+        block *= scale
+        block += min_
+        if clip:
+            np.clip(block, low, high, out=block)
+        return block
+
+    return scale_minmax
+
+
+def _compile_maxabs_scaler(step):
+    scale = step.scale_
+
+    def scale_maxabs(block):
+        block = _as_float(block).copy()
+        block /= scale
+        return block
+
+    return scale_maxabs
+
+
+def _compile_robust_scaler(step):
+    center, scale = step.center_, step.scale_
+
+    def scale_robust(block):
+        block = _as_float(block).copy()
+        if step.with_centering:
+            block -= center
+        if step.with_scaling:
+            block /= scale
+        return block
+
+    return scale_robust
+
+
+def _compile_log_standard_scaler(step):
+    min_values = np.asarray(step.X_min_values)
+    scale_standard = _compile_standard_scaler(step.scaler)
+
+    def scale_log_standard(block):
+        block = np.log(np.clip(block - min_values + 1, a_min=1, a_max=None))
+        return scale_standard(block)
+
+    return scale_log_standard
+
+
+def _compile_astype(step):
+    dtype = step.dtype
+
+    def astype(block):
+        if dtype in ('str', str):
+            return block.astype(str).astype(object)
+        return block.astype(dtype)
+
+    return astype
+
+
+def _compile_dtype_downcaster(step):
+    # the output dtypes are applied by the mapper plan, only clip the integers into the range of their dtypes
+    bounds = [(i, np.iinfo(step.dtypes_[c])) for i, c in enumerate(step.feature_names_in_)
+              if c in step.dtypes_ and step.dtypes_[c].kind in 'iu']
+
+    def downcast(block):
+        if bounds:
+            block = block.copy()
+            for i, info in bounds:
+                block[:, i] = np.clip(block[:, i], info.min, info.max)
+        return block
+
+    return downcast
+
+
+_compilers = [
+    (FloatOutputImputer, _compile_imputer),
+    (SimpleImputer, _compile_imputer),
+    (SafeOrdinalEncoder, _compile_ordinal_encoder),
+    (HashOrdinalEncoder, _compile_ordinal_encoder),
+    (StandardScaler, _compile_standard_scaler),
+    (MinMaxScaler, _compile_minmax_scaler),
+    (MaxAbsScaler, _compile_maxabs_scaler),
+    (RobustScaler, _compile_robust_scaler),
+    (LogStandardScaler, _compile_log_standard_scaler),
+    (AsTypeTransformer, _compile_astype),
+    (DtypeDowncaster, _compile_dtype_downcaster),
+]
+
+
+def _compile_transformer(transformer):
+    if transformer is None:
+        return []
+    if isinstance(transformer, sk_pipeline.Pipeline):
+        return [op for _, step in transformer.steps for op in _compile_transformer(step)]
+
+    for cls, compiler in _compilers:
+        if type(transformer) is cls:
+            return [compiler(transformer)]
+
+    raise ValueError(f'Not supported transformer in inference plan: {type(transformer).__name__}')
+
+
+class _MapperPlan:
+    def __init__(self, groups, columns, dtypes):
+        self.groups = groups  # list of (input columns, ops)
+        self.columns = columns
+        self.dtypes = dtypes
+
+    def transform(self, X):
+        data = {}
+        for input_columns, ops in self.groups:
+            # selecting columns one by one is much cheaper than X[input_columns] for small X
+            block = np.column_stack([X[c].to_numpy() for c in input_columns])
+            for op in ops:
+                block = op(block)
+            if block.ndim == 1:
+                block = block.reshape(-1, 1)
+            for j in range(block.shape[1]):
+                i = len(data)
+                if i >= len(self.columns):
+                    raise ValueError(f'Inference plan outputs more than {len(self.columns)} columns.')
+                data[self.columns[i]] = block[:, j].astype(self.dtypes[i], copy=False)
+
+        if len(data) != len(self.columns):
+            raise ValueError(f'Inference plan outputs {len(data)} columns, but {len(self.columns)} are expected.')
+
+        return pd.DataFrame(data, index=X.index, copy=False)
+
+
+class InferencePlan:
+    """
+    Compiled inference plan of the fitted data pipeline.
+
+    Use `InferencePlan.compile` to create it, then call `transform` in place of the data pipeline.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def transform(self, X):
+        for stage in self.stages:
+            X = stage.transform(X)
+        return X
+
+    @staticmethod
+    def compile(pipeline, X):
+        """
+        Compile the fitted data pipeline, and check the plan outputs the same result with the pipeline on `X`.
+
+        :param pipeline: fitted `DataFrameMapper`, or sklearn Pipeline of them.
+        :param X: pandas DataFrame, sample of the data to transform, used to get the output column names
+            and dtypes and to check the plan.
+        :return: InferencePlan. Raise ValueError if the pipeline contains any transformer not supported.
+        """
+        if isinstance(pipeline, sk_pipeline.Pipeline):
+            mappers = [step for _, step in pipeline.steps]
+        else:
+            mappers = [pipeline]
+
+        stages = []
+        Xt = X
+        for mapper in mappers:
+            if not isinstance(mapper, DataFrameMapper) or not mapper.df_out:
+                raise ValueError(f'Not supported pipeline in inference plan: {type(mapper).__name__}')
+
+            groups = [(list(columns), _compile_transformer(transformers))
+                      for columns, transformers, options in mapper.fitted_features_
+                      if columns is not None and len(columns) > 0 and not options]
+            if len(groups) != len(mapper.fitted_features_):
+                raise ValueError('Not supported feature options in inference plan.')
+
+            expected = mapper.transform(Xt)
+            stage = _MapperPlan(groups, expected.columns.to_list(), expected.dtypes.to_list())
+            transformed = stage.transform(Xt)
+            _check_equal(expected, transformed)
+
+            stages.append(stage)
+            Xt = expected
+
+        return InferencePlan(stages)
+
+
+def _check_equal(expected, transformed):
+    if expected.columns.to_list() != transformed.columns.to_list() \
+            or expected.dtypes.to_list() != transformed.dtypes.to_list():
+        raise ValueError('Inference plan outputs different columns or dtypes with the data pipeline.')
+
+    for c in expected.columns:
+        a, b = expected[c].to_numpy(), transformed[c].to_numpy()
+        equal = np.array_equal(a, b, equal_nan=True) if a.dtype.kind == 'f' else np.array_equal(a, b)
+        if not equal:
+            raise ValueError(f'Inference plan outputs different values with the data pipeline, column: {c}')
@@ -0,0 +1,221 @@
+# -*- coding:utf-8 -*-
+"""
+
+"""
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from hypernets.utils import logging
+
+logger = logging.get_logger(__name__)
+
+
+class HashOrdinalEncoder(BaseEstimator, TransformerMixin):
+    """
+    Ordinal encoder with a vectorized hash table per column, outputs the same codes with SafeOrdinalEncoder:
+    categories are sorted and unseen values (including missing values) are encoded as len(categories).
+
+    Categories are found with `pandas.unique` and values are looked up with the hash engine of `pandas.Index`,
+    so both fit and transform run in C instead of mapping values one by one in python, which matters for columns
+    with millions of distinct values. Categorical columns are encoded through their codes, only the categories
+    are looked up.
+
+    :param dtype: dtype of the output codes.
+    """
+
+    def __init__(self, dtype=np.int32):
+        self.dtype = dtype
+
+    @staticmethod
+    def _values(X):
+        if isinstance(X, pd.DataFrame):
+            return [X.iloc[:, i].array if isinstance(X.dtypes.iloc[i], pd.CategoricalDtype)
+                    else X.iloc[:, i].to_numpy()
+                    for i in range(X.shape[1])]
+        if not isinstance(X, np.ndarray):
+            raise TypeError("Unexpected type {}".format(type(X)))
+        return [X[:, i] for i in range(X.shape[1])]
+
+    @staticmethod
+    def _sorted_uniques(values):
+        if isinstance(values, pd.Categorical):
+            codes = pd.unique(values.codes)
+            uniques = values.categories.to_numpy()[np.sort(codes[codes >= 0])]
+        else:
+            uniques = pd.unique(values)
+        uniques = uniques[~pd.isnull(uniques)]
+        if uniques.dtype == object and pd.api.types.infer_dtype(uniques, skipna=False) == 'string':
+            # sort strings as fixed-width unicode in numpy, much faster than comparing python objects
+            return uniques[np.argsort(uniques.astype(str), kind='stable')]
+        return np.sort(uniques)
+
+    def fit(self, X, y=None):
+        categories = [self._sorted_uniques(values) for values in self._values(X)]
+
+        self.categories_ = categories
+        self.n_features_in_ = len(categories)
+        self._indexes = None
+        return self
+
+    def _get_indexes(self):
+        # the hash tables are built at the first lookup, and are not pickled
+        if getattr(self, '_indexes', None) is None:
+            self._indexes = [pd.Index(c) for c in self.categories_]
+        return self._indexes
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_indexes', None)
+        return state
+
+    def transform(self, X, y=None):
+        all_values = self._values(X)
+        assert len(all_values) == len(self.categories_)
+
+        result = []
+        for values, index in zip(all_values, self._get_indexes()):
+            if isinstance(values, pd.Categorical):
+                # lookup table of category codes, the last one is for missing values (code -1)
+                table = np.append(index.get_indexer(values.categories), -1)
+                table[table < 0] = len(index)
+                codes = table[values.codes]
+            else:
+                codes = index.get_indexer(values)
+                codes[codes < 0] = len(index)
+            result.append(codes.astype(self.dtype, copy=False))
+
+        if isinstance(X, pd.DataFrame):
+            return pd.DataFrame({c: result[i] for i, c in enumerate(X.columns)}, index=X.index)
+        else:
+            return np.stack(result, axis=1)
+
+    def inverse_transform(self, X):
+        if isinstance(X, pd.DataFrame):
+            all_codes = [X.iloc[:, i].to_numpy() for i in range(X.shape[1])]
+        else:
+            all_codes = [X[:, i] for i in range(X.shape[1])]
+
+        result = []
+        for codes, categories in zip(all_codes, self.categories_):
+            codes = np.asarray(codes, dtype=np.int64)
+            seen = (codes >= 0) & (codes < len(categories))
+            values = np.full(len(codes), None, dtype=object)
+            values[seen] = categories[codes[seen]]
+            result.append(values)
+
+        if isinstance(X, pd.DataFrame):
+            return pd.DataFrame({c: result[i] for i, c in enumerate(X.columns)}, index=X.index)
+        else:
+            return np.stack(result, axis=1)
+
+
+class DtypeDowncaster(BaseEstimator, TransformerMixin):
+    """
+    Downcast the numeric columns to save the memory of the data handed to the GBM estimators: float columns to
+    float32 and integer columns (e.g. ordinal codes) to the smallest integer type which holds [min, max + 1] of
+    the fitted data, the extra value leaves room for the code of unseen categories.
+
+    int8 is not used, the estimators detect categorical features from int16/int32/int64 columns only.
+
+    Integer values out of the range of the downcast type are clipped into it in transform. That never changes the
+    prediction of tree models, the split thresholds are within the fitted range so the clipped values go the same
+    way as the original ones.
+
+    A float column is kept as it is if float32 overflows on it, or loses more precision than `tolerance`. The
+    precision loss of every column on the fitted data is reported in `report_`.
+
+    :param tolerance: max relative error of float32 on the fitted data to downcast a float column.
+    """
+
+    _int_dtypes = [np.dtype(t) for t in ('int16', 'int32', 'int64')]
+    _uint_dtypes = [np.dtype(t) for t in ('uint8', 'uint16', 'uint32', 'uint64')]
+
+    def __init__(self, tolerance=1e-6):
+        self.tolerance = tolerance
+
+    @staticmethod
+    def _float_error(values):
+        downcast = values.astype(np.float32).astype(np.float64)
+        finite = np.isfinite(values)
+        overflow = int(np.count_nonzero(finite & ~np.isfinite(downcast)))
+        if overflow > 0 or not finite.any():
+            return overflow, 0.0, 0.0
+        error = np.abs(downcast[finite] - values[finite])
+        magnitude = np.abs(values[finite])
+        nonzero = magnitude > 0
+        max_abs_error = float(error.max())
+        max_rel_error = float((error[nonzero] / magnitude[nonzero]).max()) if nonzero.any() else 0.0
+        return overflow, max_abs_error, max_rel_error
+
+    def _int_dtype(self, values):
+        if len(values) == 0:
+            return values.dtype
+        low, high = int(values.min()), int(values.max()) + 1
+        candidates = self._uint_dtypes if values.dtype.kind == 'u' else self._int_dtypes
+        for dtype in candidates:
+            if dtype.itemsize >= values.dtype.itemsize:
+                break
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return dtype
+        return values.dtype
+
+    def fit(self, X, y=None):
+        assert isinstance(X, pd.DataFrame)
+
+        dtypes = {}
+        report = []
+        for c in X.columns:
+            dtype = X[c].dtype
+            if not isinstance(dtype, np.dtype) or dtype.kind not in 'iuf':
+                continue
+            values = X[c].to_numpy()
+            overflow, max_abs_error, max_rel_error = 0, 0.0, 0.0
+            if dtype.kind == 'f':
+                if dtype.itemsize <= 4:
+                    continue
+                overflow, max_abs_error, max_rel_error = self._float_error(values)
+                downcast = np.dtype(np.float32) if overflow == 0 and max_rel_error <= self.tolerance else dtype
+            else:
+                downcast = self._int_dtype(values)
+            if downcast != dtype:
+                dtypes[c] = downcast
+            report.append((c, str(dtype), str(downcast), overflow, max_abs_error, max_rel_error))
+
+        self.feature_names_in_ = X.columns.to_list()
+        self.dtypes_ = dtypes
+        self.report_ = pd.DataFrame(report, columns=['column', 'dtype', 'downcast_dtype', 'overflow',
+                                                     'max_abs_error', 'max_rel_error']).set_index('column')
+
+        kept = self.report_[self.report_['dtype'] == self.report_['downcast_dtype']]
+        kept = kept[(kept['overflow'] > 0) | (kept['max_rel_error'] > self.tolerance)]
+        if len(kept) > 0:
+            logger.warning(f'keep float64 for columns with precision loss of float32: {kept.index.tolist()}')
+        if len(dtypes) > 0:
+            nbytes = sum(X[c].to_numpy().nbytes for c in dtypes.keys())
+            downcast_nbytes = sum(len(X) * dtype.itemsize for dtype in dtypes.values())
+            logger.info(f'downcast {len(dtypes)} columns, {nbytes / 1024 / 1024:.1f}MB to '
+                        f'{downcast_nbytes / 1024 / 1024:.1f}MB, max relative error of float32: '
+                        f'{self.report_["max_rel_error"].max():.3g}')
+        return self
+
+    def transform(self, X, y=None):
+        assert isinstance(X, pd.DataFrame)
+
+        if not self.dtypes_:
+            return X
+
+        data = {}
+        for i, c in enumerate(X.columns):
+            series = X.iloc[:, i]
+            dtype = self.dtypes_.get(c)
+            if dtype is None:
+                data[c] = series
+            elif dtype.kind in 'iu':
+                info = np.iinfo(dtype)
+                data[c] = np.clip(series.to_numpy(), info.min, info.max).astype(dtype)
+            else:
+                data[c] = series.to_numpy().astype(dtype)
+
+        return pd.DataFrame(data, index=X.index, columns=X.columns)
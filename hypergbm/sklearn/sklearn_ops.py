@@ -11,12 +11,17 @@ from hypernets.pipeline.transformers import SimpleImputer, SafeOneHotEncoder, Tr
     StandardScaler, MinMaxScaler, MaxAbsScaler, RobustScaler, SafeOrdinalEncoder, \
     LogStandardScaler, DatetimeEncoder, TfidfEncoder, AsTypeTransformer
 from hypernets.tabular import column_selector
+from .transformers import HashOrdinalEncoder, DtypeDowncaster
 
 
 def categorical_pipeline_simple(impute_strategy='constant', seq_no=0):
+    if cfg.category_pipeline_encoder == 'hash':
+        label_encoder = HashOrdinalEncoder(name=f'categorical_label_encoder_{seq_no}', dtype='int32')
+    else:
+        label_encoder = SafeOrdinalEncoder(name=f'categorical_label_encoder_{seq_no}', dtype='int32')
     steps = [
         SimpleImputer(missing_values=np.nan, strategy=impute_strategy, name=f'categorical_imputer_{seq_no}'),
-        SafeOrdinalEncoder(name=f'categorical_label_encoder_{seq_no}', dtype='int32')
+        label_encoder
     ]
     if cfg.category_pipeline_auto_detect:
         cs = column_selector.AutoCategoryColumnSelector(
@@ -128,3 +133,13 @@ def text_pipeline_simple(impute_strategy='constant', svd_components=3, seq_no=0)
         name=f'a_text_pipeline_simple_{seq_no}',
     )
     return pipeline
+
+
+def dtype_downcast_pipeline(seq_no=0):
+    pipeline = Pipeline([
+        DtypeDowncaster(tolerance=cfg.dtype_downcast_tolerance, name=f'dtype_downcaster_{seq_no}'),
+    ],
+        columns=column_selector.column_all,
+        name=f'dtype_downcast_pipeline_{seq_no}',
+    )
+    return pipeline
@@ -0,0 +1,24 @@
+# -*- coding:utf-8 -*-
+"""
+
+"""
+import numpy as np
+
+from hypernets.pipeline.base import HyperTransformer
+from . import sklearn_ex
+
+
+class HashOrdinalEncoder(HyperTransformer):
+    def __init__(self, dtype=np.int32, space=None, name=None, **kwargs):
+        if dtype is not None and dtype is not True:
+            kwargs['dtype'] = dtype
+
+        HyperTransformer.__init__(self, sklearn_ex.HashOrdinalEncoder, space, name, **kwargs)
+
+
+class DtypeDowncaster(HyperTransformer):
+    def __init__(self, tolerance=1e-6, space=None, name=None, **kwargs):
+        if tolerance is not None and tolerance != 1e-6:
+            kwargs['tolerance'] = tolerance
+
+        HyperTransformer.__init__(self, sklearn_ex.DtypeDowncaster, space, name, **kwargs)
@@ -0,0 +1,245 @@
+# -*- coding:utf-8 -*-
+"""
+Multi-fidelity search of HyperGBM with successive halving over the number of rows and boosting rounds.
+"""
+import copy
+import gc
+import math
+import time
+
+from hypernets.core.callbacks import EarlyStoppingCallback, EarlyStoppingError
+from hypernets.core.dispatcher import Dispatcher
+from hypernets.core.searcher import OptimizeDirection
+from hypernets.core.trial import Trial
+from hypernets.dispatchers.cfg import DispatchCfg
+from hypernets.tabular import get_tool_box
+from hypernets.utils import logging, fs
+from .cfg import HyperGBMCfg as cfg
+from .estimators import get_n_estimators_param
+
+logger = logging.get_logger(__name__)
+
+
+class SuccessiveHalvingDispatcher(Dispatcher):
+    """
+    Dispatcher which runs the search of HyperGBM with successive halving.
+
+    `max_trials` space samples are fitted with a small fraction of rows and boosting rounds in the first rung, the
+    top `1/eta` of them are promoted to the next rung with `eta` times rows and rounds, and so on. The gbm models of
+    a promoted sample continue boosting from the ones of the previous rung (`init_model` of LightGBM and CatBoost,
+    `xgb_model` of XGBoost) rather than starting over. The samples promoted to the last rung run as normal trials
+    with the whole train set (and cross validation if `cv` is True), the eliminated ones are recorded in the history
+    as failed trials just like the unpromising ones.
+
+    The `EarlyStoppingCallback` of the search is checked between the fits of the partial rungs too: a rung stops
+    fitting more samples once `max_no_improvement_trials` of them do not improve the best reward of the rung, and the
+    partial rungs stop once `time_limit` is exceeded, then only the best sample so far runs as a normal trial.
+
+    :param models_dir: str, directory to save the models of trials, default is "models" under the work dir of
+        `hypernets.dispatchers.cfg.DispatchCfg`.
+    :param eta: int, reduction factor of the samples between rungs, default is `HyperGBMCfg.successive_halving_eta`.
+    :param n_rungs: int, number of rungs including the last one with the whole data,
+        default is `HyperGBMCfg.successive_halving_rungs`.
+    :param eval_size: float, fraction of the train set to hold out to score the samples of the partial rungs if no
+        eval set is given or `cv` is True, default is `HyperGBMCfg.successive_halving_eval_size`.
+    """
+
+    def __init__(self, models_dir=None, eta=None, n_rungs=None, eval_size=None):
+        super(SuccessiveHalvingDispatcher, self).__init__()
+
+        if models_dir is None:
+            experiment = DispatchCfg.experiment or f'experiment_{time.strftime("%Y%m%d%H%M%S")}'
+            models_dir = f'{DispatchCfg.work_dir or experiment}/models'
+        self.models_dir = models_dir
+        self.eta = eta if eta is not None else cfg.successive_halving_eta
+        self.n_rungs = n_rungs if n_rungs is not None else cfg.successive_halving_rungs
+        self.eval_size = eval_size if eval_size is not None else cfg.successive_halving_eval_size
+        assert self.eta >= 2 and self.n_rungs >= 1
+        fs.makedirs(models_dir, exist_ok=True)
+
+    def fractions(self):
+        """
+        Fractions of the rows and boosting rounds of each rung.
+        """
+        return [self.eta ** (i - self.n_rungs + 1) for i in range(self.n_rungs)]
+
+    def dispatch(self, hyper_model, X, y, X_eval, y_eval, cv, num_folds, max_trials, dataset_id, trial_store,
+                 **fit_kwargs):
+        # the partial rungs are scored with the eval set, or a part held out of the train set
+        if X_eval is None or y_eval is None or cv:
+            tb = get_tool_box(X, y)
+            X_fit, X_score, y_fit, y_score = \
+                tb.train_test_split(X, y, test_size=self.eval_size, random_state=9527)
+            resumable = False
+        else:
+            X_fit, y_fit, X_score, y_score = X, y, X_eval, y_eval
+            resumable = True
+
+        stoppers = [c for c in hyper_model.callbacks if isinstance(c, EarlyStoppingCallback)]
+        for stopper in stoppers:
+            if stopper.start_time is None:
+                stopper.start_time = time.time()
+
+        samples = self._sample(hyper_model, max_trials)
+        candidates = [(trial_no, space_sample, None, None) for trial_no, space_sample in samples]
+        fractions = self.fractions()
+        for rung, fraction in enumerate(fractions[:-1]):
+            start_at = time.time()
+            fitted, reason = self._fit_rung(hyper_model, stoppers, candidates, fraction,
+                                            X_fit, y_fit, X_score, y_score, **fit_kwargs)
+            # the samples not fitted in this rung are eliminated with the reward of the previous rung if any
+            eliminated = [c for c in candidates[len(fitted):] if c[3] is not None]
+            if reason == EarlyStoppingCallback.REASON_TIME_LIMIT:
+                n_promoted = 1
+            else:
+                n_promoted = max(1, math.ceil(len(fitted) / self.eta))
+            promoted, rejected = self._top(hyper_model, fitted, n_promoted)
+            eliminated = rejected + eliminated
+            for trial_no, space_sample, _, reward in eliminated:
+                self._eliminate(hyper_model, trial_no, space_sample, reward)
+            candidates = promoted
+            logger.info(f'rung {rung} with fraction {fraction:.4f}: promoted {len(promoted)} of '
+                        f'{len(promoted) + len(eliminated)} samples, taken {time.time() - start_at}s')
+
+            if reason == EarlyStoppingCallback.REASON_TIME_LIMIT:
+                for stopper in stoppers:
+                    stopper.triggered = True
+                    stopper.triggered_reason = reason
+                logger.info(f'Early stopping in rung {rung}, reason: {reason}, run the best sample only.')
+                break
+
+        try:
+            for trial_no, space_sample, init_estimator, _ in candidates:
+                gc.collect()
+                kwargs = fit_kwargs
+                if init_estimator is not None and resumable:
+                    kwargs = {**fit_kwargs, 'init_estimator': init_estimator}
+                self._run_trial(hyper_model, trial_no, space_sample, X, y, X_eval, y_eval, cv, num_folds,
+                                dataset_id, trial_store, **kwargs)
+        except EarlyStoppingError:
+            pass
+
+        return len(samples) + 1
+
+    def _sample(self, hyper_model, max_trials):
+        samples = []
+        vectors = []
+        retry_counter = 0
+        while len(samples) < max_trials and retry_counter < DispatchCfg.trial_retry_limit:
+            space_sample = hyper_model.searcher.sample()
+            if hyper_model.history.is_existed(space_sample) or space_sample.vectors in vectors:
+                retry_counter += 1
+                continue
+            retry_counter = 0
+            vectors.append(space_sample.vectors)
+            samples.append((len(samples) + 1, space_sample))
+
+        if len(samples) < max_trials:
+            logger.info(f'Unable to take valid sample and exceed the retry limit {DispatchCfg.trial_retry_limit}.')
+        return samples
+
+    def _fit_rung(self, hyper_model, stoppers, candidates, fraction, X, y, X_eval, y_eval, **fit_kwargs):
+        """
+        Fit the candidates of a partial rung one by one until any of the early stopping callbacks is triggered.
+
+        :return: tuple of the fitted candidates and the triggered reason (None if not triggered).
+        """
+        fitted = []
+        best_rewards = [None] * len(stoppers)
+        no_improvements = [0] * len(stoppers)
+        for trial_no, space_sample, init_estimator, _ in candidates:
+            candidate = self._fit_partial(hyper_model, trial_no, space_sample, init_estimator, fraction,
+                                          X, y, X_eval, y_eval, **fit_kwargs)
+            fitted.append(candidate)
+            reward = candidate[3]
+
+            for i, stopper in enumerate(stoppers):
+                if stopper.time_limit is not None and stopper.time_limit > 0 \
+                        and time.time() - stopper.start_time > stopper.time_limit:
+                    return fitted, EarlyStoppingCallback.REASON_TIME_LIMIT
+
+                if stopper.max_no_improvement_trials is not None and stopper.max_no_improvement_trials > 0:
+                    if reward is not None and \
+                            (best_rewards[i] is None or stopper.op(reward, best_rewards[i] - stopper.min_delta)):
+                        best_rewards[i] = reward
+                        no_improvements[i] = 0
+                    else:
+                        no_improvements[i] += 1
+                        if no_improvements[i] >= stopper.max_no_improvement_trials:
+                            return fitted, EarlyStoppingCallback.REASON_TRIAL_LIMIT
+
+        return fitted, None
+
+    def _fit_partial(self, hyper_model, trial_no, space_sample, init_estimator, fraction,
+                     X, y, X_eval, y_eval, **fit_kwargs):
+        """
+        Fit the space sample with the fraction of rows and boosting rounds.
+
+        :return: tuple of trial_no, space_sample, estimator (None if failed) and reward (None if failed).
+        """
+        try:
+            estimator = hyper_model._get_estimator(space_sample)
+            # the gbm model is shared by the estimators of the space sample, keep it untouched for the last rung
+            estimator.gbm_model = copy.deepcopy(estimator.gbm_model)
+            key = get_n_estimators_param(estimator.gbm_model)
+            if key is not None:
+                n_estimators = estimator.gbm_model.get_params(deep=False)[key]
+                estimator.gbm_model.set_params(**{key: max(1, int(math.ceil(n_estimators * fraction)))})
+            estimator.fit(X, y, sample_size=fraction, init_estimator=init_estimator, **fit_kwargs)
+            scores = estimator.evaluate(X_eval, y_eval, metrics=[hyper_model.reward_metric], **fit_kwargs)
+            reward = hyper_model._get_reward(scores, hyper_model.reward_metric)
+            return trial_no, space_sample, estimator, reward
+        except Exception as e:
+            logger.warning(f'trial {trial_no} failed in fraction {fraction:.4f}: {e}')
+            return trial_no, space_sample, None, None
+
+    @staticmethod
+    def _top(hyper_model, candidates, n):
+        maximize = hyper_model.searcher.optimize_direction in ['max', OptimizeDirection.Maximize]
+        succeeded = [c for c in candidates if c[3] is not None]
+        succeeded = sorted(succeeded, key=lambda c: c[3], reverse=maximize)
+        top = succeeded[:n]
+        top_ids = set(id(c) for c in top)
+        return top, [c for c in candidates if id(c) not in top_ids]
+
+    @staticmethod
+    def _eliminate(hyper_model, trial_no, space_sample, reward):
+        for callback in hyper_model.callbacks:
+            callback.on_trial_begin(hyper_model, space_sample, trial_no)
+
+        trial = Trial(space_sample, trial_no, 0, 0, succeeded=False)
+        trial.memo['successive_halving_reward'] = reward
+        hyper_model.history.append(trial)
+
+        # update the searcher with the reward of the partial rung
+        if reward is None:
+            worst = hyper_model.history.get_worst()
+            reward = worst.reward if worst is not None else None
+        if reward is not None:
+            hyper_model.searcher.update_result(space_sample, reward)
+
+        for callback in hyper_model.callbacks:
+            callback.on_trial_error(hyper_model, space_sample, trial_no)
+
+    def _run_trial(self, hyper_model, trial_no, space_sample, X, y, X_eval, y_eval, cv, num_folds,
+                   dataset_id, trial_store, **fit_kwargs):
+        for callback in hyper_model.callbacks:
+            callback.on_trial_begin(hyper_model, space_sample, trial_no)
+
+        model_file = '%s/%05d_%s.pkl' % (self.models_dir, trial_no, space_sample.space_id)
+        trial = hyper_model._run_trial(space_sample, trial_no, X, y, X_eval, y_eval, cv, num_folds, model_file,
+                                       **fit_kwargs)
+
+        improved = hyper_model.history.append(trial)
+        if trial.succeeded:
+            for callback in hyper_model.callbacks:
+                callback.on_trial_end(hyper_model, space_sample, trial_no, trial.reward, improved, trial.elapsed)
+        else:
+            for callback in hyper_model.callbacks:
+                callback.on_trial_error(hyper_model, space_sample, trial_no)
+
+        if logger.is_info_enabled():
+            logger.info(f'Trial {trial_no} done, reward: {trial.reward}, '
+                        f'best_trial_no:{hyper_model.best_trial_no}, best_reward:{hyper_model.best_reward}\n')
+        if trial_store is not None:
+            trial_store.put(dataset_id, trial)
@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from hypergbm.utils import arrow_io
+
+
+class Test_ArrowIO:
+    def test_read_parquet(self):
+        rng = np.random.RandomState(9527)
+        df = pd.DataFrame({'a': rng.rand(100),
+                           'b': rng.randint(0, 10, 100),
+                           'c': rng.choice(['x', 'y', 'z'], 100).astype(object),
+                           })
+        df.loc[:4, 'c'] = None
+        data_dir = tempfile.mkdtemp()
+        df.iloc[:60].to_parquet(os.path.join(data_dir, 'part_0.parquet'))
+        df.iloc[60:].to_parquet(os.path.join(data_dir, 'part_1.parquet'))
+
+        for path in [os.path.join(data_dir, 'part_0.parquet'), data_dir, os.path.join(data_dir, '*.parquet')]:
+            assert arrow_io.is_parquet(path)
+            loaded = arrow_io.read_parquet(path)
+            expected = df.iloc[:len(loaded)].reset_index(drop=True)
+
+            assert loaded.columns.tolist() == ['a', 'b', 'c']
+            assert isinstance(loaded['c'].dtype, pd.CategoricalDtype)
+            assert loaded['c'].isnull().sum() == 5
+            assert (loaded['c'].astype(object).fillna('') == expected['c'].fillna('')).all()
+            assert (loaded[['a', 'b']] == expected[['a', 'b']]).all().all()
+        assert len(arrow_io.read_parquet(data_dir)) == 100
+
+        stats = arrow_io.LoadStats()
+        loaded = arrow_io.load_data(data_dir, stats=stats)
+        assert loaded['c'].dtype.name == 'category'
+        assert stats.seconds > 0 and stats.result_bytes > 0
+
+        csv_path = os.path.join(data_dir, 'data.csv')
+        df.to_csv(csv_path, index=False)
+        assert not arrow_io.is_parquet(csv_path)
+        assert arrow_io.load_data(csv_path)['c'].dtype == object
+
+    def test_read_parquet_with_index(self):
+        df = pd.DataFrame({'a': np.arange(10, dtype='float64'), 'c': list('xyxyxyxyxy')},
+                          index=pd.Index(np.arange(100, 110), name='id'))
+        data_dir = tempfile.mkdtemp()
+        df.iloc[:6].to_parquet(os.path.join(data_dir, 'part_0.parquet'))
+        df.iloc[6:].rename_axis(None).to_parquet(os.path.join(data_dir, 'part_1.parquet'))  # __index_level_0__
+        df.reset_index(drop=True).to_parquet(os.path.join(data_dir, 'part_2.parquet'))
+
+        for path in [os.path.join(data_dir, 'part_0.parquet'), os.path.join(data_dir, 'part_*.parquet')]:
+            loaded = arrow_io.read_parquet(path)
+            assert loaded.columns.tolist() == ['a', 'c']
+            assert isinstance(loaded.index, pd.RangeIndex)
+        assert len(arrow_io.read_parquet(os.path.join(data_dir, 'part_*.parquet'))) == 20
+        assert arrow_io.read_parquet(os.path.join(data_dir, 'part_0.parquet'), columns=['a']).columns.tolist() == ['a']
@@ -2,6 +2,8 @@
 """
 
 """
+import os
+
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
@@ -10,6 +12,7 @@ from sklearn.model_selection import train_test_split
 from hypergbm import HyperGBMEstimator
 from hypergbm.estimators import LightGBMEstimator, XGBoostEstimator
 from hypergbm.search_space import search_space_general
+from hypergbm.tests import test_output_dir
 from hypergbm.sklearn.sklearn_ops import categorical_pipeline_simple, numeric_pipeline_simple, \
     categorical_pipeline_complex, numeric_pipeline_complex
 from hypernets.core.ops import HyperInput, Choice, ModuleChoice
@@ -179,3 +182,753 @@ class Test_Estimator():
         df_1 = estimator.data_pipeline.fit_transform(X, y)
         assert list(df_1.columns) == ['a', 'e', 'f', 'b', 'c', 'd', 'l']
         assert df_1.shape == (3, 7)
+
+    def test_fit_cross_validation_fold_n_jobs(self):
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        def run_cv(**kwargs):
+            set_random_state(9527)
+            space = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=50)()
+            space.random_sample()
+            estimator = HyperGBMEstimator('binary', space)
+            result = estimator.fit_cross_validation(df, y, num_folds=3, metrics=['auc'], **kwargs)
+            return estimator, result
+
+        est_seq, (scores_seq, oof_seq, oof_scores_seq) = run_cv(fold_n_jobs=1)
+        est_par, (scores_par, oof_par, oof_scores_par) = run_cv(fold_n_jobs=3, fold_backend='threads')
+
+        assert len(est_par.cv_gbm_models_) == 3
+        assert [m.group_id for m in est_par.cv_gbm_models_] == [m.group_id for m in est_seq.cv_gbm_models_]
+        assert all(m.n_jobs >= 1 for m in est_par.cv_gbm_models_)
+        assert np.allclose(oof_seq, oof_par, atol=1e-3)
+        assert len(oof_scores_par) == len(oof_scores_seq)
+        for s1, s2 in zip(oof_scores_seq, oof_scores_par):
+            assert abs(s1['auc'] - s2['auc']) < 1e-3
+
+        proba_seq = est_par.predict_proba(df, fold_n_jobs=1)
+        proba_par = est_par.predict_proba(df, fold_n_jobs=3)
+        assert proba_par.dtype == proba_seq.dtype
+        assert np.allclose(proba_seq, proba_par)
+        assert (est_par.predict(df, fold_n_jobs=3) == est_par.predict(df, fold_n_jobs=1)).all()
+
+    def test_predict_with_n_jobs(self):
+        import json
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypergbm.estimators import predict_with_n_jobs
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        for name in ['lightgbm', 'xgb', 'catboost']:
+            set_random_state(9527)
+            space = GeneralSearchSpaceGenerator(enable_lightgbm=name == 'lightgbm', enable_xgb=name == 'xgb',
+                                                enable_catboost=name == 'catboost', n_estimators=20)()
+            space.random_sample()
+            estimator = HyperGBMEstimator('binary', space)
+            estimator.fit_cross_validation(df, y, num_folds=3, metrics=['auc'], fold_n_jobs=1)
+            X = estimator.transform_data(df)
+
+            model = estimator.cv_gbm_models_[0]
+            expected = model.predict_proba(X)
+            if name == 'xgb':
+                model.set_params(n_jobs=2)
+            assert np.allclose(predict_with_n_jobs(model, 'predict_proba', 1)(X), expected)
+            if name == 'xgb':  # threads of the booster are reset
+                config = json.loads(model.get_booster().save_config())
+                assert int(config['learner']['generic_param']['nthread']) == 2
+
+            # the boosters predicting concurrently share the cpu cores
+            n_jobs = []
+            for m in estimator.cv_gbm_models_:
+                def predict_proba(X_, m=m, **kwargs):
+                    n_jobs.append(kwargs.get('thread_count', kwargs.get('num_threads')))
+                    return type(m).predict_proba(m, X_, **kwargs)
+
+                m.predict_proba = predict_proba
+            proba = estimator.predict_proba(df, fold_n_jobs=3)
+            assert np.allclose(proba, estimator.predict_proba(df, fold_n_jobs=1))
+            if name != 'xgb':
+                assert n_jobs[:3] == [max(1, os.cpu_count() // 3)] * 3
+
+            # the columns are reordered once, every fold model predicts the same frame
+            frames = []
+            for m in estimator.cv_gbm_models_:
+                def predict_proba(X_, m=m, **kwargs):
+                    frames.append(X_)
+                    return type(m).predict_proba(m, X_, **kwargs)
+
+                m.predict_proba = predict_proba
+            X_reordered = X[X.columns[::-1]]
+            assert np.allclose(estimator._predict_with_cv_models(X_reordered, 'predict_proba', 1),
+                               estimator._predict_with_cv_models(X, 'predict_proba', 1))
+            assert all(f is frames[0] for f in frames[:3])
+            assert frames[0].columns.to_list() == X.columns.to_list()
+
+    def test_dataset_cache_lru(self):
+        from hypergbm.dataset_cache import DatasetCache
+
+        cache = DatasetCache(memory_limit=100)
+        a = cache.get('a', lambda: ['a'], 40)
+        b = cache.get('b', lambda: ['b'], 40)
+        assert cache.get('a', lambda: ['x'], 40) is a
+        assert cache.key_of(a) == 'a' and cache.key_of(b) == 'b'
+
+        cache.get('c', lambda: ['c'], 40)  # evict 'b', the least recently used one
+        assert len(cache) == 2 and cache.size == 80
+        assert cache.key_of(b) is None
+        assert cache.get('b', lambda: ['y'], 40) == ['y']
+
+        cache.get('d', lambda: ['d'], 200)  # too large to cache
+        assert len(cache) == 2
+        assert cache.hits == 1 and cache.misses == 5
+
+    def test_dataset_cache(self):
+        from hypergbm.cfg import HyperGBMCfg as cfg
+        from hypergbm.dataset_cache import get_dataset_cache
+        from hypergbm.estimators import CatBoostClassifierWrapper, LGBMClassifierWrapper, XGBClassifierWrapper
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = (df.pop('y') == 'yes').astype('int')  # encoded for xgboost
+        X = get_tool_box(df).general_preprocessor(df).fit_transform(df)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=9527)
+
+        creators = [
+            lambda: CatBoostClassifierWrapper(n_estimators=20, border_count=32, random_state=9527, silent=True),
+            lambda: LGBMClassifierWrapper(n_estimators=20, max_bin=63, random_state=9527),
+            lambda: XGBClassifierWrapper(n_estimators=20, tree_method='hist', random_state=9527,
+                                         use_label_encoder=False, eval_metric='logloss'),
+        ]
+        for create in creators:
+            def fit_predict(**params):
+                est = create()
+                est.set_params(**params)
+                est.fit(X_train, y_train, eval_set=[(X_test, y_test)])
+                return est.predict_proba(X_test)
+
+            expected = fit_predict()
+            enabled = cfg.dataset_cache_enabled
+            try:
+                cfg.dataset_cache_enabled = True
+                cache = get_dataset_cache()
+                cache.clear()
+                cache.hits = cache.misses = 0
+                proba1 = fit_predict()
+                assert len(cache) == 2 and cache.hits == 0  # the train and eval sets
+                proba2 = fit_predict()
+                assert cache.hits == 2, type(create())  # reused by the second fit
+                fit_predict(learning_rate=0.3)  # not a binning parameter
+                assert cache.hits == 4 and len(cache) == 2
+            finally:
+                cfg.dataset_cache_enabled = enabled
+                cache.clear()
+
+            assert np.allclose(expected, proba1)
+            assert np.allclose(expected, proba2)
+
+        # the dataset classes of the libraries are restored out of the fit
+        import lightgbm
+        import xgboost
+        assert lightgbm.sklearn.Dataset is lightgbm.basic.Dataset
+        assert xgboost.sklearn.DMatrix is xgboost.core.DMatrix
+
+    def test_merge_cv_models(self):
+        from scipy.special import expit
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        def fit_cv(task, X, y, metrics):
+            set_random_state(9527)
+            space = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=50)()
+            space.random_sample()
+            estimator = HyperGBMEstimator(task, space)
+            estimator.fit_cross_validation(X, y, num_folds=3, metrics=metrics)
+            return estimator
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id', 'y'], axis=1, inplace=True)
+        y = df.pop('age')
+        estimator = fit_cv('regression', df, y, ['rmse'])
+        merged = estimator.merge_cv_models()
+        assert merged.cv_gbm_models_ is None
+        assert estimator.cv_gbm_models_ is not None
+        assert np.allclose(estimator.predict(df), merged.predict(df))
+        assert np.allclose(estimator.predict_proba(df), merged.predict_proba(df))
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+        estimator = fit_cv('binary', df, y, ['auc'])
+        merged = estimator.merge_cv_models()
+        X = estimator.transform_data(df)
+        raw_score = np.mean([m.predict(X, raw_score=True) for m in estimator.cv_gbm_models_], axis=0)
+        proba = merged.predict_proba(df)
+        assert np.allclose(proba[:, 1], expit(raw_score))
+        assert np.allclose(proba, estimator.predict_proba(df), atol=0.05)
+        assert set(merged.predict(df)).issubset(set(estimator.classes_))
+
+    def test_merge_cv_models_parity(self):
+        from scipy.special import softmax
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        def fit_cv(name, task, X, y, metrics):
+            set_random_state(9527)
+            space = GeneralSearchSpaceGenerator(enable_lightgbm=False, enable_xgb=name == 'xgb',
+                                                enable_catboost=name == 'catboost', n_estimators=50)()
+            space.random_sample()
+            estimator = HyperGBMEstimator(task, space)
+            estimator.fit_cross_validation(X, y, num_folds=3, metrics=metrics)
+            return estimator
+
+        # regression, the merged model predicts the average of the fold models
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id', 'y'], axis=1, inplace=True)
+        y = df.pop('age')
+        for name in ['xgb', 'catboost']:
+            estimator = fit_cv(name, 'regression', df, y, ['rmse'])
+            merged = estimator.merge_cv_models()
+            X = estimator.transform_data(df)
+            expected = np.mean([m.predict(X) for m in estimator.cv_gbm_models_], axis=0)
+            assert np.allclose(merged.predict(df), expected, atol=1e-4)
+            assert np.allclose(merged.predict(df), estimator.predict(df), atol=1e-4)
+
+            # no probability for regression, predict_proba returns the prediction like the fold models
+            assert not hasattr(merged.gbm_model, 'predict_proba')
+            assert merged.predict_proba(df).shape == (len(df),)
+            assert np.allclose(merged.predict_proba(df), estimator.predict_proba(df), atol=1e-4)
+
+        # multiclass, the merged model predicts the softmax of the averaged raw scores of the fold models
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id', 'y'], axis=1, inplace=True)
+        y = df.pop('marital')
+        for name in ['xgb', 'catboost']:
+            estimator = fit_cv(name, 'multiclass', df, y, ['accuracy'])
+            merged = estimator.merge_cv_models()
+            X = estimator.transform_data(df)
+            if name == 'xgb':
+                raw_scores = [m.predict(X, output_margin=True) for m in estimator.cv_gbm_models_]
+            else:
+                raw_scores = [m.predict(X, prediction_type='RawFormulaVal') for m in estimator.cv_gbm_models_]
+            proba = merged.predict_proba(df)
+            assert proba.shape == (len(df), 3)
+            assert np.allclose(proba, softmax(np.mean(raw_scores, axis=0), axis=1), atol=1e-5)
+            assert np.allclose(proba, estimator.predict_proba(df), atol=0.05)
+            assert list(merged.classes_) == list(estimator.classes_)
+
+    def test_predict_with_proba(self):
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        set_random_state(9527)
+        space = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=50)()
+        space.random_sample()
+        estimator = HyperGBMEstimator('binary', space)
+        estimator.fit_cross_validation(df, y, num_folds=3, metrics=['auc'])
+
+        expected_preds = estimator.predict(df)
+        expected_proba = estimator.predict_proba(df)
+        expected_scores = get_tool_box(df).metrics.calc_score(y, expected_preds, expected_proba,
+                                                              metrics=['accuracy', 'auc'], task='binary',
+                                                              classes=estimator.classes_)
+
+        transform_data = estimator.transform_data
+        calls = []
+
+        def counted_transform_data(X, **kwargs):
+            calls.append(len(X))
+            return transform_data(X, **kwargs)
+
+        estimator.transform_data = counted_transform_data
+        preds, proba = estimator.predict_with_proba(df)
+        assert len(calls) == 1
+        assert (preds == expected_preds).all()
+        assert np.allclose(proba, expected_proba)
+
+        scores = estimator.evaluate(df, y, metrics=['accuracy', 'auc'])
+        assert len(calls) == 2
+        assert scores == expected_scores
+
+    def test_inference_plan(self):
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypergbm.sklearn.inference_plan import InferencePlan
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        df.loc[df.index[::7], 'age'] = np.nan
+        df.loc[df.index[::11], 'job'] = np.nan
+        y = df.pop('y')
+
+        set_random_state(9527)
+        space = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=20)()
+        space.random_sample()
+        estimator = HyperGBMEstimator('binary', space)
+        estimator.fit(df, y)
+
+        expected = estimator.transform_data(df)
+        expected_proba = estimator.predict_proba(df)
+
+        X_test = df.tail(500).copy()
+        X_test.loc[X_test.index[:5], 'job'] = 'unseen job'
+        expected_test = estimator.data_pipeline.transform(X_test)
+
+        estimator.compile_inference_plan(df.head(500))
+        assert estimator.inference_plan_ is not None
+        assert estimator.transform_data(df).equals(expected)
+        assert estimator.transform_data(X_test).equals(expected_test)
+        assert estimator.transform_data(df.iloc[[3]]).equals(expected.iloc[[3]])
+        assert np.array_equal(estimator.predict_proba(df), expected_proba)
+
+        from sklearn.preprocessing import QuantileTransformer
+        from hypernets.tabular.dataframe_mapper import DataFrameMapper as Mapper
+        mapper = Mapper([(['balance'], QuantileTransformer(n_quantiles=10))], input_df=True, df_out=True)
+        mapper.fit(df)
+        try:
+            InferencePlan.compile(mapper, df)
+            assert False
+        except ValueError:
+            pass
+
+    def test_fit_transform_data_cache(self):
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().sample(1000, random_state=np.random.randint(1000000))
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        set_random_state(9527)
+        generator = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=20)
+        space = generator()
+        space.random_sample()
+        estimator = HyperGBMEstimator('binary', space)
+        assert estimator.pipeline_signature is not None
+        expected = estimator.fit_transform_data(df, y)
+
+        space2 = generator()
+        space2.assign_by_vectors(space.vectors)
+        estimator2 = HyperGBMEstimator('binary', space2)
+        assert estimator2.pipeline_signature == estimator.pipeline_signature
+        pipeline = estimator2.data_pipeline
+        assert estimator2.fit_transform_data(df, y).equals(expected)
+        assert estimator2.data_pipeline is not pipeline  # restored from cache
+
+        space3 = generator()
+        space3.assign_by_vectors([1 - space.vectors[0]] + space.vectors[1:])
+        estimator3 = HyperGBMEstimator('binary', space3)
+        assert estimator3.pipeline_signature != estimator.pipeline_signature
+
+    def test_pipeline_signature(self):
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        set_random_state(9527)
+        generator = GeneralSearchSpaceGenerator(n_estimators=20)
+        estimators = {}
+        for _ in range(30):
+            space = generator()
+            space.random_sample()
+            estimator = HyperGBMEstimator('binary', space)
+            estimators.setdefault(estimator.pipeline_signature, []).append(estimator)
+
+        assert len(estimators) > 1
+        shared = False
+        for signature, same_estimators in estimators.items():
+            pipelines = {e.data_pipeline.__repr__(1000000) for e in same_estimators}
+            assert len(pipelines) == 1
+            shared |= len({type(e.gbm_model) for e in same_estimators}) > 1
+        assert shared
+
+    def test_pipeline_cache(self):
+        from sklearn.impute import SimpleImputer
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler, MinMaxScaler
+        from hypergbm.cfg import HyperGBMCfg as cfg
+        from hypergbm.pipeline_cache import PipelineCache, get_pipeline_cache, fit_transform_cached
+        from hypernets.tabular.dataframe_mapper import DataFrameMapper as Mapper
+        from hypernets.tabular.sklearn_ex import SafeOrdinalEncoder
+
+        cache = PipelineCache(memory_limit=100)
+        cache.put('a', ['sa'], np.zeros(5))  # 40 bytes
+        cache.put('b', ['sb'], np.zeros(5))
+        assert cache.get('a') is not None
+        cache.put('c', ['sc'], np.zeros(5))  # evict 'b', the least recently used one
+        assert len(cache) == 2 and cache.size == 80
+        assert cache.get('b') is None
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+        cat_cols = ['job', 'marital', 'education']
+        num_cols = ['age', 'balance', 'duration']
+
+        def make_mapper(scaler):
+            return Mapper([(cat_cols, Pipeline([('imputer', SimpleImputer(strategy='constant')),
+                                                ('encoder', SafeOrdinalEncoder(dtype='int32'))])),
+                           (num_cols, Pipeline([('imputer', SimpleImputer()), ('scaler', scaler)]))],
+                          input_df=True, df_out=True)
+
+        enabled = cfg.pipeline_cache_enabled
+        try:
+            cfg.pipeline_cache_enabled = False
+            assert fit_transform_cached(make_mapper(StandardScaler()), df, y) is None
+
+            cfg.pipeline_cache_enabled = True
+            cache = get_pipeline_cache()
+            cache.clear()
+            mapper = make_mapper(StandardScaler())
+            expected = make_mapper(StandardScaler()).fit_transform(df, y)
+            assert fit_transform_cached(mapper, df, y).equals(expected)
+            assert mapper.transform(df).equals(expected)
+            assert len(cache) == 4
+
+            # the categorical group and numeric imputer are reused
+            hits = cache.hits
+            mapper2 = make_mapper(MinMaxScaler())
+            expected = make_mapper(MinMaxScaler()).fit_transform(df, y)
+            assert fit_transform_cached(mapper2, df, y).equals(expected)
+            assert mapper2.transform(df).equals(expected)
+            assert cache.hits - hits == 2
+            assert mapper2.fitted_features_[0][1] is not mapper.fitted_features_[0][1]
+            assert mapper2.fitted_features_[0][1].steps[1][1] is mapper.fitted_features_[0][1].steps[1][1]
+            assert mapper2.fitted_features_[1][1].steps[0][1] is mapper.fitted_features_[1][1].steps[0][1]
+            assert mapper2.fitted_features_[1][1].steps[1][1] is not mapper.fitted_features_[1][1].steps[1][1]
+
+            # different data
+            df2 = df.copy()
+            df2['age'] = df2['age'] + 1
+            hits = cache.hits
+            fit_transform_cached(make_mapper(StandardScaler()), df2, y)
+            assert cache.hits - hits == 1  # only the categorical group
+        finally:
+            cfg.pipeline_cache_enabled = enabled
+            cache.clear()
+
+    def test_fit_transform_data_mmap(self):
+        import tempfile
+        from hypergbm.cfg import HyperGBMCfg as cfg
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        set_random_state(9527)
+        generator = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=20)
+        space = generator()
+        space.random_sample()
+
+        enabled, cache_dir = cfg.data_mmap_cache_enabled, cfg.data_mmap_cache_dir
+        try:
+            cfg.data_mmap_cache_enabled = True
+            cfg.data_mmap_cache_dir = tempfile.mkdtemp()
+
+            estimator = HyperGBMEstimator('binary', space)
+            estimator.fit(df, y)
+            expected = estimator.transform_data(df)
+            assert len(os.listdir(cfg.data_mmap_cache_dir)) == 1
+
+            space2 = generator()
+            space2.assign_by_vectors(space.vectors)
+            estimator2 = HyperGBMEstimator('binary', space2)
+            pipeline = estimator2.data_pipeline
+            Xt = estimator2.fit_transform_data(df, y)
+            assert estimator2.data_pipeline is not pipeline  # restored from the store
+            assert Xt.equals(expected)
+            assert estimator2.transform_data(df).equals(expected)
+        finally:
+            cfg.data_mmap_cache_enabled, cfg.data_mmap_cache_dir = enabled, cache_dir
+
+    def test_dtype_downcast(self):
+        from hypergbm.cfg import HyperGBMCfg as cfg
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        set_random_state(9527)
+        generator = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=20)
+        space = generator()
+        space.random_sample()
+        estimator = HyperGBMEstimator('binary', space)
+        estimator.fit(df, y)
+        expected = estimator.transform_data(df)
+
+        enabled = cfg.dtype_downcast_enabled
+        try:
+            cfg.dtype_downcast_enabled = True
+            space2 = generator()
+            space2.assign_by_vectors(space.vectors)
+            estimator2 = HyperGBMEstimator('binary', space2)
+            estimator2.fit(df, y)
+            Xt = estimator2.transform_data(df)
+        finally:
+            cfg.dtype_downcast_enabled = enabled
+
+        from hypergbm.estimators import get_categorical_features
+        assert Xt.columns.to_list() == expected.columns.to_list()
+        assert get_categorical_features(Xt) == get_categorical_features(expected)
+        assert all(dtype.kind not in 'if' or dtype.itemsize <= 4 for dtype in Xt.dtypes)
+        assert Xt.memory_usage().sum() < expected.memory_usage().sum() * 0.6
+        assert np.allclose(Xt.values.astype('float64'), expected.values.astype('float64'), rtol=1e-6)
+        assert estimator2.predict_proba(df).shape == (len(df), 2)
+
+        estimator2.compile_inference_plan(df.head(500))
+        assert estimator2.transform_data(df).equals(Xt)
+
+    def test_get_categorical_features(self):
+        from hypergbm.estimators import get_categorical_features
+        from hypernets.tabular.column_selector import column_object_category_bool, column_zero_or_positive_int32
+
+        rng = np.random.RandomState(9527)
+        X = pd.DataFrame({'a': rng.randint(0, 10, 100).astype('int32'),
+                          'b': rng.randint(-1, 10, 100).astype('int32'),
+                          'c': rng.rand(100),
+                          'd': rng.choice(['x', 'y'], 100),
+                          'e': rng.randint(0, 10, 100).astype('int16'),
+                          'f': rng.randint(0, 10, 100).astype('int8'),
+                          'g': rng.randint(0, 10, 100) + 2 ** 40,
+                          'h': rng.randint(0, 10, 100).astype('int32')})
+        for df in [X, X.copy(), pd.concat([X[[c]] for c in X.columns], axis=1)]:
+            expected = column_object_category_bool(df) + column_zero_or_positive_int32(df)
+            assert expected == ['d', 'a', 'e', 'h']
+            assert get_categorical_features(df) == expected
+            assert get_categorical_features(df) == expected  # memoized
+
+        X2 = X.copy()
+        assert get_categorical_features(X2) == ['d', 'a', 'e', 'h']
+        X2['a'] = X2['a'] - 1
+        assert get_categorical_features(X2) == ['d', 'e', 'h']
+
+    def test_select_features(self):
+        from hypergbm.estimators import LGBMClassifierWrapper, XGBClassifierWrapper, CatBoostClassifierWrapper
+
+        rng = np.random.RandomState(9527)
+        X = pd.DataFrame(rng.rand(200, 20), columns=[f'c{i}' for i in range(20)])
+        y = rng.randint(0, 2, 200)
+        X_reordered = X[X.columns[::-1]].assign(extra=1.0)
+
+        for est in [LGBMClassifierWrapper(n_estimators=5),
+                    XGBClassifierWrapper(n_estimators=5, use_label_encoder=False, eval_metric='logloss'),
+                    CatBoostClassifierWrapper(n_estimators=5, verbose=0)]:
+            est.fit(X, y)
+            assert est.prepare_predict_X(X) is X  # no copy
+            Xt = est.prepare_predict_X(X_reordered)
+            assert Xt.columns.to_list() == X.columns.to_list()
+            assert np.allclose(est.predict_proba(X_reordered), est.predict_proba(X))
+
+    def test_histgb_discriminator(self):
+        from hypergbm.cfg import HyperGBMCfg as cfg
+        from hypergbm.estimators import HistGradientBoostingClassifierWrapper
+        from hypernets.discriminators import UnPromisingTrial
+
+        class StopAtDiscriminator:
+            def __init__(self, stop_at):
+                self.stop_at = stop_at
+
+            def is_promising(self, trajectory, group_id, end_iteration=None):
+                return len(trajectory) < self.stop_at
+
+        rng = np.random.RandomState(9527)
+        X = pd.DataFrame(rng.rand(1000, 10), columns=[f'c{i}' for i in range(10)])
+        y = (X['c0'] + rng.rand(1000) * 0.5 > 0.75).astype('int')
+
+        plain = HistGradientBoostingClassifierWrapper(max_iter=50, random_state=0).fit(X, y)
+        staged = HistGradientBoostingClassifierWrapper(max_iter=50, random_state=0)
+        staged.group_id = 'HistGradientBoostingClassifierWrapper'
+        staged.fit(X, y, eval_set=[(X, y)], callbacks=[staged.build_discriminator_callback(StopAtDiscriminator(100))])
+        assert staged.max_iter == 50 and not staged.warm_start
+        assert len(staged.iteration_scores) == 50 // cfg.histgb_stage_iterations
+        assert np.allclose(plain.predict_proba(X), staged.predict_proba(X))
+
+        pruned = HistGradientBoostingClassifierWrapper(max_iter=50, random_state=0)
+        pruned.group_id = 'HistGradientBoostingClassifierWrapper'
+        try:
+            pruned.fit(X, y, eval_set=[(X, y)], callbacks=[pruned.build_discriminator_callback(StopAtDiscriminator(2))])
+            assert False, 'UnPromisingTrial is expected'
+        except UnPromisingTrial:
+            pass
+        assert pruned.n_iter_ == 2 * cfg.histgb_stage_iterations
+        assert pruned.max_iter == 50
+
+    def test_file_monitor_callback(self):
+        import threading
+        from hypergbm.gbm_callbacks import FileMonitorCallback
+        from hypernets.discriminators import UnPromisingTrial
+
+        def iterations_to_skip(callback, max_iterations=100):
+            for i in range(max_iterations):
+                try:
+                    callback(None)
+                except UnPromisingTrial:
+                    return i
+            return None
+
+        file_path = f'{test_output_dir}/skip.tag'
+        os.makedirs(test_output_dir, exist_ok=True)
+        open(file_path, 'w').close()
+        callback = FileMonitorCallback(file_path, check_iterations=10, check_interval=0)
+        assert not os.path.exists(file_path)  # removed in the beginning
+        assert iterations_to_skip(callback) is None
+
+        open(file_path, 'w').close()
+        assert iterations_to_skip(callback) == 9  # checked once every 10 iterations
+        assert not os.path.exists(file_path)
+
+        callback = FileMonitorCallback(file_path, check_iterations=0, check_interval=0)
+        open(file_path, 'w').close()
+        assert iterations_to_skip(callback) == 0  # checked in every iteration
+
+        callback = FileMonitorCallback(file_path, check_iterations=0, check_interval=3600)
+        open(file_path, 'w').close()
+        assert iterations_to_skip(callback) is None  # not checked before the interval
+        os.remove(file_path)
+
+        event = threading.Event()
+        callback = FileMonitorCallback(event)
+        assert iterations_to_skip(callback) is None
+        event.set()
+        assert iterations_to_skip(callback) == 0
+
+    def test_discrimination_callback(self):
+        from hypergbm.gbm_callbacks import LightGBMDiscriminationCallback
+        from hypernets.discriminators import UnPromisingTrial, BaseDiscriminator
+
+        class CountingDiscriminator(BaseDiscriminator):
+            def __init__(self, stop_at=None, **kwargs):
+                super().__init__(min_trials=0, **kwargs)
+                self.stop_at = stop_at
+                self.checked_steps = []
+
+            def is_promising(self, iteration_trajectory, group_id, end_iteration):
+                self.checked_steps.append(len(iteration_trajectory))
+                return self.stop_at is None or len(iteration_trajectory) < self.stop_at
+
+        scores = np.linspace(1.0, 0.0, 1000)
+
+        d = CountingDiscriminator(min_steps=5)
+        callback = LightGBMDiscriminationCallback(d, 'lgbm', check_every=1)
+        assert callback.extend(scores, end_iteration=1000)
+        assert np.array_equal(callback.iteration_trajectory, scores)
+        assert d.checked_steps == list(range(5, 1001))
+
+        d = CountingDiscriminator(min_steps=5, stride=3)
+        callback = LightGBMDiscriminationCallback(d, 'lgbm', check_every=1)
+        assert callback.extend(scores[:20])
+        assert d.checked_steps == [5, 8, 11, 14, 17, 20]
+
+        d = CountingDiscriminator(min_steps=5)
+        callback = LightGBMDiscriminationCallback(d, 'lgbm', check_every=100)
+        assert callback.extend(scores[:950], end_iteration=950)
+        assert d.checked_steps == [100, 200, 300, 400, 500, 600, 700, 800, 900, 950]
+
+        d = CountingDiscriminator(min_steps=5, stop_at=250)
+        callback = LightGBMDiscriminationCallback(d, 'lgbm', check_every=100)
+        try:
+            for i, score in enumerate(scores):
+                callback.iteration(score, 1000)
+            assert False, 'UnPromisingTrial is expected'
+        except UnPromisingTrial:
+            pass
+        assert i == 299 and len(callback.iteration_trajectory) == 300
+        assert not callback.is_promising_
+
+    def test_fit_cross_validation_fold_discrimination(self):
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypernets.core import set_random_state, TrialHistory
+        from hypernets.core.trial import Trial
+        from hypernets.discriminators import PercentileDiscriminator, UnPromisingTrial
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        def run_cv(previous_score, **kwargs):
+            history = TrialHistory('max')
+            for i in range(5):
+                trial = Trial(None, i, previous_score, 1.0)
+                trial.iteration_scores = {'cv_folds': [previous_score] * 3}
+                history.append(trial)
+            # the direction is detected from the metric 'auc' rather than the discriminator
+            discriminator = PercentileDiscriminator(50, min_trials=3, history=history, optimize_direction='min')
+
+            set_random_state(9527)
+            space = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=20)()
+            space.random_sample()
+            estimator = HyperGBMEstimator('binary', space)
+            estimator.set_discriminator(discriminator)
+            try:
+                estimator.fit_cross_validation(df, y, num_folds=3, metrics=['auc'], **kwargs)
+                return estimator, True
+            except UnPromisingTrial:
+                return estimator, False
+
+        from hypergbm.cfg import HyperGBMCfg as cfg
+
+        estimator, succeeded = run_cv(0.999)
+        assert succeeded  # disabled by default
+        assert len(estimator.cv_gbm_models_) == 3
+
+        enabled = cfg.cv_fold_discrimination_enabled
+        try:
+            cfg.cv_fold_discrimination_enabled = True
+            estimator, succeeded = run_cv(0.999)
+            assert not succeeded
+            assert len(estimator.cv_gbm_models_) == 1  # abandoned after the first fold
+
+            estimator, succeeded = run_cv(0.5)
+            assert succeeded
+            assert len(estimator.cv_gbm_models_) == 3
+            assert len(estimator.get_iteration_scores()['cv_folds']) == 3
+
+            estimator, succeeded = run_cv(0.999, fold_n_jobs=3)
+            assert succeeded  # not abandoned if folds are fitted concurrently
+        finally:
+            cfg.cv_fold_discrimination_enabled = enabled
+
+    def test_fit_resume(self):
+        import copy
+        from hypergbm.search_space import GeneralSearchSpaceGenerator
+        from hypergbm.estimators import get_boosted_rounds, get_n_estimators_param
+        from hypernets.core import set_random_state
+
+        df = dsutils.load_bank().head(1000)
+        df.drop(['id'], axis=1, inplace=True)
+        y = df.pop('y')
+
+        for name in ['lightgbm', 'xgb', 'catboost']:
+            set_random_state(9527)
+            space = GeneralSearchSpaceGenerator(enable_lightgbm=name == 'lightgbm', enable_xgb=name == 'xgb',
+                                                enable_catboost=name == 'catboost', n_estimators=30)()
+            space.random_sample()
+
+            init_estimator = HyperGBMEstimator('binary', space)
+            init_estimator.gbm_model = copy.deepcopy(init_estimator.gbm_model)
+            key = get_n_estimators_param(init_estimator.gbm_model)
+            n_estimators = init_estimator.gbm_model.get_params(deep=False)[key]
+            init_estimator.gbm_model.set_params(**{key: n_estimators // 3})
+            init_estimator.fit(df, y, sample_size=0.5)
+            assert get_boosted_rounds(init_estimator.gbm_model) == n_estimators // 3
+
+            estimator = HyperGBMEstimator('binary', space)
+            estimator.fit(df, y, init_estimator=init_estimator)
+            assert get_boosted_rounds(estimator.gbm_model) == n_estimators
+            assert len(estimator.predict(df)) == len(df)
+            # the trajectory offset by the resumed rounds is kept out of the history of the discriminator
+            assert estimator.resumed_rounds_ == n_estimators // 3
+            assert estimator.get_iteration_scores() == {}
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from hypergbm.utils import fingerprint as fp
+from hypernets.tabular.datasets import dsutils
+
+
+class Test_Fingerprint:
+    def test_fingerprint(self):
+        df = dsutils.load_bank().head(1000)
+        df['job'] = df['job'].astype('category')
+        y = df.pop('y')
+
+        key = fp.fingerprint(df, y)
+        assert fp.fingerprint(df, y) == key
+        assert fp.fingerprint(df.copy(), y.copy()) == key
+        assert fp.fingerprint(df) != key
+        assert fp.fingerprint(df, y.values) != key
+        assert fp.fingerprint(df[df.columns[::-1]], y) != key
+        assert fp.fingerprint(df.rename(columns={'age': 'age2'}), y) != key
+
+        df2 = df.copy()
+        df2['age'] = df2['age'] + 1
+        assert fp.fingerprint(df2, y) != key
+        df2 = df.copy()
+        df2['education'] = df2['education'].str.upper()
+        assert fp.fingerprint(df2, y) != key
+
+        arr = np.arange(100).reshape(10, 10)
+        assert fp.fingerprint(arr) == fp.fingerprint(arr.copy())
+        assert fp.fingerprint(arr) != fp.fingerprint(arr.T)
+        assert fp.fingerprint(None, {'a': 1}) == fp.fingerprint(None, {'a': 1})
+
+    def test_memo(self):
+        df = pd.DataFrame({'a': np.arange(1000), 'b': ['x'] * 1000})
+        fp.fingerprint(df)
+        assert len(fp._memo[id(df)][1]) == 2
+
+        calls = []
+        hash_series = fp._hash_series
+        try:
+            fp._hash_series = lambda s: calls.append(s.name) or hash_series(s)
+            fp.fingerprint(df)
+            assert calls == []
+            df['c'] = 1.0
+            fp.fingerprint(df)
+            assert calls == ['c']
+        finally:
+            fp._hash_series = hash_series
+
+        key = id(df)
+        del df
+        assert key not in fp._memo
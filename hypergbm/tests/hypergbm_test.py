@@ -27,12 +27,13 @@ class Test_HyperGBM():
         y_test = X_test.pop('y')
         return X_train, X_test, y_train, y_test
 
-    def run_search(self, data_partition, cv=False, num_folds=3, discriminator=None, max_trials=3, space_fn=None):
+    def run_search(self, data_partition, cv=False, num_folds=3, discriminator=None, max_trials=3, space_fn=None,
+                   dispatcher=None):
         rs = RandomSearcher(space_fn if space_fn else search_space_general,
                             optimize_direction=OptimizeDirection.Maximize)
         hk = HyperGBM(rs, task='binary', reward_metric='accuracy',
                       callbacks=[SummaryCallback(), FileLoggingCallback(rs, output_dir=f'{test_output_dir}/hyn_logs')],
-                      discriminator=discriminator)
+                      discriminator=discriminator, dispatcher=dispatcher)
 
         X_train, X_test, y_train, y_test = data_partition()
 
@@ -143,6 +144,36 @@ class Test_HyperGBM():
         broken_trials = [t for t in hk.history.trials if not t.succeeded]
         assert len(broken_trials) > 0
 
+    def test_successive_halving(self):
+        from hypergbm.successive_halving import SuccessiveHalvingDispatcher
+
+        for cv in [False, True]:
+            dispatcher = SuccessiveHalvingDispatcher(f'{test_output_dir}/sh_models', eta=3, n_rungs=3)
+            assert dispatcher.fractions() == [1 / 9, 1 / 3, 1]
+            _, hk = self.run_search(self.get_data, cv=cv, max_trials=9, dispatcher=dispatcher)
+            assert len(hk.history.trials) == 9
+            assert len([t for t in hk.history.trials if t.succeeded]) == 1  # 9 -> 3 -> 1
+            assert sorted(t.trial_no for t in hk.history.trials) == list(range(1, 10))
+
+    def test_successive_halving_early_stopping(self):
+        from hypergbm.successive_halving import SuccessiveHalvingDispatcher
+        from hypernets.core.callbacks import EarlyStoppingCallback
+
+        X_train, X_test, y_train, y_test = self.get_data()
+        for kwargs in [dict(time_limit=0.001), dict(max_no_improvement_trials=1)]:
+            set_random_state(9527)
+            rs = RandomSearcher(search_space_general, optimize_direction=OptimizeDirection.Maximize)
+            es = EarlyStoppingCallback(mode='max', **kwargs)
+            dispatcher = SuccessiveHalvingDispatcher(f'{test_output_dir}/sh_models', eta=3, n_rungs=3)
+            hk = HyperGBM(rs, task='binary', reward_metric='accuracy', callbacks=[es], dispatcher=dispatcher)
+            hk.search(X_train, y_train, X_test, y_test, max_trials=9)
+
+            assert len([t for t in hk.history.trials if t.succeeded]) == 1
+            assert len(hk.history.trials) < 9  # not all samples are fitted in the first rung
+            if 'time_limit' in kwargs:
+                assert es.triggered and es.triggered_reason == EarlyStoppingCallback.REASON_TIME_LIMIT
+                assert len(hk.history.trials) == 1  # only the best sample fitted before the time limit
+
     def test_set_random_state(self):
         set_random_state(9527)
         _, hk = self.run_search(self.get_data, cv=False, max_trials=5)
@@ -0,0 +1,47 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from hypergbm.utils.mmap_store import MmapStore
+
+
+def is_mapped(arr):
+    while arr is not None:
+        if isinstance(arr, np.memmap):
+            return True
+        arr = arr.base
+    return False
+
+
+class Test_MmapStore:
+    def test_store_and_load(self):
+        rng = np.random.RandomState(9527)
+        df = pd.DataFrame({'a': rng.rand(100), 'b': rng.rand(100),
+                           'c': rng.randint(0, 10, 100).astype('int32'),
+                           'd': rng.choice(['x', 'y'], 100),
+                           'e': rng.rand(100),
+                           'f': pd.date_range('2021-01-01', periods=100)},
+                          index=np.arange(100) * 2)
+        store = MmapStore(tempfile.mkdtemp())
+        assert not store.exists('k')
+
+        store.store('k', df, attributes={'name': 'df'})
+        assert store.exists('k')
+
+        loaded, attributes = store.load('k')
+        assert attributes == {'name': 'df'}
+        assert loaded.equals(df)
+        assert (loaded.index == df.index).all()
+        assert loaded.dtypes.tolist() == df.dtypes.tolist()
+        assert all(is_mapped(loaded[c].values) for c in ['a', 'b', 'c', 'e'])
+
+        # copy on write, the stored data is not changed
+        loaded.iloc[0, 0] = -1.0
+        assert store.load('k')[0].equals(df)
+
+        store.store('k', df.head(10))  # stored already
+        assert len(store.load('k')[0]) == 100
+
+        store.clear()
+        assert not store.exists('k')
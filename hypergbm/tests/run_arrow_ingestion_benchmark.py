@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+"""
+Benchmark loading parquet data with the tool box (pandas.read_parquet) and with Arrow ingestion
+(`HyperGBMCfg.arrow_ingestion_enabled`), reports the load time, the peak memory (VmHWM of a fresh process, linux
+only), the memory usage of the loaded DataFrame and the time to encode its string columns with HashOrdinalEncoder.
+
+usage: python -m hypergbm.tests.run_arrow_ingestion_benchmark [rows ...]
+"""
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def make_data(rows, data_dir, seed=9527):
+    rng = np.random.RandomState(seed)
+    data = {}
+    for i in range(10):
+        data[f'n{i}'] = rng.rand(rows)
+    for i, cardinality in enumerate([10, 100, 1000, 10000, 100000]):
+        categories = np.array([f'category_{i}_{j}' for j in range(cardinality)], dtype=object)
+        data[f'c{i}'] = categories[rng.randint(0, cardinality, rows)]
+    data['y'] = rng.randint(0, 2, rows)
+
+    path = os.path.join(data_dir, f'data_{rows}.parquet')
+    pd.DataFrame(data).to_parquet(path)
+    return path
+
+
+def _peak_memory():
+    # ru_maxrss is inherited through exec, read the high water mark of the process instead
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _load(path, arrow, queue):
+    from hypergbm.sklearn.sklearn_ex import HashOrdinalEncoder
+    from hypergbm.utils import arrow_io
+    from hypernets.tabular import get_tool_box
+
+    start_at = time.time()
+    if arrow:
+        df = arrow_io.read_parquet(path)
+    else:
+        df = get_tool_box(pd.DataFrame).load_data(path, reset_index=True)
+    load_elapsed = time.time() - start_at
+    peak_memory = _peak_memory()
+    nbytes = df.memory_usage(deep=True).sum()
+
+    cat_columns = [c for c in df.columns if c.startswith('c')]
+    start_at = time.time()
+    HashOrdinalEncoder().fit_transform(df[cat_columns])
+    encode_elapsed = time.time() - start_at
+
+    queue.put((load_elapsed, peak_memory, nbytes, encode_elapsed))
+
+
+def main(*rows_list):
+    ctx = mp.get_context('spawn')
+    data_dir = tempfile.mkdtemp()
+    for rows in rows_list or (1000000, 5000000):
+        path = make_data(rows, data_dir)
+        for name, arrow in [('pandas', False), ('arrow', True)]:
+            queue = ctx.Queue()
+            p = ctx.Process(target=_load, args=(path, arrow, queue))
+            p.start()
+            load_elapsed, peak_memory, nbytes, encode_elapsed = queue.get()
+            p.join()
+            print(f'rows={rows} {name}: load {load_elapsed:.3f}s, peak memory {peak_memory / 1024 / 1024:.1f}MB, '
+                  f'data {nbytes / 1024 / 1024:.1f}MB, encode {encode_elapsed:.3f}s')
+
+
+if __name__ == '__main__':
+    main(*map(lambda s: int(float(s)), sys.argv[1:]))
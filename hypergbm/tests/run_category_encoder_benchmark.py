@@ -0,0 +1,45 @@
+# -*- coding:utf-8 -*-
+"""
+Benchmark fit and transform of SafeOrdinalEncoder and HashOrdinalEncoder on a high-cardinality category column.
+
+usage: python -m hypergbm.tests.run_category_encoder_benchmark [cardinality ...]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from hypergbm.sklearn.sklearn_ex import HashOrdinalEncoder
+from hypernets.tabular.sklearn_ex import SafeOrdinalEncoder
+
+
+def make_data(cardinality, seed=9527):
+    rng = np.random.RandomState(seed)
+    values = np.array([f'c{i}' for i in rng.permutation(cardinality)], dtype=object)
+    X = pd.DataFrame({'a': values})
+    X_test = pd.DataFrame({'a': values[rng.randint(0, cardinality, cardinality)]})
+    X_test.loc[::100, 'a'] = 'unseen'
+    return X, X_test
+
+
+def main(*cardinalities):
+    for cardinality in cardinalities or (1000000, 10000000):
+        X, X_test = make_data(cardinality)
+        results = {}
+        for encoder in [SafeOrdinalEncoder(dtype='int32'), HashOrdinalEncoder(dtype='int32')]:
+            start_at = time.time()
+            encoder.fit(X)
+            fit_elapsed = time.time() - start_at
+
+            start_at = time.time()
+            results[type(encoder).__name__] = encoder.transform(X_test)
+            transform_elapsed = time.time() - start_at
+            print(f'cardinality={cardinality} {type(encoder).__name__}: '
+                  f'fit {fit_elapsed:.3f}s, transform {transform_elapsed:.3f}s')
+
+        assert (results['SafeOrdinalEncoder'].values == results['HashOrdinalEncoder'].values).all()
+
+
+if __name__ == '__main__':
+    main(*map(lambda s: int(float(s)), sys.argv[1:]))
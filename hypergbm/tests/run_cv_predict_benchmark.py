@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+"""
+Benchmark prediction of cross-validated HyperGBMEstimator with fold models run one by one or concurrently.
+
+usage: python -m hypergbm.tests.run_cv_predict_benchmark [n_rows] [num_folds]
+"""
+import sys
+import time
+
+import pandas as pd
+
+from hypergbm import HyperGBMEstimator
+from hypergbm.search_space import GeneralSearchSpaceGenerator
+from hypernets.core import set_random_state
+from hypernets.tabular.datasets import dsutils
+
+
+def main(n_rows=1000000, num_folds=5):
+    df = dsutils.load_bank()
+    df.drop(['id'], axis=1, inplace=True)
+    y = df.pop('y')
+
+    set_random_state(9527)
+    space = GeneralSearchSpaceGenerator(enable_xgb=False, enable_catboost=False, n_estimators=200)()
+    space.random_sample()
+    estimator = HyperGBMEstimator('binary', space)
+    estimator.fit_cross_validation(df, y, num_folds=num_folds, metrics=['auc'])
+
+    X = pd.concat([df] * (n_rows // len(df) + 1), ignore_index=True).head(n_rows)
+    X_t = estimator.transform_data(X)
+    print(f'predict {len(X_t)} rows with {num_folds} fold models')
+
+    elapsed = {}
+    for fold_n_jobs in [1, num_folds]:
+        start_at = time.time()
+        estimator._predict_with_cv_models(X_t, 'predict_proba', fold_n_jobs=fold_n_jobs)
+        elapsed[fold_n_jobs] = time.time() - start_at
+        print(f'fold_n_jobs={fold_n_jobs}: {elapsed[fold_n_jobs]:.3f}s')
+
+    print(f'speedup: {elapsed[1] / elapsed[num_folds]:.2f}x')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+# -*- coding:utf-8 -*-
+"""
+Benchmark the search of HyperGBM with the default dispatcher and with `SuccessiveHalvingDispatcher` on the bank
+dataset, reports the elapsed time of search and the test score of the best trial.
+
+usage: python -m hypergbm.tests.run_successive_halving_benchmark [max_trials [rows]]
+"""
+import sys
+import tempfile
+import time
+
+from sklearn.model_selection import train_test_split
+
+from hypergbm import HyperGBM
+from hypergbm.search_space import GeneralSearchSpaceGenerator
+from hypergbm.successive_halving import SuccessiveHalvingDispatcher
+from hypernets.core import set_random_state
+from hypernets.dispatchers import default_dispatcher
+from hypernets.searchers.random_searcher import RandomSearcher
+from hypernets.tabular.datasets import dsutils
+
+
+def run(dispatcher, X_train, y_train, X_eval, y_eval, X_test, y_test, max_trials):
+    set_random_state(9527)
+    searcher = RandomSearcher(GeneralSearchSpaceGenerator(n_estimators=300), optimize_direction='max')
+    hm = HyperGBM(searcher, task='binary', reward_metric='auc', callbacks=[], dispatcher=dispatcher)
+
+    start_at = time.time()
+    hm.search(X_train, y_train, X_eval, y_eval, max_trials=max_trials)
+    elapsed = time.time() - start_at
+
+    best = hm.get_best_trial()
+    estimator = hm.load_estimator(best.model_file)
+    score = estimator.evaluate(X_test, y_test, metrics=['auc'])['auc']
+    n_succeeded = len([t for t in hm.history.trials if t.succeeded])
+    return elapsed, best.reward, score, n_succeeded
+
+
+def main(max_trials=27, rows=None):
+    df = dsutils.load_bank()
+    df.drop(['id'], axis=1, inplace=True)
+    if rows is not None:
+        df = df.head(rows)
+    X_train, X_test = train_test_split(df, test_size=0.2, random_state=9527)
+    X_train, X_eval = train_test_split(X_train, test_size=0.2, random_state=9527)
+    y_train, y_eval, y_test = X_train.pop('y'), X_eval.pop('y'), X_test.pop('y')
+
+    work_dir = tempfile.mkdtemp()
+    for name, dispatcher in [('default', default_dispatcher(f'{work_dir}/default')),
+                             ('successive_halving', SuccessiveHalvingDispatcher(f'{work_dir}/sh/models'))]:
+        elapsed, reward, score, n_succeeded = \
+            run(dispatcher, X_train, y_train, X_eval, y_eval, X_test, y_test, max_trials)
+        print(f'{name}: max_trials={max_trials}, rows={len(df)}, elapsed {elapsed:.1f}s, '
+              f'full trials {n_succeeded}, best eval auc {reward:.5f}, test auc {score:.5f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
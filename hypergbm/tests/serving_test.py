@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from hypergbm.utils.serving import ModelServer
+
+
+class SlowEstimator:
+    def __init__(self, estimator):
+        self.estimator = estimator
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def predict(self, X):
+        return self.estimator.predict(X)
+
+    def predict_proba(self, X):
+        with self.lock:
+            self.calls += 1
+        time.sleep(0.05)  # fixed cost per call
+        return self.estimator.predict_proba(X)
+
+
+class Test_Serving:
+    def setup_class(self):
+        rng = np.random.RandomState(9527)
+        self.df = pd.DataFrame({'x1': rng.rand(200), 'x2': rng.rand(200)})
+        y = np.where(self.df['x1'] + self.df['x2'] > 1, 'yes', 'no')
+        self.estimator = SlowEstimator(LogisticRegression().fit(self.df, y))
+        self.server = ModelServer(self.estimator, port=0).start()
+
+    def teardown_class(self):
+        self.server.stop()
+
+    def post(self, path, df, orient='records'):
+        body = df.to_json(orient=orient).encode('utf-8')
+        req = request.Request(self.server.url + path, data=body, headers={'Content-Type': 'application/json'})
+        with request.urlopen(req) as resp:
+            return json.loads(resp.read())['result']
+
+    def get(self, path):
+        with request.urlopen(self.server.url + path) as resp:
+            return json.loads(resp.read())
+
+    def test_predict(self):
+        assert self.get('/health') == {'status': 'ok'}
+
+        result = self.post('/predict', self.df.head(10))
+        assert result == self.estimator.predict(self.df.head(10)).tolist()
+
+        result = self.post('/predict_proba', self.df.head(10), orient='split')
+        assert np.allclose(result, self.estimator.predict_proba(self.df.head(10)))
+
+    def test_coalesce_requests(self):
+        calls = self.estimator.calls
+        rows = [self.df.iloc[i:i + 1] for i in range(50)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(lambda x: self.post('/predict_proba', x), rows))
+
+        assert np.allclose(np.vstack(results), self.estimator.predict_proba(self.df.head(50)))
+        assert self.estimator.calls - calls < 50
+
+        stats = self.get('/stats')
+        assert stats['requests'] >= 50
+        assert stats['requests_per_batch'] > 1
+        assert 0 < stats['p50_ms'] <= stats['p99_ms']
+
+    def test_bad_request_in_batch(self):
+        from hypergbm.utils.serving import BatchPredictor
+
+        predictor = BatchPredictor(self.estimator, max_batch_size=64, max_wait=200).start()
+        try:
+            bad = self.df.iloc[:1].astype(object)
+            bad.iloc[0, 0] = 'bad'  # fails the estimator only
+            futures = [predictor.submit('predict_proba', self.df.iloc[i:i + 1]) for i in range(5)]
+            futures.insert(2, predictor.submit('predict_proba', bad))
+
+            results = [f.exception() or f.result() for f in futures]
+            assert isinstance(results.pop(2), ValueError)
+            assert np.allclose(np.vstack(results), self.estimator.predict_proba(self.df.head(5)))
+
+            # columns are checked when submitted
+            assert predictor.columns == ['x1', 'x2']
+            try:
+                predictor.submit('predict', self.df[['x2']])
+                assert False
+            except ValueError:
+                pass
+            result = predictor.predict(self.df.head(3)[['x2', 'x1']].assign(x3=1))
+            assert result.tolist() == self.estimator.predict(self.df.head(3)).tolist()
+        finally:
+            predictor.stop()
+
+        self.post('/predict', self.df.head(1))  # the columns are learned from the first succeeded request
+        try:
+            self.post('/predict', self.df[['x1']].head(1))
+            assert False
+        except request.HTTPError as e:
+            assert e.code == 400
+
+    def test_batch_predictor(self):
+        from hypergbm.utils.serving import BatchPredictor
+
+        predictor = BatchPredictor(self.estimator, max_batch_size=16, max_wait=20).start()
+        try:
+            rows = [self.df.iloc[i:i + 1] for i in range(100)]
+            with ThreadPoolExecutor(max_workers=32) as executor:
+                results = list(executor.map(predictor.predict_proba, rows))
+            assert np.allclose(np.vstack(results), self.estimator.predict_proba(self.df.head(100)))
+
+            stats = predictor.stats.to_dict()
+            assert stats['batches'] < 100
+            assert stats['rows_per_batch'] <= 16
+
+            # flush by max wait time if the batch is not full
+            start = time.time()
+            predictor.predict(self.df.head(1))
+            assert time.time() - start >= 0.02
+        finally:
+            predictor.stop()
+
+        # flush at once if the batch is full
+        predictor = BatchPredictor(self.estimator, max_batch_size=1, max_wait=1000).start()
+        try:
+            start = time.time()
+            assert predictor.predict(self.df.head(1)).tolist() == self.estimator.predict(self.df.head(1)).tolist()
+            assert time.time() - start < 1
+        finally:
+            predictor.stop()
+
+    def test_stop_batch_predictor(self):
+        from hypergbm.utils.serving import BatchPredictor
+
+        predictor = BatchPredictor(self.estimator)
+        future = predictor.submit('predict', self.df.head(1))  # queued, but never flushed
+        predictor.stop()
+        assert isinstance(future.exception(timeout=1), RuntimeError)
+        try:
+            predictor.submit('predict', self.df.head(1))
+            assert False
+        except RuntimeError:
+            pass
+
+        predictor.start()
+        try:
+            assert predictor.predict(self.df.head(1)).tolist() == self.estimator.predict(self.df.head(1)).tolist()
+        finally:
+            predictor.stop()
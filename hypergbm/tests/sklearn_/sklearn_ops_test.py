@@ -257,3 +257,76 @@ class Test_CommonOps():
         df_1 = p.fit_transform(X, y)
         assert df_1.shape == (3, 12)
         assert list(df_1.columns) == ['a', 'e', 'f', 'b', 'c', 'd', 'l', 'g', 'h', 'i', 'j', 'k']
+
+    def test_hash_ordinal_encoder(self):
+        from hypergbm.cfg import HyperGBMCfg as cfg
+        from hypergbm.sklearn.sklearn_ex import HashOrdinalEncoder
+        from hypernets.tabular.sklearn_ex import SafeOrdinalEncoder
+
+        rng = np.random.RandomState(9527)
+        X = DataFrame({'a': rng.choice([f'v{i}' for i in range(100)], 1000),
+                       'b': rng.choice([True, False], 1000).astype(object),
+                       'c': rng.randint(0, 50, 1000)})
+        X_test = X.copy()
+        X_test.loc[:9, 'a'] = 'unseen'
+        X_test.loc[:4, 'c'] = -1
+
+        expected = SafeOrdinalEncoder(dtype='int32').fit(X).transform(X_test)
+        encoder = HashOrdinalEncoder(dtype='int32').fit(X)
+        result = encoder.transform(X_test)
+        assert all(np.array_equal(a, b) for a, b in zip(encoder.categories_, SafeOrdinalEncoder().fit(X).categories_))
+        assert (result.values == expected.values).all()
+        assert result.dtypes.tolist() == expected.dtypes.tolist()
+        assert (result['a'][:10] == 100).all()
+
+        decoded = encoder.inverse_transform(result)
+        assert decoded['a'][:10].isnull().all()
+        assert (decoded['a'][10:] == X['a'][10:]).all()
+
+        # categorical columns are encoded through the codes
+        X_cat = X.astype({'a': 'category'})
+        X_test_cat = X_test.astype({'a': 'category'})
+        X_test_cat.loc[10:14, 'a'] = np.nan
+        encoder_cat = HashOrdinalEncoder(dtype='int32').fit(X_cat)
+        assert np.array_equal(encoder_cat.categories_[0], encoder.categories_[0])
+        result_cat = encoder_cat.transform(X_test_cat)
+        assert (result_cat['a'][10:15] == 100).all()
+        assert (result_cat['a'][15:] == result['a'][15:]).all()
+
+        encoder_name = cfg.category_pipeline_encoder
+        try:
+            cfg.category_pipeline_encoder = 'hash'
+            space = get_space_categorical_pipeline()
+            space.random_sample()
+            space, _ = space.compile_and_forward()
+            next, (name, p) = space.Module_DataFrameMapper_1.compose()
+            df = DataFrame({'a': ['x', 'y', np.nan, 'x'], 'b': [1, 2, 3, 4]})
+            df_1 = p.fit_transform(df, [1, 1, 0, 0])
+            assert isinstance(p.fitted_features_[0][1].steps[-1][1], HashOrdinalEncoder)
+            assert df_1['a'].tolist() == [1, 2, 0, 1]
+        finally:
+            cfg.category_pipeline_encoder = encoder_name
+
+    def test_dtype_downcaster(self):
+        from hypergbm.sklearn.sklearn_ex import DtypeDowncaster
+
+        rng = np.random.RandomState(9527)
+        X = DataFrame({'a': rng.rand(100),
+                       'b': rng.randint(0, 100, 100),
+                       'c': rng.randint(0, 100000, 100),
+                       'd': rng.rand(100) * 1e300,
+                       'e': rng.choice(['x', 'y'], 100),
+                       'f': rng.rand(100).astype('float32')})
+        downcaster = DtypeDowncaster().fit(X)
+        assert downcaster.dtypes_ == {'a': np.float32, 'b': np.int16, 'c': np.int32}
+        assert downcaster.report_.loc['d', 'overflow'] == 100
+        assert downcaster.report_.loc['a', 'max_rel_error'] < 1e-7
+
+        Xt = downcaster.transform(X)
+        assert Xt.dtypes.to_list() == [np.float32, np.int16, np.int32, np.float64, object, np.float32]
+        assert (Xt['b'] == X['b']).all() and (Xt['c'] == X['c']).all()
+
+        X_test = X.head(3).copy()
+        X_test['b'] = [100, 100000, -100000]
+        assert downcaster.transform(X_test)['b'].to_list() == [100, 32767, -32768]
+
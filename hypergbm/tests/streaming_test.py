@@ -0,0 +1,115 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.linear_model import LogisticRegression
+
+from hypergbm.utils.streaming import iter_chunks, predict_chunked, PredictPipeline
+
+
+class Test_Streaming:
+    def setup_class(self):
+        rng = np.random.RandomState(9527)
+        self.df = pd.DataFrame({'id': np.arange(1000), 'x1': rng.rand(1000), 'x2': rng.rand(1000)})
+        y = np.where(self.df['x1'] + self.df['x2'] > 1, 'yes', 'no')
+        self.estimator = LogisticRegression().fit(self.df, y)
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.model_file = os.path.join(self.tmp_dir, 'model.pkl')
+        with open(self.model_file, 'wb') as f:
+            pickle.dump(self.estimator, f)
+
+        self.csv_file = os.path.join(self.tmp_dir, 'data.csv')
+        self.df.to_csv(self.csv_file, index=False)
+        self.parquet_file = os.path.join(self.tmp_dir, 'data.parquet')
+        pq.write_table(pa.Table.from_pandas(self.df, preserve_index=False), self.parquet_file, row_group_size=300)
+
+    def test_iter_chunks(self):
+        chunks = list(iter_chunks(self.csv_file, chunk_size=400))
+        assert [len(c) for c in chunks] == [400, 400, 200]
+        assert all(c.index[0] == 0 for c in chunks)
+
+        chunks = list(iter_chunks(self.csv_file))
+        assert [len(c) for c in chunks] == [1000]
+
+        chunks = list(iter_chunks(self.parquet_file, row_group=True))
+        assert [len(c) for c in chunks] == [300, 300, 300, 100]
+        assert pd.concat(chunks, ignore_index=True).equals(self.df)
+
+        chunks = list(iter_chunks(self.parquet_file, chunk_size=250))
+        assert sum(len(c) for c in chunks) == 1000
+
+    def test_predict_pipeline(self):
+        import time
+
+        def score(X):
+            time.sleep(0.01 * (X[0] % 3))  # finish out of order
+            return X * 2
+
+        written = []
+        chunks = [np.arange(i, i + 10) for i in range(0, 100, 10)]
+        pipeline = PredictPipeline(chunks, score, written.append, n_workers=3, queue_size=2)
+        assert pipeline.run() == 100
+        assert np.array_equal(np.hstack(written), np.arange(100) * 2)
+        assert [s.rows for s in pipeline.stats] == [100, 100, 100]
+        assert pipeline.score_stats.chunks == 10
+
+        def failed(X):
+            raise ValueError('failed')
+
+        try:
+            PredictPipeline(chunks, failed, written.append, n_workers=2).run()
+            assert False
+        except ValueError:
+            pass
+
+    def test_predict_chunked(self):
+        expected = self.estimator.predict(self.df)
+
+        output_file = os.path.join(self.tmp_dir, 'prediction.csv')
+        pipeline = predict_chunked(self.model_file, self.csv_file, output_file, chunk_size=300, n_jobs=2)
+        assert pipeline.write_stats.rows == 1000
+        assert pipeline.read_stats.chunks == 4
+        assert (pd.read_csv(output_file)['y'].values == expected).all()
+
+        output_file = os.path.join(self.tmp_dir, 'prediction.parquet')
+        pipeline = predict_chunked(self.model_file, self.parquet_file, output_file, row_group=True,
+                                   proba=True, output_with_data=['id'])
+        assert pipeline.write_stats.rows == 1000
+        result = pd.read_parquet(output_file)
+        assert list(result.columns) == ['id', 'y_0', 'y_1']
+        assert (result['id'].values == self.df['id'].values).all()
+        assert np.allclose(result[['y_0', 'y_1']].values, self.estimator.predict_proba(self.df))
+
+    def test_predict_command(self):
+        import argparse
+        from hypergbm.utils import tool
+
+        output_file = os.path.join(self.tmp_dir, 'prediction_command.csv')
+        args = argparse.Namespace(data=os.path.join(self.tmp_dir, 'data.*'), model_file=self.model_file,
+                                  output=output_file, chunk_size=None, row_group=True, prefetch=2,
+                                  proba=False, threshold=0.5, target=None, output_with_data=None,
+                                  jobs=2, enable_dask=False, verbose=0)
+        tool.predict(args)  # glob of the csv and parquet files
+        assert (pd.read_csv(output_file)['y'].values == np.tile(self.estimator.predict(self.df), 2)).all()
+
+    def test_predict_command_default(self, capsys):
+        import argparse
+        from hypergbm.utils import tool
+
+        output_file = os.path.join(self.tmp_dir, 'prediction_default.pkl')
+        args = argparse.Namespace(data=os.path.join(self.tmp_dir, 'data.*'), model_file=self.model_file,
+                                  output=output_file, chunk_size=None, row_group=False, prefetch=2,
+                                  proba=False, threshold=0.5, target=None, output_with_data=None,
+                                  jobs=2, enable_dask=False, verbose=0)
+        tool.predict(args)  # one chunk of the csv file and one chunk per row group of the parquet file
+        assert (pd.read_pickle(output_file)['y'].values == np.tile(self.estimator.predict(self.df), 2)).all()
+
+        out = capsys.readouterr().out
+        assert 'read: 2000 rows in 5 chunks' in out
+        assert 'score: 2000 rows in 5 chunks' in out
+        assert 'write: 2000 rows in 5 chunks' in out
@@ -0,0 +1,116 @@
+"""
+Arrow-native ingestion of parquet data.
+
+The parquet files are read into Arrow with the string columns as dictionary arrays, so each distinct string is
+decoded once instead of once per row, and they are converted to pandas Categorical (codes with a small categories
+index) rather than object columns. Numeric columns are converted as separate blocks (`split_blocks`), which avoids
+consolidating them into one copy, and the Arrow buffers are released column by column during the conversion
+(`self_destruct`), so the peak memory stays close to the size of the resulting DataFrame.
+"""
+import glob
+import os
+import time
+
+_parquet_formats = ('parquet', 'par')
+
+
+def _parquet_files(data_path):
+    if glob.has_magic(data_path):
+        files = glob.glob(data_path, recursive=True)
+    elif os.path.isdir(data_path):
+        files = glob.glob(os.path.join(data_path, '*'))
+    else:
+        files = [data_path]
+    return sorted(f for f in files if os.path.isfile(f))
+
+
+def is_parquet(data_path):
+    """
+    Whether the data path is a parquet file, or a directory or glob pattern of parquet files.
+    """
+    if not isinstance(data_path, str):
+        return False
+    files = _parquet_files(data_path)
+    return len(files) > 0 and all(os.path.splitext(f)[-1].lstrip('.').lower() in _parquet_formats for f in files)
+
+
+def read_parquet(data_path, columns=None, categorical=True):
+    """
+    Read parquet data into pandas DataFrame through Arrow.
+
+    :param data_path: str, parquet file, directory or glob pattern of them.
+    :param columns: list of column names to read, or None for all columns.
+    :param categorical: bool, read string columns as pandas Categorical or not.
+    :return: pandas DataFrame with a RangeIndex.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    files = _parquet_files(data_path)
+    if len(files) == 0:
+        raise ValueError(f'Not found parquet file in {data_path}')
+
+    read_dictionary = None
+    if categorical:
+        schema = pq.read_schema(files[0])
+        read_dictionary = [f.name for f in schema
+                           if (pa.types.is_string(f.type) or pa.types.is_large_string(f.type))
+                           and (columns is None or f.name in columns)]
+
+    # the pandas metadata is ignored to keep the RangeIndex, so drop the columns stored from a non-default index
+    tables = [_drop_index_columns(pq.read_table(f, columns=columns, read_dictionary=read_dictionary, memory_map=True))
+              for f in files]
+    table = pa.concat_tables(tables, promote=True) if len(tables) > 1 else tables[0]
+    del tables
+    if len(files) > 1 and read_dictionary:
+        table = table.unify_dictionaries()
+
+    return table.to_pandas(split_blocks=True, self_destruct=True, ignore_metadata=True)
+
+
+def _drop_index_columns(table):
+    metadata = table.schema.pandas_metadata
+    if not metadata:
+        return table
+    index_columns = [c for c in metadata.get('index_columns', []) if isinstance(c, str) and c in table.column_names]
+    return table.drop(index_columns) if index_columns else table
+
+
+class LoadStats:
+    """
+    Elapsed seconds and the peak memory allocated by Arrow of a data loading.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.arrow_peak_bytes = 0
+        self.result_bytes = 0
+
+    def __repr__(self):
+        return f'{self.seconds:.3f}s, arrow peak {self.arrow_peak_bytes / 1024 / 1024:.1f}MB, ' \
+               f'result {self.result_bytes / 1024 / 1024:.1f}MB'
+
+
+def load_data(data_path, reset_index=True, stats=None):
+    """
+    Load data with Arrow-native ingestion if it is parquet, or with the tool box otherwise.
+
+    :param stats: `LoadStats` to collect the load time and memory, optional.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    from hypernets.tabular import get_tool_box
+
+    start = time.time()
+    pool = pa.default_memory_pool()
+    if is_parquet(data_path):
+        df = read_parquet(data_path)
+    else:
+        df = get_tool_box(pd.DataFrame).load_data(data_path, reset_index=reset_index)
+
+    if stats is not None:
+        stats.seconds = time.time() - start
+        stats.arrow_peak_bytes = pool.max_memory() or 0
+        stats.result_bytes = int(df.memory_usage(deep=True).sum())
+
+    return df
@@ -0,0 +1,164 @@
+"""
+Content-addressed fingerprint of data, used as the cache key of transformed data.
+
+Each column is hashed once with a fast non-cryptographic digest (xxhash if installed, or blake2b) over its buffer,
+and the column digests are memoized with the DataFrame (or Series, ndarray) object, so fingerprinting the same data
+again in later trials costs nothing. The data is treated as immutable once fingerprinted: the memo is keyed by the
+object and the address of each column buffer, so modifying values in place is not detected.
+"""
+import hashlib
+import pickle
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+from hypernets.utils import logging
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.get_logger(__name__)
+
+_memo = {}  # id of data object -> (weakref of the object, {column key: digest})
+_lock = threading.Lock()
+
+
+def _new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def _hash_buffer(hasher, values):
+    if values.dtype.kind in 'biufcmM':
+        hasher.update(np.ascontiguousarray(values).view(np.uint8))
+    else:
+        # python objects, hash them by value
+        hasher.update(hash_pandas_object(pd.Series(values), index=False).values)
+
+
+def _hash_series(series):
+    hasher = _new_hasher()
+    hasher.update(f'{series.name}:{series.dtype}:{len(series)}'.encode('utf-8'))
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        hasher.update(series.cat.codes.to_numpy())
+        _hash_buffer(hasher, series.cat.categories.to_numpy())
+    elif isinstance(series.dtype, np.dtype):
+        _hash_buffer(hasher, series.to_numpy())
+    else:
+        hasher.update(hash_pandas_object(series, index=False).values)
+    return hasher.hexdigest()
+
+
+def _hash_ndarray(arr):
+    hasher = _new_hasher()
+    hasher.update(f'{arr.dtype}:{arr.shape}'.encode('utf-8'))
+    if arr.ndim > 1 and arr.dtype.kind not in 'biufcmM':
+        for i in range(arr.shape[1]):
+            _hash_buffer(hasher, arr[:, i])
+    else:
+        _hash_buffer(hasher, arr.ravel())
+    return hasher.hexdigest()
+
+
+def _buffer_address(values):
+    if isinstance(values, np.ndarray):
+        return values.__array_interface__['data'][0]
+    return id(values)
+
+
+def _forget(key, ref):
+    with _lock:
+        entry = _memo.get(key)
+        if entry is not None and entry[0] is ref:
+            del _memo[key]
+
+
+def _memo_of(obj):
+    key = id(obj)
+    with _lock:
+        entry = _memo.get(key)
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+        try:
+            ref = weakref.ref(obj, lambda r: _forget(key, r))
+        except TypeError:  # not weak referenceable
+            return None
+        memo = {}
+        _memo[key] = (ref, memo)
+        return memo
+
+
+def _memoized(obj, key, fn):
+    memo = _memo_of(obj)
+    if memo is None:
+        return fn()
+
+    digest = memo.get(key)
+    if digest is None:
+        digest = fn()
+        memo[key] = digest
+    return digest
+
+
+def memoize(data, key, fn):
+    """
+    Call `fn` once for the data object and key, and return the memoized result later.
+
+    :param data: pandas DataFrame, Series or numpy ndarray, treated as immutable.
+    :param key: hashable, should contain anything which `fn` depends on besides the data object.
+    """
+    return _memoized(data, key, fn)
+
+
+def _column_digests(df):
+    digests = []
+    for i, c in enumerate(df.columns):
+        series = df.iloc[:, i]
+        values = series.array if not isinstance(series.dtype, np.dtype) else series.to_numpy()
+        key = (i, c, str(series.dtype), len(series), _buffer_address(values))
+        digests.append(_memoized(df, key, lambda: _hash_series(series)))
+    return digests
+
+
+def column_fingerprints(df):
+    """
+    Get the fingerprint of each column of the DataFrame.
+
+    :return: dict of column name to hex digest.
+    """
+    return dict(zip(df.columns, _column_digests(df)))
+
+
+def fingerprint(*data):
+    """
+    Get the fingerprint of the data.
+
+    :param data: pandas DataFrame, Series, numpy ndarray or None, or any picklable object.
+    :return: str, hex digest.
+    """
+    hasher = _new_hasher()
+    for d in data:
+        if d is None:
+            hasher.update(b'<None>')
+        elif isinstance(d, pd.DataFrame):
+            hasher.update(b'<DataFrame>')
+            for c, digest in zip(d.columns, _column_digests(d)):
+                hasher.update(f'{c}={digest};'.encode('utf-8'))
+        elif isinstance(d, pd.Series):
+            hasher.update(b'<Series>')
+            values = d.array if not isinstance(d.dtype, np.dtype) else d.to_numpy()
+            key = (d.name, str(d.dtype), len(d), _buffer_address(values))
+            hasher.update(_memoized(d, key, lambda: _hash_series(d)).encode('utf-8'))
+        elif isinstance(d, np.ndarray):
+            hasher.update(b'<ndarray>')
+            key = (str(d.dtype), d.shape, d.strides, _buffer_address(d))
+            hasher.update(_memoized(d, key, lambda: _hash_ndarray(d)).encode('utf-8'))
+        else:
+            hasher.update(pickle.dumps(d, protocol=pickle.HIGHEST_PROTOCOL))
+    return hasher.hexdigest()
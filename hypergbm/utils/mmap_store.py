@@ -0,0 +1,154 @@
+"""
+On-disk store of transformed DataFrames as memory-mapped column blocks.
+
+Each run of consecutive columns with the same numpy dtype is saved as one `.npy` file in the (columns, rows) layout
+of pandas blocks, and loaded back with `np.load(mmap_mode='c')` into a DataFrame without copying. So reloading costs
+no deserialization, and the trials and workers on one host share the physical pages through the page cache (a page
+is copied only if it is modified). Columns of other dtypes (object, category, extension) are pickled.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from hypernets.utils import logging
+
+logger = logging.get_logger(__name__)
+
+_META = 'meta.pkl'
+_mmap_kinds = 'biufcmM'
+
+
+def _is_mmap_dtype(dtype):
+    return isinstance(dtype, np.dtype) and dtype.kind in _mmap_kinds
+
+
+def _column_runs(df):
+    """
+    Split the columns into runs of consecutive columns: (start, stop, dtype or None if not mmap-able).
+    """
+    runs = []
+    for i, dtype in enumerate(df.dtypes):
+        dtype = dtype if _is_mmap_dtype(dtype) else None
+        # note: np.dtype('float64') == None is True
+        if runs and (runs[-1][2] is None) == (dtype is None) and (dtype is None or runs[-1][2] == dtype):
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1, dtype])
+    return runs
+
+
+def _frame_from_blocks(arrays, index):
+    """
+    Create DataFrame with the arrays as its blocks, without consolidating (copying) the blocks of the same dtype.
+    """
+    from pandas.core.internals import api as internals_api, BlockManager
+
+    blocks = []
+    all_columns = []
+    for columns, a in arrays:
+        start = len(all_columns)
+        if isinstance(a, np.ndarray):
+            blocks.append(internals_api.make_block(a, placement=range(start, start + len(columns)), ndim=2))
+        else:
+            for i, c in enumerate(columns):
+                values = a[c]._values
+                if isinstance(values, np.ndarray):
+                    values = values.reshape(1, -1)
+                blocks.append(internals_api.make_block(values, placement=[start + i], ndim=2))
+        all_columns += columns
+
+    mgr = BlockManager(blocks, [pd.Index(all_columns), index])
+    return pd.DataFrame(mgr)
+
+
+class MmapStore:
+    """
+    Store of DataFrames in a local directory, each one is a sub directory named by its key.
+
+    :param root: str, local directory.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_of(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.path_of(key), _META))
+
+    def store(self, key, df, attributes=None):
+        """
+        Store the DataFrame with some picklable attributes.
+        """
+        assert isinstance(df, pd.DataFrame)
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=f'.{key}.', dir=self.root)
+        try:
+            parts = []
+            for start, stop, dtype in _column_runs(df):
+                file = f'{uuid.uuid4().hex}.npy' if dtype is not None else f'{uuid.uuid4().hex}.pkl'
+                block = df.iloc[:, start:stop]
+                if dtype is not None:
+                    np.save(os.path.join(tmp_path, file), np.ascontiguousarray(block.to_numpy().T))
+                else:
+                    with open(os.path.join(tmp_path, file), 'wb') as f:
+                        pickle.dump(block.reset_index(drop=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+                parts.append((file, block.columns.to_list()))
+
+            index = df.index
+            if not isinstance(index, pd.RangeIndex):
+                index = index.to_numpy()
+            meta = dict(parts=parts, index=index, shape=df.shape, attributes=attributes)
+            with open(os.path.join(tmp_path, _META), 'wb') as f:
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.rename(tmp_path, self.path_of(key))
+        except OSError as e:
+            if self.exists(key):  # stored by another process
+                logger.debug(f'{key} was stored already')
+            else:
+                logger.warning(f'Failed to store {key}: {e}')
+        finally:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def load(self, key):
+        """
+        Load the DataFrame with memory mapping.
+
+        :return: tuple of DataFrame and the stored attributes.
+        """
+        path = self.path_of(key)
+        with open(os.path.join(path, _META), 'rb') as f:
+            meta = pickle.load(f)
+
+        arrays = []  # list of (columns, 2d array in the layout of pandas block, or DataFrame)
+        for file, columns in meta['parts']:
+            if file.endswith('.npy'):
+                arrays.append((columns, np.load(os.path.join(path, file), mmap_mode='c')))
+            else:
+                with open(os.path.join(path, file), 'rb') as f:
+                    arrays.append((columns, pickle.load(f)))
+
+        index = meta['index'] if isinstance(meta['index'], pd.Index) else pd.Index(meta['index'])
+        try:
+            df = _frame_from_blocks(arrays, index)
+        except Exception as e:
+            logger.debug(f'Failed to create DataFrame from blocks: {e}, concat them.')
+            frames = [pd.DataFrame(a.T, columns=columns, copy=False) if isinstance(a, np.ndarray) else a
+                      for columns, a in arrays]
+            df = pd.concat(frames, axis=1, copy=False) if frames else pd.DataFrame(index=pd.RangeIndex(len(index)))
+            df.index = index
+
+        return df, meta['attributes']
+
+    def clear(self):
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,354 @@
+"""
+Local HTTP server to predict with an estimator loaded once, concurrent requests are coalesced into micro-batches,
+each of them is one vectorized call of the estimator.
+
+Endpoints:
+    POST /predict, /predict_proba: body is json of a pandas DataFrame in 'records' or 'split' orient, eg:
+        [{"age": 30, "job": "admin."}, ...] or {"columns": ["age", "job"], "data": [[30, "admin."], ...]},
+        response is {"result": [...]}.
+    GET /stats: request and batch counts, p50/p99 latency in milliseconds.
+    GET /health: {"status": "ok"}
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import numpy as np
+import pandas as pd
+
+from hypernets.utils import logging
+
+logger = logging.get_logger(__name__)
+
+_methods = ('predict', 'predict_proba')
+
+
+class LatencyStats:
+    """
+    Latency of the recent requests.
+    """
+
+    def __init__(self, window=10000):
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add_request(self, rows, seconds):
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self._latencies.append(seconds)
+
+    def add_batch(self, rows):
+        with self._lock:
+            self.batches += 1
+            self.batch_rows += rows
+
+    def to_dict(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            requests, rows, batches, batch_rows = self.requests, self.rows, self.batches, self.batch_rows
+
+        if len(latencies) > 0:
+            p50, p99 = np.percentile(latencies, [50, 99])
+        else:
+            p50 = p99 = 0.0
+        return dict(requests=requests, rows=rows, batches=batches,
+                    requests_per_batch=requests / batches if batches > 0 else 0.0,
+                    rows_per_batch=batch_rows / batches if batches > 0 else 0.0,
+                    p50_ms=float(p50), p99_ms=float(p99))
+
+
+class BatchPredictor:
+    """
+    Coalesce concurrent prediction calls into one vectorized call of the estimator.
+
+    A background thread queues the incoming calls and flushes the calls of the same method as one batch when they
+    reach `max_batch_size` rows or the first of them has waited `max_wait` milliseconds, then runs the estimator once
+    with the concatenated data and splits the result to each call. Calls queued while the estimator is busy have
+    waited already, so they are flushed without extra waiting.
+
+    The columns of each call are checked when it is submitted, so a call with missing columns fails alone instead of
+    joining a batch. If a batch fails anyway, its calls are run one by one, so only the bad ones fail.
+
+    Calls queued before `stop` are flushed before the background thread exits, the later ones fail with RuntimeError.
+
+    :param estimator: estimator with `predict` and `predict_proba`.
+    :param max_batch_size: int, max rows of one batch, a call with more rows is run as one batch.
+    :param max_wait: float, max milliseconds to wait for more calls to join a batch, 0 to flush queued calls at once.
+    :param columns: list of column names the estimator expects, default is `feature_names_in_` of the estimator, or
+        the columns of the first succeeded call if the estimator has no `feature_names_in_`.
+    """
+
+    def __init__(self, estimator, max_batch_size=1024, max_wait=2.0, columns=None):
+        self.estimator = estimator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.columns = list(columns) if columns is not None else _feature_names(estimator)
+        self.stats = LatencyStats()
+
+        self._queue = queue.Queue()
+        self._pending = []
+        self._stopping = False
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='batch-predictor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._thread is not None:
+                self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._fail_queued(RuntimeError('BatchPredictor is stopped'))
+
+    def _fail_queued(self, error):
+        """
+        Fail the calls left in the queue, which are not flushed by the background thread.
+        """
+        items, self._pending = self._pending, []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in items:
+            if item is not None:
+                item[2].set_exception(error)
+
+    def submit(self, method, X):
+        """
+        Submit data to predict.
+
+        :param method: 'predict' or 'predict_proba'.
+        :param X: pandas DataFrame.
+        :return: Future of the prediction result (numpy array) of X.
+        :raises ValueError: if X misses any of the expected columns.
+        :raises RuntimeError: if the predictor is stopped.
+        """
+        assert method in _methods, f'Unsupported method {method}'
+        columns = self.columns
+        if columns is not None and X.columns.to_list() != columns:
+            missing = [c for c in columns if c not in X.columns]
+            if missing:
+                raise ValueError(f'Missing columns {missing}')
+            X = X[columns]
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('BatchPredictor is stopped')
+            self._queue.put((method, X, future, time.time()))
+        return future
+
+    def predict(self, X):
+        return self.submit('predict', X).result()
+
+    def predict_proba(self, X):
+        return self.submit('predict_proba', X).result()
+
+    def _poll(self, timeout):
+        """
+        Move one queued call into pending, return False if nothing arrived in timeout or stopping.
+        """
+        if self._stopping:
+            return False
+        try:
+            item = self._queue.get(timeout=timeout) if timeout is None or timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            return False
+        if item is None:
+            self._stopping = True
+            return False
+        self._pending.append(item)
+        return True
+
+    def _take_batch(self):
+        while not self._pending:
+            if not self._poll(None):
+                return None, None
+        while self._poll(0):  # move all queued calls into pending
+            pass
+
+        method, _, _, first_time = self._pending[0]
+        deadline = first_time + self.max_wait / 1000
+
+        def batch_rows():
+            return sum(len(item[1]) for item in self._pending if item[0] == method)
+
+        while batch_rows() < self.max_batch_size and self._poll(deadline - time.time()):
+            pass
+
+        batch, rows = [], 0
+        for item in self._pending:
+            if item[0] == method and (not batch or rows + len(item[1]) <= self.max_batch_size):
+                batch.append(item)
+                rows += len(item[1])
+        self._pending = [item for item in self._pending if all(item is not b for b in batch)]
+        return method, batch
+
+    def _run(self):
+        while True:
+            method, batch = self._take_batch()
+            if batch is None:
+                break
+            self._predict_batch(method, batch)
+
+    def _predict_batch(self, method, batch):
+        columns = batch[0][1].columns.to_list()
+        if len(batch) > 1 and any(item[1].columns.to_list() != columns for item in batch):
+            # not the expected columns learned yet, don't mix the calls with different columns
+            for item in batch:
+                self._predict_batch(method, [item])
+            return
+
+        try:
+            if len(batch) == 1:
+                X = batch[0][1]
+            else:
+                X = pd.concat([item[1] for item in batch], axis=0, ignore_index=True)
+            result = np.asarray(getattr(self.estimator, method)(X))
+            self.stats.add_batch(len(X))
+        except Exception as e:
+            if len(batch) > 1:
+                logger.warning(f'failed to {method} a batch of {len(batch)} calls, run them one by one: {e}')
+                for item in batch:
+                    self._predict_batch(method, [item])
+            else:
+                batch[0][2].set_exception(e)
+            return
+
+        if self.columns is None:
+            self.columns = columns
+
+        start = 0
+        for _, x, future, _ in batch:
+            future.set_result(result[start:start + len(x)])
+            start += len(x)
+
+
+def _feature_names(estimator):
+    try:
+        names = getattr(estimator, 'feature_names_in_', None)
+    except Exception:
+        names = None
+    return list(names) if names is not None else None
+
+
+def _read_frame(body):
+    data = json.loads(body)
+    if isinstance(data, dict) and 'data' in data:
+        return pd.DataFrame(data['data'], columns=data.get('columns'))
+    return pd.DataFrame(data)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'HyperGBM'
+
+    def _send(self, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, dict(status='ok'))
+        elif self.path == '/stats':
+            self._send(200, self.server.predictor.stats.to_dict())
+        else:
+            self._send(404, dict(error=f'Not found {self.path}'))
+
+    def do_POST(self):
+        start = time.time()
+        method = self.path.strip('/')
+        if method not in _methods:
+            self._send(404, dict(error=f'Not found {self.path}'))
+            return
+
+        try:
+            X = _read_frame(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            future = self.server.predictor.submit(method, X)
+        except RuntimeError as e:
+            self._send(503, dict(error=str(e)))
+            return
+        except Exception as e:
+            self._send(400, dict(error=f'Invalid data: {e}'))
+            return
+
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(e)
+            self._send(500, dict(error=str(e)))
+            return
+
+        self._send(200, dict(result=result.tolist()))
+        self.server.predictor.stats.add_request(len(X), time.time() - start)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ModelServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP server of an estimator.
+
+    :param estimator: estimator object or the pickle file of it.
+    :param host: str, host to listen.
+    :param port: int, port to listen, 0 to use a free port.
+    :param max_batch_size: int, max rows of one batch call of the estimator.
+    :param max_wait: float, max milliseconds a request waits for others to join its batch.
+    """
+    daemon_threads = True
+
+    def __init__(self, estimator, host='127.0.0.1', port=8060, max_batch_size=1024, max_wait=2.0):
+        if isinstance(estimator, str):
+            from hypergbm.utils.streaming import load_estimator
+            estimator = load_estimator(estimator)
+
+        self.predictor = BatchPredictor(estimator, max_batch_size=max_batch_size, max_wait=max_wait)
+        super().__init__((host, port), _RequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def serve_forever(self, poll_interval=0.5):
+        self.predictor.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.predictor.stop()
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        thread = threading.Thread(target=self.serve_forever, name='model-server', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,365 @@
+"""
+Chunked (out-of-core) prediction: read the data file chunk by chunk, score each chunk and append the results to the
+output file, so the memory usage is bounded by the chunk size instead of the file size. Reading, scoring and writing
+run as stages of a pipeline to overlap with each other.
+"""
+import glob
+import os
+import pickle
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from hypernets.utils import logging
+
+logger = logging.get_logger(__name__)
+
+_parquet_formats = ('parquet', 'par')
+_csv_formats = ('csv', 'txt')
+_pickle_formats = ('pkl', 'pickle')
+
+
+def _file_format(file_path):
+    return os.path.splitext(file_path)[-1].lstrip('.').lower()
+
+
+def _list_files(data_path):
+    if glob.has_magic(data_path):
+        files = glob.glob(data_path, recursive=True)
+    elif os.path.isdir(data_path):
+        files = glob.glob(os.path.join(data_path, '*'))
+    else:
+        files = [data_path]
+
+    files = sorted(f for f in files if os.path.isfile(f) and _file_format(f) in _parquet_formats + _csv_formats)
+    if len(files) == 0:
+        raise ValueError(f'Not found csv or parquet file in {data_path}')
+    return files
+
+
+def iter_chunks(data_path, chunk_size=None, row_group=False, columns=None):
+    """
+    Iterate the data in chunks of pandas DataFrame, the index of each chunk is reset.
+
+    :param data_path: str, csv or parquet file, directory or glob pattern of them.
+    :param chunk_size: int, max row number of each chunk. Read each csv file as one chunk if None.
+    :param row_group: bool, iterate parquet file by row groups (the chunk_size is ignored for parquet).
+        Parquet file is iterated by row groups if chunk_size is None too.
+    :param columns: list of column names to read, or None for all columns.
+    """
+    import pyarrow.parquet as pq
+
+    for file in _list_files(data_path):
+        fmt = _file_format(file)
+        if fmt in _parquet_formats:
+            pf = pq.ParquetFile(file)
+            if row_group or chunk_size is None:
+                batches = (pf.read_row_group(i, columns=columns) for i in range(pf.num_row_groups))
+            else:
+                batches = pf.iter_batches(batch_size=chunk_size, columns=columns)
+            for batch in batches:
+                yield batch.to_pandas()
+        elif chunk_size is None:
+            yield pd.read_csv(file, usecols=columns, low_memory=False)
+        else:
+            reader = pd.read_csv(file, chunksize=chunk_size, usecols=columns, low_memory=False)
+            for chunk in reader:
+                yield chunk.reset_index(drop=True)
+
+
+class ChunkWriter:
+    """
+    Append DataFrame chunks to a parquet or csv file. Chunks of pickle file are kept in memory and dumped when closed.
+    """
+
+    def __init__(self, output_file):
+        fmt = _file_format(output_file)
+        if fmt not in _parquet_formats + _csv_formats + _pickle_formats:
+            raise ValueError(f'Not supported output format for chunked prediction: {output_file}')
+
+        self.output_file = output_file
+        self.is_parquet = fmt in _parquet_formats
+        self.is_pickle = fmt in _pickle_formats
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._chunks = []
+
+    def write(self, df):
+        if self.is_parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._schema = table.schema
+                self._writer = pq.ParquetWriter(self.output_file, self._schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+        elif self.is_pickle:
+            self._chunks.append(df)
+        else:
+            df.to_csv(self.output_file, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._chunks:
+            pd.concat(self._chunks, ignore_index=True).to_pickle(self.output_file, protocol=4)
+            self._chunks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def select_output_data(X, output_with_data):
+    """
+    Select the columns of X to store with the prediction result.
+
+    :param output_with_data: list of column name patterns, '*' for all columns, or None for no column.
+    """
+    if not output_with_data:
+        return None
+    if '*' == output_with_data or '*' in output_with_data:
+        return X
+    data_columns = [c for c in X.columns if any([re.match(r, c) for r in output_with_data])]
+    if len(data_columns) == 0:
+        raise ValueError(f'No output column found to match {output_with_data}')
+    return X[data_columns]
+
+
+def to_output_frame(pred, target, data=None):
+    """
+    Make the output DataFrame of prediction result, with the `data` columns ahead if provided.
+    """
+    if len(pred.shape) > 1 and pred.shape[1] > 1:
+        columns = [f'{target}_{i}' for i in range(pred.shape[1])]
+    else:
+        columns = [target]
+
+    y = pd.DataFrame(np.asarray(pred).reshape(len(pred), len(columns)), columns=columns)
+    if data is None:
+        return y
+    return pd.concat([data.reset_index(drop=True), y], axis=1)
+
+
+def load_estimator(model_file):
+    with open(model_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def predict_chunk(estimator, X, proba=False, threshold=0.5):
+    """
+    Score one chunk with the estimator in current process.
+    """
+    from hypernets.tabular.metrics import predict as metrics_predict, predict_proba as metrics_predict_proba
+
+    if proba:
+        return metrics_predict_proba(estimator, X, n_jobs=1)
+    else:
+        return metrics_predict(estimator, X, threshold=threshold, n_jobs=1)
+
+
+class StageStats:
+    """
+    Rows processed and busy time of one pipeline stage.
+    """
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.rows = 0
+        self.chunks = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, rows, seconds):
+        with self._lock:
+            self.rows += rows
+            self.chunks += 1
+            self.seconds += seconds
+
+    @property
+    def rows_per_second(self):
+        """
+        Throughput capacity of the stage: rows per busy second of all its workers.
+        """
+        return self.rows / self.seconds * self.workers if self.seconds > 0 else float('inf')
+
+    def __repr__(self):
+        return f'{self.name}: {self.rows} rows in {self.chunks} chunks, busy {self.seconds:.3f}s, ' \
+               f'{self.rows_per_second:.1f} rows/s with {self.workers} worker(s)'
+
+
+_END = object()
+
+
+class PredictPipeline:
+    """
+    Producer/consumer pipeline of three stages connected with bounded queues: one reader thread iterates data
+    chunks, a pool of scoring threads predict them and one writer thread writes results in the order of chunks.
+    So disk read, model compute and output encoding overlap with each other.
+
+    :param reader: iterable of data chunks.
+    :param scorer: callable to score one chunk, returns result with the same row number of the chunk.
+    :param writer: callable to write one result.
+    :param n_workers: int, number of scoring threads.
+    :param queue_size: int, max chunks buffered between stages.
+    """
+
+    def __init__(self, reader, scorer, writer, n_workers=1, queue_size=2):
+        self.reader = reader
+        self.scorer = scorer
+        self.writer = writer
+        self.n_workers = max(1, n_workers)
+        self.queue_size = max(1, queue_size)
+
+        self.read_stats = StageStats('read')
+        self.score_stats = StageStats('score', self.n_workers)
+        self.write_stats = StageStats('write')
+        self.seconds = 0.0
+
+    @property
+    def stats(self):
+        return [self.read_stats, self.score_stats, self.write_stats]
+
+    def run(self):
+        """
+        Run the pipeline until all chunks are written.
+
+        :return: number of rows written.
+        """
+        chunks = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        errors = []
+
+        def put(q, item):
+            while not stopped.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q):
+            while not stopped.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return _END
+
+        def guard(fn):
+            def run_stage():
+                try:
+                    fn()
+                except BaseException as e:
+                    errors.append(e)
+                    stopped.set()
+
+            return run_stage
+
+        @guard
+        def read():
+            it = iter(self.reader)
+            seq = 0
+            while not stopped.is_set():
+                start = time.time()
+                X = next(it, _END)
+                if X is _END:
+                    break
+                self.read_stats.add(len(X), time.time() - start)
+                if len(X) > 0 and put(chunks, (seq, X)):
+                    seq += 1
+            for _ in range(self.n_workers):
+                put(chunks, _END)
+
+        @guard
+        def score():
+            while True:
+                item = get(chunks)
+                if item is _END:
+                    break
+                seq, X = item
+                start = time.time()
+                result = self.scorer(X)
+                self.score_stats.add(len(X), time.time() - start)
+                put(results, (seq, result))
+            put(results, _END)
+
+        @guard
+        def write():
+            pending = {}
+            next_seq = 0
+            ended = 0
+            while ended < self.n_workers:
+                item = get(results)
+                if item is _END:
+                    if stopped.is_set():
+                        break
+                    ended += 1
+                    continue
+                seq, result = item
+                pending[seq] = result
+                while next_seq in pending:
+                    result = pending.pop(next_seq)
+                    start = time.time()
+                    self.writer(result)
+                    self.write_stats.add(len(result), time.time() - start)
+                    next_seq += 1
+
+        start = time.time()
+        threads = [threading.Thread(target=read, name='pipeline-reader', daemon=True),
+                   threading.Thread(target=write, name='pipeline-writer', daemon=True)]
+        threads += [threading.Thread(target=score, name=f'pipeline-scorer-{i}', daemon=True)
+                    for i in range(self.n_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.seconds = time.time() - start
+
+        if errors:
+            raise errors[0]
+
+        return self.write_stats.rows
+
+
+def predict_chunked(model_file, data_file, output_file, *, chunk_size=None, row_group=False, proba=False,
+                    threshold=0.5, target='y', output_with_data=None, n_jobs=1, prefetch_size=2, verbose=0):
+    """
+    Run prediction chunk by chunk with a `PredictPipeline` and append the results to output file.
+
+    :param n_jobs: int, number of threads to score chunks concurrently.
+    :param prefetch_size: int, max chunks buffered between the read, score and write stages.
+    :return: the finished `PredictPipeline`, with rows/s of each stage in its `stats`.
+    """
+    estimator = load_estimator(model_file) if isinstance(model_file, str) else model_file
+
+    def score(X):
+        pred = predict_chunk(estimator, X, proba=proba, threshold=threshold)
+        return to_output_frame(pred, target, select_output_data(X, output_with_data))
+
+    with ChunkWriter(output_file) as writer:
+        def write(df):
+            writer.write(df)
+            if verbose:
+                print(f'>>> {writer.rows} rows predicted')
+
+        pipeline = PredictPipeline(iter_chunks(data_file, chunk_size, row_group), score, write,
+                                   n_workers=n_jobs, queue_size=prefetch_size)
+        pipeline.run()
+
+    return pipeline
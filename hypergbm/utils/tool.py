@@ -1,4 +1,5 @@
 import argparse
+import glob
 import math
 import os
 import pickle
@@ -278,7 +279,7 @@ def main():
                        help=f'probability threshold to detect pos label, '
                             f'use when task="{const.TASK_BINARY}" only, default %(default)s')
         a.add_argument('--jobs', type=int, default=-1,
-                       help='job process count, default %(default)s')
+                       help='scoring thread count (up to 4 threads if not positive), default %(default)s')
 
         a.add_argument('--target', '--y', type=str, default='y',
                        help='target feature name for output, default is %(default)s')
@@ -291,6 +292,32 @@ def main():
                        action='store_const', const=['*'],
                        help='alias of "--output-with-data *"')
 
+        sg = a.add_argument_group('Chunked prediction',
+                                  'csv and parquet data are predicted chunk by chunk, with reading, scoring and '
+                                  'writing overlapped in a pipeline, one chunk per csv file or parquet row group '
+                                  'by default. Not used if dask is enabled.')
+        sg.add_argument('--chunk-size', type=int, default=None,
+                        help='max row number of each chunk to predict data chunk by chunk, '
+                             'or one chunk per csv file or parquet row group if not specified, default %(default)s')
+        sg.add_argument('--row-group', type=to_bool, default=False,
+                        help='predict parquet data chunk by chunk with its row groups, default %(default)s')
+        sg.add_argument('-row-group', '-row-group+', dest='row_group', action='store_true',
+                        help='alias of "--row-group true"')
+        sg.add_argument('--prefetch', type=int, default=2,
+                        help='max chunk number buffered to read and write ahead, default %(default)s')
+
+    def setup_serve_args(a):
+        a.add_argument('--model-file', '--model', default='model.pkl',
+                       help='the pickle file name for trained model, default %(default)s')
+        a.add_argument('--host', type=str, default='127.0.0.1',
+                       help='the host to listen, default %(default)s')
+        a.add_argument('--port', type=int, default=8060,
+                       help='the port to listen, default %(default)s')
+        a.add_argument('--max-batch-size', type=int, default=1024,
+                       help='max rows of requests coalesced into one prediction call, default %(default)s')
+        a.add_argument('--max-wait', '--max-wait-ms', type=float, default=2.0,
+                       help='max milliseconds a request waits for others to join its batch, default %(default)s')
+
     def setup_global_args(a):
         # console output
         logging_group = a.add_argument_group('Console outputs')
@@ -338,6 +365,10 @@ def main():
     setup_predict_args(sub_parsers.add_parser(
         'predict',
         description='Run prediction with given model and data.'))
+    setup_serve_args(sub_parsers.add_parser(
+        'serve',
+        description='Serve prediction of given model with a local http server, '
+                    'POST data to /predict or /predict_proba, GET /stats for latency.'))
 
     args = p.parse_args()
 
@@ -356,7 +387,7 @@ def main():
             print(f'enable dask: {client}')
 
     # exec command
-    fns = [train, evaluate, predict]
+    fns = [train, evaluate, predict, serve]
     fn = next(filter(lambda f: f.__name__ == args.command, fns))
     fn(args)
 
@@ -410,6 +441,13 @@ def evaluate(args):
 
 
 def predict(args):
+    if args.enable_dask:
+        return predict_dask(args)
+    else:
+        return predict_chunked(args)
+
+
+def predict_dask(args):
     from hypernets.utils import load_data
     from hypernets.tabular.dask_ex import DaskToolBox
     import pandas as pd
@@ -423,7 +461,7 @@ def predict(args):
 
     assert os.path.exists(model_file), f'Not found {model_file}'
     assert os.path.exists(data_file), f'Not found {data_file}'
-    assert not (args.enable_dask and args.jobs > 1)
+    assert args.jobs <= 1
 
     if args.verbose:
         print(f'>>> load data {data_file}')
@@ -479,5 +517,58 @@ def predict(args):
         print('>>> done')
 
 
+def predict_chunked(args):
+    from hypergbm.utils.streaming import predict_chunked as run_predict_chunked
+
+    assert os.path.exists(args.model_file), f'Not found {args.model_file}'
+    assert os.path.exists(args.data) or len(glob.glob(args.data, recursive=True)) > 0, f'Not found {args.data}'
+    assert not args.enable_dask, 'Chunked prediction does not support dask.'
+
+    n_jobs = args.jobs if args.jobs > 0 else min(psutil.cpu_count(), 4)
+    if args.verbose:
+        print(f'>>> predict {args.data} chunk by chunk, chunk size: {args.chunk_size}, row group: {args.row_group}, '
+              f'scoring threads: {n_jobs}')
+
+    try:
+        pipeline = run_predict_chunked(args.model_file, args.data, args.output,
+                                       chunk_size=args.chunk_size, row_group=args.row_group,
+                                       proba=args.proba, threshold=args.threshold,
+                                       target=args.target if args.target is not None else 'y',
+                                       output_with_data=args.output_with_data,
+                                       n_jobs=n_jobs, prefetch_size=args.prefetch, verbose=args.verbose)
+    except ValueError as e:
+        print(f'>>> {e}', file=sys.stderr)
+        exit(1)
+
+    rows = pipeline.write_stats.rows
+    print(f'>>> {rows} rows predicted and saved to {args.output} in {pipeline.seconds:.3f}s, '
+          f'{rows / pipeline.seconds if pipeline.seconds > 0 else 0:.1f} rows/s')
+    for stats in pipeline.stats:
+        print(f'>>>   {stats}')
+
+    if args.verbose:
+        print('>>> done')
+
+
+def serve(args):
+    from hypergbm.utils.serving import ModelServer
+
+    assert os.path.exists(args.model_file), f'Not found {args.model_file}'
+
+    if args.verbose:
+        print(f'>>> load model {args.model_file}')
+    server = ModelServer(args.model_file, host=args.host, port=args.port,
+                         max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+
+    print(f'>>> serving {args.model_file} at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'>>> {server.predictor.stats.to_dict()}')
+
+
 if __name__ == '__main__':
     main()